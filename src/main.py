@@ -1,6 +1,8 @@
 import argparse
 from src.simulation import calculation
-from src.visualization import contour_plot
+from src.simulation.utils import catalog
+from src.simulation.utils.paths import RESULTS_DIR
+from src.visualization import contour_plot, series_plot
 
 
 def main():
@@ -9,7 +11,38 @@ def main():
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # ---- run command ----
-    subparsers.add_parser("run", help="Run simulation")
+    run_parser = subparsers.add_parser("run", help="Run simulation")
+    run_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Recalculate even if an identical run exists"
+    )
+    run_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only estimate mesh size, memory, output size and wall time"
+    )
+
+    # ---- estimate command ----
+    subparsers.add_parser("estimate", help="Estimate mesh size, memory, output size and wall time")
+
+    # ---- warmup command ----
+    subparsers.add_parser("warmup", help="Compile all FEniCS form variants into the shared form cache")
+
+    # ---- optimize command ----
+    optimize_parser = subparsers.add_parser("optimize", help="Optimize the BHE field layout")
+    optimize_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Parallel screening processes (default: \"workers\" of the parameter file, 0 = all cores)"
+    )
+    optimize_parser.add_argument(
+        "--confirm",
+        type=int,
+        default=None,
+        help="Best candidates confirmed with the full engine (default: \"confirm\" of the parameter file)"
+    )
 
     # ---- plot command ----
     plot_parser = subparsers.add_parser("plot", help="Plot results")
@@ -25,10 +58,127 @@ def main():
         help="Maximum contour value (default: 40)"
     )
 
+    # ---- plot-series command ----
+    series_parser = subparsers.add_parser("plot-series", help="Plot time series (decimated)")
+    series_parser.add_argument(
+        "h5_paths",
+        type=str,
+        nargs="+",
+        help="Paths to the .h5 result files (plotted in the same axes)"
+    )
+    series_parser.add_argument(
+        "--series",
+        type=str,
+        nargs="+",
+        default=["Temp_EWS"],
+        help="Temp_EWS, W_el or names in timeseries/ (default: Temp_EWS)"
+    )
+    series_parser.add_argument(
+        "--ews",
+        type=int,
+        nargs="+",
+        default=None,
+        help="BHE indices (default: one band over all BHEs)"
+    )
+    series_parser.add_argument(
+        "--width",
+        type=int,
+        default=1200,
+        help="Number of time bins, about the plot width in pixels (default: 1200)"
+    )
+    series_parser.add_argument(
+        "--out",
+        type=str,
+        default="results/plots_svg/series.svg",
+        help="Output file (.svg or .png)"
+    )
+
+    # ---- query command ----
+    query_parser = subparsers.add_parser("query", help="Query the catalog of all runs")
+    query_parser.add_argument(
+        "where",
+        type=str,
+        nargs="?",
+        help='SQL condition, e.g. "year = 30 AND min_temp_ews > 0"'
+    )
+    query_parser.add_argument(
+        "--yearly",
+        action="store_true",
+        help="Query the yearly metrics (one row per run and year)"
+    )
+    query_parser.add_argument(
+        "--columns",
+        type=str,
+        default="key, alias, engine, scenario, min_temp_ews, max_temp_ews, w_el_total",
+        help="Selected columns"
+    )
+    query_parser.add_argument(
+        "--order",
+        type=str,
+        default=None,
+        help="ORDER BY clause"
+    )
+    query_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Enter all completed runs of the run store first"
+    )
+
+    # ---- export command ----
+    export_parser = subparsers.add_parser("export", help="Export time series to Parquet")
+    export_parser.add_argument(
+        "h5_path",
+        type=str,
+        help="Path to the .h5 result file"
+    )
+    export_parser.add_argument(
+        "output",
+        type=str,
+        help="Path of the .parquet file"
+    )
+
     args = parser.parse_args()
 
-    if args.command == "run":
-        calculation.run_calculation()
+    if args.command == "run" and args.dry_run or args.command == "estimate":
+        calculation.run_estimate()
+
+    elif args.command == "run":
+        calculation.run_calculation(force=args.force)
+
+    elif args.command == "warmup":
+        calculation.run_warmup()
+
+    elif args.command == "optimize":
+        calculation.run_optimization(workers=args.workers, confirm=args.confirm)
+
+    elif args.command == "plot-series":
+        series_plot.plot_series(
+            h5_paths=args.h5_paths,
+            series=args.series,
+            ews=args.ews,
+            width=args.width,
+            out_path=args.out
+        )
+
+    elif args.command == "query":
+        if args.rebuild:
+            catalog.rebuild(RESULTS_DIR)
+        columns = args.columns
+        if args.yearly and columns == query_parser.get_default("columns"):
+            columns = "key, alias, engine, scenario, year, min_temp_ews, mean_temp_ews, max_temp_ews, w_el"
+        db = catalog.Catalog(RESULTS_DIR)
+        try:
+            names, rows = db.query(args.where, columns, args.yearly, args.order)
+        finally:
+            db.close()
+        print("\t".join(names))
+        for row in rows:
+            print("\t".join(f"{v:.3f}" if isinstance(v, float) else str(v) for v in row))
+        print(f"{len(rows)} rows")
+
+    elif args.command == "export":
+        catalog.export_timeseries(args.h5_path, args.output)
+        print(f"Exported to {args.output}")
 
     elif args.command == "plot":
         contour_plot.plot(
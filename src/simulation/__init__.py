@@ -0,0 +1,5 @@
+from src.simulation.utils import form_cache
+
+# dijitso reads DIJITSO_CACHE_DIR when FEniCS is imported, which happens in
+# the first simulation module (mesh.py): configure the form cache before any
+FORM_CACHE = form_cache.configure()
@@ -0,0 +1,130 @@
+from os import path, remove
+
+import numpy as np
+
+from src.simulation import sparse_fem as sf
+from src.simulation.utils.paths import TEMP_DIR
+from src.simulation.utils.probes import probe_matrix
+
+# edge length of an equilateral triangle of the same area: h = sqrt(4 A / √3)
+_EQUILATERAL = 4.0 / np.sqrt(3.0)
+
+
+def error_indicator(coords, cells, T):
+    """
+    Zienkiewicz-Zhu indicator: RMS difference of the P1 gradient and its
+    area-weighted nodal recovery per triangle (K/m). T can be a block
+    (n_vertices, n_loads), the largest error of the columns is used.
+
+    Returns:
+        tuple: (indicator (n_cells,), area (n_cells,))
+    """
+    area, grad = sf.gradients(coords, cells)
+    T = np.asarray(T, dtype=float).reshape(len(coords), -1)
+
+    # cell gradients (n_cells, 2, n_loads)
+    grad_T = np.einsum("cid,cil->cdl", grad, T[cells])
+    recovered = np.zeros((len(coords),) + grad_T.shape[1:])
+    weight = np.zeros(len(coords))
+    for i in range(3):
+        np.add.at(recovered, cells[:, i], area[:, None, None] * grad_T)
+        np.add.at(weight, cells[:, i], area)
+    recovered /= weight[:, None, None]
+
+    # vertex quadrature of |G* - ∇T_h|² over the triangle
+    difference = recovered[cells] - grad_T[:, None]
+    error = np.sqrt(np.mean(np.sum(difference ** 2, axis=2), axis=1))
+    return error.max(axis=1), area
+
+
+def target_size(coords, cells, T, tolerance, size_min, size_max):
+    """
+    Element size per vertex for the next mesh. The gradient error of P1
+    scales with h, so every triangle gets h_new = h (tolerance / η):
+    refinement at the moving front, coarsening where the field is flat,
+    limited to [size_min, size_max]. Vertices take the smallest size of
+    their triangles.
+    """
+    error, area = error_indicator(coords, cells, T)
+    h = np.sqrt(_EQUILATERAL * area)
+    h_cell = np.clip(h * tolerance / np.maximum(error, 1e-12), size_min, size_max)
+
+    h_vertex = np.full(len(coords), float(size_max))
+    for i in range(3):
+        np.minimum.at(h_vertex, cells[:, i], h_cell)
+    return h_vertex
+
+
+def write_size_field(file_name, coords, cells, h_vertex):
+    """gmsh view of the vertex sizes (scalar triangles) for a PostView background field."""
+    # ST(x_0, y_0, 0, x_1, y_1, 0, x_2, y_2, 0){h_0, h_1, h_2};
+    x = coords[cells]
+    z = np.zeros((len(cells), 3, 1))
+    rows = np.hstack([np.concatenate([x, z], axis=2).reshape(-1, 9), h_vertex[cells]])
+    with open(file_name, "w") as f:
+        f.write('View "size" {\n')
+        np.savetxt(f, rows, fmt="ST(" + ",".join(["%.10g"] * 9) + "){%.6g,%.6g,%.6g};")
+        f.write("};\n")
+    return file_name
+
+
+class Adaptivity:
+    """
+    Error-driven remeshing every `interval` steps.
+
+    `system` is the current SparseSystem, `remesh` maps a gmsh size view to a
+    new mesh (coords, cells, curves) and `discretize` builds the system of a
+    mesh. The temperature is interpolated onto the new vertices, the far-field
+    Dirichlet values are restored and the stored energy is kept (the
+    correction is recorded per adaptation).
+    """
+
+    def __init__(self, settings, system, remesh, discretize, steps_per_interval, T_0,
+                 symmetry_factor=1):
+        self.tolerance = settings.tolerance.value
+        self.size_min = settings.minSize.value
+        self.size_max = settings.maxSize.value
+        self.interval = max(int(steps_per_interval), 1)
+        self.system = system
+        self.T_0 = T_0
+        self.remesh = remesh
+        self.discretize = discretize
+        self.symmetry_factor = symmetry_factor
+        self.history = []
+
+    def due(self, time_step):
+        return time_step % self.interval == 0
+
+    def adapt(self, time_step, T_state):
+        """
+        Remeshes for the state T_state (n_vertices, n_loads) and replaces the system.
+
+        Returns:
+            np.ndarray: T_state on the vertices of the new mesh.
+        """
+        system = self.system
+        h_vertex = target_size(system.coords, system.cells, T_state,
+                               self.tolerance, self.size_min, self.size_max)
+        size_field = write_size_field(path.join(TEMP_DIR, "adaptivity_size.pos"),
+                                      system.coords, system.cells, h_vertex)
+        new_system = self.discretize(*self.remesh(size_field))
+        remove(size_field)
+
+        mask = new_system.mask[:, None]
+        T_new = probe_matrix(system.coords, system.cells, new_system.coords) @ T_state
+        T_new = mask * T_new + (1.0 - mask) * new_system.offset[:, None]
+
+        # conservative transfer: the stored energy lost or gained by the
+        # interpolation is put back with the weight |T - T_0| (the plume)
+        defect = system.w_storage @ T_state - new_system.w_storage @ T_new
+        weight = mask * np.abs(T_new - self.T_0)
+        norm = new_system.w_storage @ weight
+        T_new = T_new + weight * np.divide(defect, norm, out=np.zeros_like(defect), where=norm > 0.0)
+
+        self.history.append(dict(
+            step=int(time_step), num_vertices=len(new_system.coords), num_cells=len(new_system.cells),
+            correction_kWh=(self.symmetry_factor * defect / (3600.0 * 1000.0)).tolist()))
+        print(f"Adaptivity (step {time_step}): {len(system.coords)} -> "
+              f"{len(new_system.coords)} vertices")
+        self.system = new_system
+        return T_new
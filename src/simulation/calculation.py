@@ -1,23 +1,66 @@
 import json
+import tempfile
+import time
 import traceback
-from os import makedirs, path
+from os import cpu_count, path
 
-import fenics
 import numpy as np
 from alive_progress import alive_bar
 from box import Box
 from psutil import cpu_percent, virtual_memory
-
+from scipy.sparse import csr_matrix
+
+from src.simulation import ensemble as ens
+from src.simulation import estimate as est
+from src.simulation import farfield as ff
+from src.simulation import forms as fm
+from src.simulation import harmonic as hm
+from src.simulation import linesource as ls
 from src.simulation import mesh as msh
+from src.simulation import model_setup as ms
+from src.simulation import monitoring as mon
+from src.simulation import optimize as opt
+from src.simulation import periodic as per
 from src.simulation import powerprofile as pp
-from src.simulation.utils.h5py_writer import H5Writer
+from src.simulation import sparse as sp
+from src.simulation import sparse_fem as sf
+from src.simulation import watchdog as wd
+from src.simulation.utils import form_cache
+from src.simulation.utils.catalog import Catalog
 from src.simulation.utils.paths import (PARAMETER_FILE, PARAMETER_FILE_SI,
                                         RESULTS_DIR, TEMP_DIR)
-from src.simulation.utils.tools import P_el_values, weighted_parameter
+from src.simulation.utils.probes import ews_probe_matrix, probe_matrix
+from src.simulation.utils.run_store import RunStore, run_key
+from src.simulation.utils.tools import P_el_values, effective_parameters
 from src.simulation.utils.convert_to_si import run_conversion
 
-
-def run_calculation():
+# optional modes ("enabled" blocks of the parameter file) and their compatibility
+MODES = {"periodic": "the periodic mode",
+         "ensemble": "the ensemble mode",
+         "parareal": "the parareal mode",
+         "flowSeries": "a flow series",
+         "nonlinear": "temperature-dependent ground properties",
+         "adaptivity": "adaptive remeshing",
+         "nested": "nested meshes"}
+# modes an engine rejects (the line source ignores the mesh and time-stepping modes)
+UNSUPPORTED_MODES = {"fem": ("parareal", "flowSeries", "nonlinear", "adaptivity", "nested"),
+                     "sparse": (),
+                     "harmonic": tuple(MODES),
+                     "linesource": ("flowSeries", "nonlinear")}
+EXCLUSIVE_MODES = {"ensemble": ("periodic",),
+                   "parareal": ("periodic", "ensemble", "flowSeries"),
+                   "nonlinear": ("flowSeries", "periodic", "ensemble", "parareal"),
+                   "adaptivity": ("flowSeries", "nonlinear", "periodic", "parareal"),
+                   "nested": ("flowSeries", "nonlinear", "periodic", "parareal", "adaptivity")}
+
+try:
+    import fenics
+except ImportError:
+    # FEniCS-free engines (linesource) still work without it
+    fenics = None
+
+
+def _load_parameters():
 
     # SI-conversion of parameter file
     try:
@@ -27,7 +70,7 @@ def run_calculation():
     except Exception as e:
         print(f"Fehler bei der SI-Konvertierung: {e}")
         traceback.print_exc()
-        exit(1)
+        raise
         
 
     # load JSON data
@@ -35,41 +78,233 @@ def run_calculation():
         params_si = Box(json.load(f))
     with open(PARAMETER_FILE, "r") as f:
         params = Box(json.load(f))
-
-    return _run_calculation(params, params_si)
-
-
-def _run_calculation(params: Box, params_si: Box):
+    return params, params_si
+
+
+def run_calculation(force=False, parameters=None):
+    # parameters: (params, params_si) of a derived run, e.g. of the layout optimization
+    params, params_si = _load_parameters() if parameters is None else parameters
+
+    engine = params_si.get("engine", "fem")
+    engines = {"fem": _run_calculation,
+               "sparse": sp.run_sparse,
+               "harmonic": hm.run_harmonic,
+               "linesource": ls.run_linesource}
+    if engine not in engines:
+        raise ValueError(f"Unknown engine: {engine}")
+    _validate_modes(params_si)
+
+    # content-addressed run store: identical parameters and code -> existing result
+    store = RunStore(RESULTS_DIR)
+    key = run_key(params_si)
+    cached = store.lookup(key)
+    if cached is not None and not force:
+        print(f"Identical run {key} found, using {cached}")
+        return cached
+
+    prefix = "" if engine == "fem" else f"{engine}_"
+    alias = f"{prefix}{params_si.meshMode[0]}_{params_si.meshMode[1]}_κ = {params_si.ground.thermalConductivity.value}_{params_si.time.simulationYears.value}years"
+    base_folder = store.start(key, alias, params_si)
+    print(f"Run {key} ({alias})")
+
+    start = time.perf_counter()
+    try:
+        engines[engine](params, params_si, base_folder)
+    except wd.SimulationAborted as aborted:
+        # partial result stays in the run folder, the run is not reused
+        failure_file = wd.write_failure(base_folder, aborted)
+        store.fail(key, aborted.record())
+        print(f"Run {key} aborted ({aborted.reason}): {aborted}\nFailure record: {failure_file}")
+        return None
+    runtime = time.perf_counter() - start
+    meta = store.finish(key, runtime)
+    h5_path = store.lookup(key)
+
+    # summary metrics for queries over all runs
+    catalog = Catalog(RESULTS_DIR)
+    try:
+        steps_per_year = int(round(365 * 86400.0 / params_si.time.timeStepHours.value))
+        catalog.add_run(key, meta, h5_path, steps_per_year, runtime)
+    finally:
+        catalog.close()
+    return h5_path
+
+
+def run_warmup():
+    # compile all form variants into the shared form cache
+    cache_dir, variants = fm.warmup()
+    print(f"Form cache warmed up: {cache_dir} "
+          f"({sum(len(forms) for forms in variants.values())} forms in {len(variants)} variants)")
+    return cache_dir
+
+
+def run_optimization(workers=None, confirm=None):
+    params, params_si = _load_parameters()
+    return opt.optimize(params, params_si,
+                        run=lambda p, p_si: run_calculation(parameters=(p, p_si)),
+                        results_dir=RESULTS_DIR, workers=workers, confirm=confirm)
+
+
+def run_estimate():
+    """
+    Dry run: builds the mesh and reports its size, the Péclet/Neumann
+    numbers, the memory of the factorization, the size of the result file
+    and the wall time projected from a short benchmark on the actual mesh.
+    Nothing is written to the results folder.
+    """
+    params, params_si = _load_parameters()
+    _validate_modes(params_si)
+    engine = params_si.get("engine", "fem")
+    dt = params_si.time.timeStepHours.value
+    output = params_si.get("output", {})
+    monitoring = params_si.get("monitoring", {})
+    n_monitor = sum(len(p) for _, p, _ in mon.monitoring_groups(params_si)) \
+        if monitoring.get("enabled", False) else 0
+    n_scenarios = len(params_si.ensemble.scenarios) \
+        if params_si.get("ensemble", {}).get("enabled", False) else 1
+
+    time_steps = int(params_si.time.simulationYears.value / dt)
+    steps_per_year = int(round(365 * 86400.0 / dt))
+
+    if engine == "linesource":
+        # no mesh: layout and ground parameters only
+        thermalConductivity, heatCapacityDensity, convection_value = effective_parameters(params_si)
+        diffusionCoefficient = thermalConductivity / heatCapacityDensity
+        velocity = (convection_value * params_si.groundwater.velocityX.value,
+                    convection_value * params_si.groundwater.velocityY.value) \
+            if params_si.enableConvection is True else (0.0, 0.0)
+        locations, _ = msh.generate_layout(
+            mode=tuple(params_si.meshMode),
+            x_0=params_si.mesh.xCenter.value,
+            y_0=params_si.mesh.yCenter.value,
+            distance=params_si.mesh.boreholeDistance.value
+        )
+        load = pp.create_load(params_si)
+    else:
+        # mesh and load statistics in a scratch folder, not in the TEMP_DIR of running jobs
+        with tempfile.TemporaryDirectory() as scratch:
+            model = ms.prepare_model(params_si, scratch, convert_mesh=False, mesh_dir=scratch)
+            coords, cells, _ = sf.read_mesh(model.mesh_file)
+        locations = model.locations
+    n_EWS = len(locations)
+    n_snapshots = sum(1 for year in [1, 10, 20, 30, 40] if year <= time_steps / steps_per_year)
+
+    print("\n### Estimate ###")
+    print(f"engine: {engine}, {n_EWS} BHEs, {time_steps} time steps of {dt / 3600.0:g} h"
+          + (f", {n_scenarios} scenarios" if n_scenarios > 1 else ""))
+
+    if engine == "linesource":
+        sources = np.array([(p.x(), p.y()) for p in locations])
+        seconds = est.benchmark_linesource(sources, dt, time_steps, thermalConductivity,
+                                           diffusionCoefficient, velocity, load.powers(1, time_steps))
+        wall_time = seconds * (n_EWS + n_monitor / 4.0)
+        memory = 4 * 8 * time_steps * min(n_EWS, max(1, int(5e6 // (4 * time_steps))))
+        size = est.output_size(time_steps, n_EWS, n_monitor=n_monitor,
+                               monitor_every=monitoring.get("every", 1),
+                               raw=output.get("raw", True), aggregates=output.get("aggregates", []),
+                               steps_per_year=steps_per_year)
+    else:
+        v_x, v_y = (params_si.groundwater.velocityX.value, params_si.groundwater.velocityY.value) \
+            if params_si.enableConvection is True else (0.0, 0.0)
+        h_max, peclet_number, neumann_number = est.mesh_numbers(
+            coords, cells, (v_x, v_y), model.diffusionCoefficient, dt)
+        print(f"mesh: {len(coords)} vertices (= DOFs), {len(cells)} triangles, h_max = {h_max:.2f} m"
+              + (f", domain reduced by symmetry {model.symmetry}" if model.symmetry_factor > 1 else ""))
+        if params_si.enableConvection is True:
+            print(f"peclet_number_max = {peclet_number:.2f}"
+                  + (" -> numerically unstable (> 2)" if peclet_number > 2.0 else ""))
+        print(f"Ne_max = {neumann_number:.2f}")
+
+        bench = est.benchmark_steps(coords, cells, (v_x, v_y), model.diffusionCoefficient,
+                                    model.convection_value, dt, 4 * len(model.ews_locations) + n_monitor,
+                                    n_columns=n_scenarios)
+        print(f"benchmark: factorization {bench['factor_time']:.3f} s, "
+              f"{1e3 * bench['step_time']:.2f} ms per step")
+        wall_time = bench["factor_time"] + time_steps * bench["step_time"]
+        if engine == "harmonic":
+            # steady + complex solve (about 4 real factorizations) and the decay steps
+            harmonic = params_si.get("harmonic", {})
+            nodes = hm.decay_nodes(
+                time_steps, [steps_per_year * year for year in [1, 10, 20, 30, 40]],
+                growth=harmonic.get("growth", 2.0), steps_per_size=harmonic.get("stepsPerSize", 4),
+                max_step=max(int(round(harmonic.get("maxStep", {}).get("value", 10 * 86400.0) / dt)), 1))
+            wall_time = bench["factor_time"] * (4 + len(np.unique(np.diff(nodes)))) + \
+                len(nodes) * bench["step_time"]
+        # system matrices (A, M, K, C) in CSR, LU factors, a few state vectors
+        memory = 4 * 12 * bench["nnz"] + bench["lu_bytes"] + 8 * 8 * len(coords) * n_scenarios
+        size = est.output_size(time_steps, n_EWS, model.symmetry_factor * len(coords),
+                               model.symmetry_factor * len(cells), n_snapshots, n_scenarios, n_monitor,
+                               monitoring.get("every", 1), output.get("raw", True),
+                               output.get("aggregates", []), steps_per_year)
+        print(f"factorization: {est.format_bytes(bench['lu_bytes'])} (nnz(A) = {bench['nnz']})")
+
+        parareal = params_si.get("parareal", {})
+        if engine == "sparse" and parareal.get("enabled", False):
+            # about 2-3 parareal iterations over `workers` parallel fine propagators
+            workers = int(parareal.get("workers", 0)) or cpu_count()
+            wall_time *= 2.5 / max(workers, 1)
+        if engine == "fem":
+            print("note: benchmark with the SciPy solver, the FEniCS loop adds the per-step "
+                  "assembly of point sources and energy functionals")
+
+    print(f"memory: about {est.format_bytes(memory)}")
+    print(f"result file: up to {est.format_bytes(size)} (uncompressed)")
+    print(f"projected wall time: {est.format_seconds(wall_time)}")
+
+    return dict(engine=engine, time_steps=time_steps, memory=memory, output_size=size,
+                wall_time=wall_time)
+
+
+def _validate_modes(params_si):
+    """
+    Compatibility of the engine, the enabled modes, the borehole geometry and
+    the output settings; raises ValueError before anything is meshed or written.
+    """
+    engine = params_si.get("engine", "fem")
+    enabled = [mode for mode in MODES if params_si.get(mode, {}).get("enabled", False)]
+    for mode in enabled:
+        if mode in UNSUPPORTED_MODES.get(engine, ()):
+            raise ValueError(f"the engine '{engine}' does not support {MODES[mode]}")
+        for other in EXCLUSIVE_MODES.get(mode, ()):
+            if other in enabled:
+                raise ValueError(f"{MODES[mode]} cannot be combined with {MODES[other]}")
+
+    mode = ms.borehole_mode(params_si)
+    if engine == "fem" and mode != "points":
+        raise ValueError(f"{mode} boreholes require the engine 'sparse'")
+    if mode == "resolved":
+        for name, blocked in (("useSymmetry", params_si.get("useSymmetry", False)),
+                              ("adaptive remeshing", "adaptivity" in enabled),
+                              ("nested meshes", "nested" in enabled)):
+            if blocked:
+                raise ValueError(f"{name} cannot be combined with resolved boreholes")
+    if "nested" in enabled and params_si.get("useSymmetry", False):
+        raise ValueError("nested meshes cannot be combined with useSymmetry")
+    if "nested" in enabled and params_si.get("farField", {}).get("boundary", "dirichlet") == "robin":
+        raise ValueError("nested meshes cannot be combined with the Robin far field")
+    if engine == "harmonic" and params_si.get("load", {}).get("source", "sinusoidal") != "sinusoidal":
+        raise ValueError("harmonic engine requires the sinusoidal load (load.source)")
+
+    output = params_si.get("output", {})
+    if not output.get("raw", True) and not {"yearly", "monthly"} & set(output.get("aggregates", [])):
+        # the catalog summarizes runs from the raw series or the yearly/monthly aggregates
+        raise ValueError('output.raw = false requires the "yearly" or "monthly" aggregates')
+
+
+def _run_calculation(params: Box, params_si: Box, base_folder: str):
+
+    if fenics is None:
+        raise ImportError("FEniCS is required for the engine 'fem' (use 'sparse' or 'linesource' without it)")
 
     TEMP_MESH_PATH = path.join(TEMP_DIR, "temp_mesh.xml")
     TEMP_MESH_FACET_REGION_PATH = path.join(
         TEMP_DIR, "temp_mesh_facet_region.xml")
-    folder_name = f"{params_si.meshMode[0]}_{params_si.meshMode[1]}_κ = {params_si.ground.thermalConductivity.value}_{params_si.time.simulationYears.value}years"
-    base_folder = path.join(RESULTS_DIR, folder_name)
-    makedirs(base_folder, exist_ok=True)
-
-    print(f"Starting calculation with parameters from {PARAMETER_FILE_SI}")
-
-    # TODO: Remove unused variables
-    # create powerprofile: A - B * cos(2 * pi / 365 * days)
-    powerprofile, eta, Q_out, Q_in = pp.multiple_powerprofile(
-        A=params_si.power.coefficientA.value,
-        B=params_si.power.coefficientB.value,
-        years=params.time.simulationYears.value
-    )
-
-    # create meshgrid
-    locations = msh.generate_mesh(
-        mode=tuple(params_si.meshMode),
-        x_0=params_si.mesh.xCenter.value,
-        y_0=params_si.mesh.yCenter.value,
-        distance=params_si.mesh.boreholeDistance.value
-    )
+    model = ms.prepare_model(params_si, base_folder)
 
     mesh = fenics.Mesh(TEMP_MESH_PATH)
     fd = fenics.MeshFunction('size_t', mesh, TEMP_MESH_FACET_REGION_PATH)
 
-    n_EWS = len(locations)
+    n_EWS = len(model.locations)
 
     #############################
     ### Create FEniCS objects ###
@@ -97,24 +332,28 @@ def _run_calculation(params: Box, params_si: Box):
         1
     )
 
-    # create initial conditions: T = T_0 at t = 0
-    initial_condition = fenics.Expression(
-        "T_0",
-        degree=1,
-        T_0=params_si.ground.temperature.value
-    )
-
-    T_1 = fenics.interpolate(initial_condition, V_space)
-
-    # trial and test functions:
-    T_trial = fenics.TrialFunction(V_space)
-    v_test = fenics.TestFunction(V_space)
+    # create initial conditions: T = T_0 at t = 0 (a constant needs no compiled expression)
+    T_1 = fenics.interpolate(fenics.Constant(params_si.ground.temperature.value), V_space)
 
     # temperature function:
     T = fenics.Function(V_space)
 
-    # normal vector:
-    n_vector = fenics.FacetNormal(mesh)
+    # forms with the parameters as constants: compiled once per variant (form cache)
+    forms = fm.HeatForms(
+        V_space, fd,
+        thermal_conductivity=model.thermalConductivity,
+        heat_capacity_density=model.heatCapacityDensity,
+        T_0=params_si.ground.temperature.value,
+        convection_coefficient=model.convection_value if params_si.enableConvection is True else None,
+        velocity=(params_si.groundwater.velocityX.value, params_si.groundwater.velocityY.value),
+        robin=model.robin_boundary,
+        centre=(model.x_center, model.y_center),
+        diffusion_coefficient=model.diffusionCoefficient
+    )
+    manifest = form_cache.manifest(fm.FORM_CACHE) if fm.FORM_CACHE else None
+    print(f"Form cache: {fm.FORM_CACHE or 'dijitso default'}"
+          f"{' (warm)' if manifest is not None else ' (cold, see warmup command)'}")
+    v_test = forms.v_test
 
     #########################
     ### convection on/off ###
@@ -125,215 +364,301 @@ def _run_calculation(params: Box, params_si: Box):
         max_velocity = max(params_si.groundwater.velocityX.value,
                            params_si.groundwater.velocityY.value)
 
-        if params_si.ground.porosity.value != 0.0:
-            # weighted Parameters
-            thermalConductivity, heatCapacityDensity = weighted_parameter(
-                model=params_si.ground.modelType.value,
-                ground_parameter=[
-                    params_si.ground.thermalConductivity.value,
-                    params_si.ground.heatCapacityDensity.value
-                ],
-                fluid_parameter=[
-                    params_si.groundwater.thermalConductivity.value,
-                    params_si.groundwater.density.value * params_si.groundwater.specificHeat.value
-                ],
-                porosity=params_si.ground.porosity.value
-            )
-        else:
-            thermalConductivity = params_si.ground.thermalConductivity.value
-            heatCapacityDensity = params_si.ground.heatCapacityDensity.value
-
-        # a = λ / (ρc)
-        diffusionCoefficient = thermalConductivity / heatCapacityDensity
-
-        # diffusion term: ∇T·∇v*dx
-        diffusion_term = fenics.dot(fenics.nabla_grad(
-            T_trial), fenics.nabla_grad(v_test)) * fenics.dx
-
-        # mass term: T*v*dx
-        mass_term = T_trial * v_test * fenics.dx
-
         if params_si.enableConvection is True:
-            # convection coefficient: b = n_porosity * (ρc)_groundwater / (ρc)_ground
-            convectionCoefficient = fenics.Constant(
-                params_si.ground.porosity.value * params_si.groundwater.density.value *
-                params_si.groundwater.specificHeat.value /
-                params_si.ground.heatCapacityDensity.value
-            )
-
-            # velcoity vector: v = [v_x, v_y]
-            v_vec = fenics.as_vector([
-                fenics.Constant(params_si.groundwater.velocityX.value),
-                fenics.Constant(params_si.groundwater.velocityY.value)
-            ])
-
-            # convection term: ∇·(v*T) * v_test * dx
-            convection_term = fenics.div(v_vec * T_trial) * v_test * fenics.dx
-
             # Peclet-number: Pe = v * L / a
-            peclet_number = max_velocity * max_distance / diffusionCoefficient
+            peclet_number = max_velocity * max_distance / model.diffusionCoefficient
 
             if peclet_number > 2.0:
-                raise RuntimeWarning(
-                    f"peclet_number_max = {peclet_number:.2f} \n Warning: calculation numerical unstable")
+                raise wd.SimulationAborted(
+                    "peclet", f"peclet_number_max = {peclet_number:.2f} \n Warning: calculation numerical unstable",
+                    details={"peclet_number": peclet_number})
             print(f"peclet_number_max = {peclet_number:.2f}")
 
             # assamble matrices
-            convection_matrix = fenics.assemble(convection_term)
-            diffusion_matrix = fenics.assemble(diffusion_term)
-            mass_matrix = fenics.assemble(mass_term)
+            convection_matrix = fenics.assemble(forms.convection)
+            diffusion_matrix = fenics.assemble(forms.diffusion)
+            mass_matrix = fenics.assemble(forms.mass)
 
             # A_matrix with convection
-            A_matrix = mass_matrix + params_si.time.timeStepHours.value * diffusionCoefficient * \
+            A_matrix = mass_matrix + params_si.time.timeStepHours.value * model.diffusionCoefficient * \
                 diffusion_matrix + params_si.time.timeStepHours.value * \
-                convectionCoefficient * convection_matrix
+                model.convection_value * convection_matrix
 
         else:  # convection == "off"
             # Neumann-number: Ne = a * dt / L²
-            neumann_number = diffusionCoefficient * \
+            neumann_number = model.diffusionCoefficient * \
                 params_si.time.timeStepHours.value / (max_distance**2)
             print(f"Ne_max = {neumann_number:.2f}")
 
             # A_matrix without convection
-            diffusion_matrix = fenics.assemble(diffusion_term)
-            mass_matrix = fenics.assemble(mass_term)
+            diffusion_matrix = fenics.assemble(forms.diffusion)
+            mass_matrix = fenics.assemble(forms.mass)
 
             A_matrix = mass_matrix + params_si.time.timeStepHours.value * \
-                diffusionCoefficient * diffusion_matrix
+                model.diffusionCoefficient * diffusion_matrix
 
     except ValueError as e:
         print(f"Value error: \n {e}")
         traceback.print_exc()
-        exit(1)
+        raise
 
-    except RuntimeWarning as e:
+    except wd.SimulationAborted as e:
         print(f"There is an numerical issu for this ground parameter: \n {e}")
-        traceback.print_exc()
-        exit(1)
+        raise
 
     except Exception as e:
         print(f"An unexpected exeption occured: \n {e}")
         traceback.print_exc()
-        exit(1)
+        raise
+
+    if model.robin_boundary:
+        # absorbing far-field boundary: -λ ∂T/∂n = h (T - T_0)
+        T_0 = params_si.ground.temperature.value
+        dt = params_si.time.timeStepHours.value
+        centre = np.array([model.x_center, model.y_center])
+        dof_coords = V_space.tabulate_dof_coordinates().reshape((-1, 2))
+
+        forms.h_radial.vector().set_local(ff.robin_coefficient(
+            r=np.linalg.norm(dof_coords - centre, axis=1),
+            thermal_conductivity=model.thermalConductivity,
+            diffusion_coefficient=model.diffusionCoefficient,
+            convection_velocity=model.convection_value * np.hypot(*model.velocity),
+            simulation_time=params_si.time.simulationYears.value
+        ))
+        forms.h_radial.vector().apply("insert")
+
+        robin_matrix = fenics.assemble(forms.robin_matrix)
+        robin_vector = fenics.assemble(forms.robin_vector)
+        robin_vector *= dt / model.heatCapacityDensity
+        A_matrix.axpy(dt / model.heatCapacityDensity, robin_matrix, False)
+        print(f"Far-field Robin boundary, δ = "
+              f"{ff.diffusion_length(model.diffusionCoefficient, params_si.time.simulationYears.value):.1f} m")
+    else:
+        boundary_condition.apply(A_matrix)
+
+    def apply_boundary(b):
+        if model.robin_boundary:
+            b.axpy(1.0, robin_vector)
+        else:
+            boundary_condition.apply(b)
 
-    boundary_condition.apply(A_matrix)
     solver = fenics.PETScLUSolver()
 
-    # Iteration over time steps in hours
-    time_steps = int(params_si.time.simulationYears.value /
-                     params_si.time.timeStepHours.value)
+    r_EWS = params_si.power.pipeRadius.value
+
+    # solved segments: (first step, last step, start state or None)
+    segments = [(1, model.time_steps, None)]
+    snapshot_steps = {model.steps_per_year * year: f"T_vertex_{float(year):.1f}a"
+                      for year in [1, 10, 20, 30, 40]}
+
+    ##############################
+    ### periodic steady state ###
+    ##############################
+
+    trend = None
+    periodic = params_si.get("periodic", {})
+
+    if periodic.get("enabled", False):
+
+        def advance_year(T_start):
+            # one-year map without output: T(start of year) -> T(end of year)
+            T_1.vector().set_local(T_start)
+            T_1.vector().apply("insert")
+            for step in range(1, model.steps_per_year + 1):
+                b = mass_matrix * T_1.vector()
+                for loc, weight in zip(model.ews_locations, model.ews_weights):
+                    f_Q = fenics.PointSource(
+                        V_space, loc, weight * model.load.power(step) * params_si.time.timeStepHours.value /
+                        model.heatCapacityDensity)
+                    f_Q.apply(b)
+                apply_boundary(b)
+                solver.solve(A_matrix, T.vector(), b)
+                T_1.assign(T)
+            return T_1.vector().get_local()
+
+        trend, segments, periodic_snapshots, periodic_years = per.periodic_segments(
+            periodic, advance_year, T_1.vector().get_local(), model.steps_per_year, model.time_steps)
+        if periodic_snapshots is not None:
+            snapshot_steps = periodic_snapshots
+
+    ##########################
+    ### ensemble scenarios ###
+    ##########################
+
+    scenario_names = None
+    if params_si.get("ensemble", {}).get("enabled", False):
+        scenario_names, scenario_params = ens.scenario_parameters(params_si)
+        scenario_loads = [pp.create_load(p) for p in scenario_params]
+        print(f"Ensemble with {len(scenario_names)} scenarios: {', '.join(scenario_names)}")
 
     keys = [f'COP_b{i}' for i in range(n_EWS)]
 
-    # HDF5-Writer
-    writer = H5Writer(path=f"{base_folder}/sim_{params.time.simulationYears.value}years.h5",
-                      n_EWS=n_EWS, compression="lzf", flush_every=365)
-
-    with alive_bar(time_steps, title='SubTerra is running', bar='smooth') as bar:
-        time_step = 1
-        total_flux = 0.0
-        E_probe_sum = 0.0
-
-        while time_step <= time_steps:
-            # show CPU and RAM
-            cpu = cpu_percent(interval=0.0)
-            ram = virtual_memory().percent
-            bar.text(f'(CPU: {cpu:.1f}%, RAM: {ram:.1f}%)')
-            Q_dict = powerprofile.get(time_step)
-            if not Q_dict:
-                raise ValueError(
-                    f"No powerprofile entry for time step {time_step}")
-
-            Q = Q_dict * params_si.time.timeStepHours.value / heatCapacityDensity
-
-            # RHS
-            b = mass_matrix * T_1.vector()
-            for loc in locations:
-                f_Q = fenics.PointSource(V_space, loc, Q)
-                f_Q.apply(b)
-            boundary_condition.apply(b)
-
-            # solve
-            solver.solve(A_matrix, T.vector(), b)
-
-            # flux
-            flux_boundary = fenics.assemble(-thermalConductivity *
-                                            fenics.dot(fenics.nabla_grad(T), n_vector) * fenics.ds)
-
-            # for every EWS/BHE
-            r_EWS = params_si.power.pipeRadius.value
-            Temp_EWS_row = np.empty(n_EWS, dtype=np.float32)
-            W_el_row = np.empty(n_EWS, dtype=np.float32)
-
-            for i in range(n_EWS):
-                x = locations[i].x()
-                y = locations[i].y()
-                # average
-                T_EWS = float(np.average([
-                    T(fenics.Point(x - r_EWS, y)),
-                    T(fenics.Point(x + r_EWS, y)),
-                    T(fenics.Point(x, y - r_EWS)),
-                    T(fenics.Point(x, y + r_EWS)),
-                ]))
-                Temp_EWS_row[i] = T_EWS
-
-                W_el_row[i] = P_el_values(
-                    Q=Q_dict,
-                    T=T_EWS,
-                    T_H=params_si.temperatureHot.value,
-                    delta_t=params_si.time.timeStepHours.value,
-                    gamma=params_si.power.efficiency.value
-                )
-            # conversion of energy
-            E_ground_i = fenics.assemble(heatCapacityDensity * T_1 * fenics.dx) - \
-                fenics.assemble(heatCapacityDensity * T * fenics.dx)
-            E_flux_i = - params_si.time.timeStepHours.value * flux_boundary
-            E_probe_i = params_si.time.timeStepHours.value * Q_dict * n_EWS
-
-            error_i = E_ground_i + E_flux_i + E_probe_i
-
-            # save to HDF5
-            writer.append_step(
-                day=time_step,
-                error=error_i / (3600.0 * 1000.0),
-                E_probe=E_probe_i / (3600.0 * 1000.0),
-                E_flux=E_flux_i / (3600.0 * 1000.0),
-                Delta_E=E_ground_i / (3600.0 * 1000.0),
-                E_inout=(E_ground_i + E_probe_i) / (3600.0 * 1000.0),
-                Q_probe=np.nan,          # falls du das später nutzen willst
-                E_storage=np.nan,        # solange auskommentiert
-                W_el_row=W_el_row,
-                Temp_EWS_row=Temp_EWS_row
-            )
-
-            T_1.assign(T)
-            total_flux += E_flux_i
-            E_probe_sum += E_probe_i
-
-            # create snapshots
-            if time_step in [365 * 1, 365 * 10, 365 * 20, 365 * 30, 365 * 40]:
-                t_between = time_step / 365.0
-
-                # TODO: Consider adding a parameter to choose a variant
-                # Variante A: Vertex-basierter Snapshot (empfohlen bei CG1)
-                writer.add_vertex_snapshot_full(
-                    name=f"T_vertex_{t_between:.1f}a",
-                    mesh=mesh,
-                    T=T
-                )
-
-                # ODER Variante B: DOF-basierter Snapshot (für höheren Grad)
-                # writer.add_dof_snapshot(
-                #     name=f"T_dof_{t_between:.1f}a",
-                #     V_space=V_space,
-                #     T=T,
-                #     save_mesh=mesh  # optional; weglassen, wenn Größe minimal bleiben soll
-                # )
-
-            time_step += 1
-            bar()
-
-    writer.close()
+    writer = ms.create_writer(params, params_si, base_folder, n_EWS, model.steps_per_year, scenario_names)
+
+    writer.set_metadata("boundary", "robin" if model.robin_boundary else "dirichlet")
+    writer.set_metadata("num_vertices", mesh.num_vertices())
+    writer.set_metadata("num_cells", mesh.num_cells())
+    monitor = mon.create_monitor(params_si, writer, mesh.coordinates(), mesh.cells(), model.symmetry,
+                                 fenics.vertex_to_dof_map(V_space))
+    if periodic.get("enabled", False):
+        writer.set_metadata("periodic", periodic.get("method", "extrapolation"))
+        # the file holds these years only, not the whole simulation period
+        writer.set_metadata("periodic_years", "periodic regime" if periodic_years is None
+                            else json.dumps(periodic_years))
+
+    if trend is not None:
+        # start-of-year borehole temperatures of the yearly trend
+        years = np.arange(model.time_steps // model.steps_per_year + 1)
+        Temp_EWS_start = np.empty((len(years), n_EWS), dtype=np.float32)
+        for n in years:
+            T.vector().set_local(trend.state(n))
+            T.vector().apply("insert")
+            Temp_EWS_start[n] = _ews_temperatures(
+                T, model.ews_locations, r_EWS, model.symmetry)[model.ews_mirror]
+        writer.add_periodic_trend(years, Temp_EWS_start)
+
+    if scenario_names is not None:
+        # all scenarios as a block of right-hand sides against one factorization
+        writer.set_metadata("scenarios", json.dumps(scenario_names))
+        vertex_to_dof = fenics.vertex_to_dof_map(V_space)
+        coords, cells = mesh.coordinates(), mesh.cells()
+
+        # boundary treatment of the RHS as b -> mask * b + offset
+        b_zero = fenics.Function(V_space).vector()
+        apply_boundary(b_zero)
+        b_one = fenics.interpolate(fenics.Constant(1.0), V_space).vector()
+        apply_boundary(b_one)
+        offset = b_zero.get_local()
+        mask = b_one.get_local() - offset
+
+        # point sources and BHE temperatures as sparse operators
+        source = probe_matrix(coords, cells, [(p.x(), p.y()) for p in model.ews_locations],
+                              columns=vertex_to_dof).T @ np.asarray(model.ews_weights)
+        P_ews = ews_probe_matrix(coords, cells, model.ews_locations, r_EWS,
+                                 model.symmetry, vertex_to_dof)[model.ews_mirror]
+
+        stepper = ens.EnsembleStepper(_to_scipy(A_matrix), _to_scipy(mass_matrix),
+                                      source, mask, offset)
+
+        # ∫ρc T dx and the boundary heat flow as linear functionals
+        w_storage = model.heatCapacityDensity * fenics.assemble(v_test * fenics.dx).get_local()
+        g_flux = fenics.assemble(forms.boundary_flux_functional()).get_local()
+        flux_offset = -T_0 * g_flux.sum() if model.robin_boundary else 0.0
+
+        operators = sp.StepOperators(stepper, P_ews, w_storage, g_flux, flux_offset, coords, cells,
+                                     vertex_to_dof)
+        sp.run_linear_steps(writer, params_si, model, operators, scenario_loads, T_1.vector().get_local(),
+                            segments, snapshot_steps, scenario_names, monitor)
+
+        print("Calculation finished.")
+        return
+
+    watchdog = wd.Watchdog(params_si)
+    try:
+        with alive_bar(sum(last - first + 1 for first, last, _ in segments),
+                       title='SubTerra is running', bar='smooth') as bar:
+            total_flux = 0.0
+            E_probe_sum = 0.0
+
+            for first_step, last_step, T_start in segments:
+                if T_start is not None:
+                    T_1.vector().set_local(T_start)
+                    T_1.vector().apply("insert")
+
+                for time_step in range(first_step, last_step + 1):
+                    # show CPU and RAM
+                    cpu = cpu_percent(interval=0.0)
+                    ram = virtual_memory().percent
+                    bar.text(f'(CPU: {cpu:.1f}%, RAM: {ram:.1f}%)')
+                    Q_step = model.load.power(time_step)
+                    Q = Q_step * params_si.time.timeStepHours.value / model.heatCapacityDensity
+
+                    # RHS
+                    b = mass_matrix * T_1.vector()
+                    for loc, weight in zip(model.ews_locations, model.ews_weights):
+                        f_Q = fenics.PointSource(V_space, loc, weight * Q)
+                        f_Q.apply(b)
+                    apply_boundary(b)
+
+                    # solve
+                    solver.solve(A_matrix, T.vector(), b)
+
+                    if monitor is not None:
+                        monitor.record(time_step, time_step * params_si.time.timeStepHours.value / 86400.0,
+                                       T.vector().get_local())
+
+                    # flux
+                    flux_boundary = fenics.assemble(forms.boundary_flux(T))
+
+                    # for every EWS/BHE
+                    Temp_EWS_row = _ews_temperatures(
+                        T, model.ews_locations, r_EWS, model.symmetry)[model.ews_mirror]
+                    W_el_row = np.empty(n_EWS, dtype=np.float32)
+
+                    for i in range(n_EWS):
+                        W_el_row[i] = P_el_values(
+                            Q=Q_step * model.load_shares[i],
+                            T=Temp_EWS_row[i],
+                            T_H=params_si.temperatureHot.value,
+                            delta_t=params_si.time.timeStepHours.value,
+                            gamma=params_si.power.efficiency.value
+                        )
+                    # conversion of energy (reduced domain scaled to the full field)
+                    E_ground_i = model.symmetry_factor * (
+                        fenics.assemble(forms.storage(T_1)) -
+                        fenics.assemble(forms.storage(T)))
+                    E_flux_i = - params_si.time.timeStepHours.value * \
+                        model.symmetry_factor * flux_boundary
+                    E_probe_i = params_si.time.timeStepHours.value * Q_step * n_EWS
+
+                    error_i = E_ground_i + E_flux_i + E_probe_i
+
+                    # save to HDF5
+                    writer.append_step(
+                        day=time_step * params_si.time.timeStepHours.value / 86400.0,
+                        error=error_i / (3600.0 * 1000.0),
+                        E_probe=E_probe_i / (3600.0 * 1000.0),
+                        E_flux=E_flux_i / (3600.0 * 1000.0),
+                        Delta_E=E_ground_i / (3600.0 * 1000.0),
+                        E_inout=(E_ground_i + E_probe_i) / (3600.0 * 1000.0),
+                        Q_probe=np.nan,          # falls du das später nutzen willst
+                        E_storage=np.nan,        # solange auskommentiert
+                        W_el_row=W_el_row,
+                        Temp_EWS_row=Temp_EWS_row
+                    )
+
+                    watchdog.check(time_step, T=T.vector().get_local(), Temp_EWS=Temp_EWS_row,
+                                   error=error_i,
+                                   reference=abs(E_probe_i) + abs(E_flux_i) + abs(E_ground_i))
+
+                    T_1.assign(T)
+                    total_flux += E_flux_i
+                    E_probe_sum += E_probe_i
+
+                    # create snapshots
+                    if time_step in snapshot_steps:
+
+                        # TODO: Consider adding a parameter to choose a variant
+                        # Variante A: Vertex-basierter Snapshot (empfohlen bei CG1)
+                        writer.add_vertex_snapshot_full(
+                            name=snapshot_steps[time_step],
+                            mesh=mesh,
+                            T=T,
+                            symmetry=model.symmetry
+                        )
+
+                        # ODER Variante B: DOF-basierter Snapshot (für höheren Grad)
+                        # writer.add_dof_snapshot(
+                        #     name=snapshot_steps[time_step].replace("vertex", "dof"),
+                        #     V_space=V_space,
+                        #     T=T,
+                        #     save_mesh=mesh  # optional; weglassen, wenn Größe minimal bleiben soll
+                        # )
+
+                    bar()
+    finally:
+        # always flush pending results, also if the solver fails
+        writer.close()
 
     # import matplotlib.pyplot as plt
 
@@ -342,3 +667,31 @@ def _run_calculation(params: Box, params_si: Box):
     # plt.close()
 
     print("Calculation finished.")
+
+
+def _to_scipy(matrix):
+    # serial PETSc matrix -> scipy CSR
+    indptr, indices, data = fenics.as_backend_type(matrix).mat().getValuesCSR()
+    return csr_matrix((data, indices, indptr), shape=(matrix.size(0), matrix.size(1)))
+
+
+def _ews_temperatures(T, locations, r_EWS, symmetry=(False, False)):
+    # average of four points on the borehole radius
+    x_symmetric, y_symmetric = symmetry
+
+    def probe(x, y):
+        # points outside the reduced domain are mirrored back into it
+        return T(fenics.Point(abs(x) if x_symmetric else x,
+                              abs(y) if y_symmetric else y))
+
+    Temp_EWS_row = np.empty(len(locations), dtype=np.float32)
+    for i, loc in enumerate(locations):
+        x = loc.x()
+        y = loc.y()
+        Temp_EWS_row[i] = float(np.average([
+            probe(x - r_EWS, y),
+            probe(x + r_EWS, y),
+            probe(x, y - r_EWS),
+            probe(x, y + r_EWS),
+        ]))
+    return Temp_EWS_row
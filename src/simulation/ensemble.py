@@ -0,0 +1,58 @@
+from copy import deepcopy
+
+import numpy as np
+from box import Box
+from scipy.sparse.linalg import splu
+
+
+def scenario_parameters(params_si):
+    """
+    Parameter sets of the ensemble scenarios.
+
+    Every entry of `ensemble.scenarios` overrides keys of the `power` and
+    `load` blocks, e.g. {"name": "low", "power": {"coefficientB": {...}}}.
+
+    Returns:
+        tuple: (list of scenario names, list of parameter sets).
+    """
+    scenarios = params_si.get("ensemble", {}).get("scenarios", [])
+    if not scenarios:
+        raise ValueError("ensemble.scenarios must contain at least one scenario")
+
+    names, parameter_sets = [], []
+    for k, scenario in enumerate(scenarios):
+        params_k = Box(deepcopy(params_si.to_dict()))
+        for block in ("power", "load"):
+            params_k.setdefault(block, {}).update(scenario.get(block, {}))
+        names.append(scenario.get("name", f"scenario_{k}"))
+        parameter_sets.append(params_k)
+    return names, parameter_sets
+
+
+class EnsembleStepper:
+    """
+    Implicit Euler step for K scenarios as a block of right-hand sides against
+    one LU factorization:
+
+        A T^{n+1} = mask * (M T^n + s Q^n) + offset
+
+    with the point source vector s and the boundary treatment written as
+    mask (rows kept) and offset (Dirichlet values or Robin vector).
+    """
+
+    def __init__(self, A, M, source, mask, offset):
+        self.lu = splu(A.tocsc())
+        self.M = M.tocsr()
+        self.source = np.asarray(source, dtype=float)
+        self.mask = np.asarray(mask, dtype=float)
+        self.offset = np.asarray(offset, dtype=float)
+
+    def step(self, T_1, Q):
+        """
+        Args:
+            T_1 (np.ndarray): previous states, shape (n_dofs, K).
+            Q (np.ndarray): source strength per scenario, shape (K,).
+        """
+        b = self.M @ T_1 + np.outer(self.source, Q)
+        b = self.mask[:, None] * b + self.offset[:, None]
+        return self.lu.solve(b)
@@ -0,0 +1,108 @@
+import time
+
+import numpy as np
+from scipy.signal import fftconvolve
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import splu
+
+from src.simulation import linesource as ls
+from src.simulation import sparse_fem as sf
+from src.simulation.utils.h5py_writer import ENERGY_SERIES, TIMESERIES
+
+
+def format_bytes(n_bytes):
+    for unit in ("B", "kB", "MB", "GB"):
+        if abs(n_bytes) < 1024.0:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024.0
+    return f"{n_bytes:.1f} TB"
+
+
+def format_seconds(seconds):
+    if seconds < 120.0:
+        return f"{seconds:.1f} s"
+    if seconds < 7200.0:
+        return f"{seconds / 60.0:.1f} min"
+    return f"{seconds / 3600.0:.1f} h"
+
+
+def mesh_numbers(coords, cells, velocity, diffusion_coefficient, time_step):
+    """
+    Longest edge (mesh.hmax()), Péclet number max(v) h / a and Neumann
+    number a Δt / h² as checked by the FEM engines.
+    """
+    h_max = max(np.linalg.norm(coords[cells[:, i]] - coords[cells[:, j]], axis=1).max()
+                for i, j in [(0, 1), (1, 2), (2, 0)])
+    return h_max, max(velocity) * h_max / diffusion_coefficient, \
+        diffusion_coefficient * time_step / h_max**2
+
+
+def benchmark_steps(coords, cells, velocity, diffusion_coefficient, convection_value, time_step,
+                    n_probes, n_columns=1, n_steps=20):
+    """
+    Calibration on the actual mesh: LU factorization of A = M + Δt (a K + b C)
+    and `n_steps` implicit Euler steps with `n_columns` right-hand sides and
+    the per-step probe/functional evaluations.
+
+    Returns:
+        dict: factorization time, time per step, nnz(A) and the bytes of the
+              LU factors (values + indices).
+    """
+    M, K, C = sf.assemble(coords, cells, velocity)
+    A = (M + time_step * diffusion_coefficient * K + time_step * convection_value * C).tocsc()
+
+    start = time.perf_counter()
+    lu = splu(A)
+    factor_time = time.perf_counter() - start
+
+    n = len(coords)
+    rng = np.random.default_rng(0)
+    P = csr_matrix((np.full(n_probes, 1.0), (np.arange(n_probes), rng.integers(0, n, n_probes))),
+                   shape=(n_probes, n))
+    w = np.ones(n)
+    T = np.full((n, n_columns), 283.15)
+
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        T_next = lu.solve(M @ T)
+        _ = P @ T_next, w @ (T - T_next)
+        T = T_next
+    step_time = (time.perf_counter() - start) / n_steps
+
+    return dict(factor_time=factor_time, step_time=step_time, nnz=A.nnz,
+                lu_bytes=12 * (lu.L.nnz + lu.U.nnz))
+
+
+def benchmark_linesource(sources, time_step, time_steps, thermal_conductivity,
+                         diffusion_coefficient, velocity, Q):
+    """Time of the line-source responses and convolution for four points (one BHE)."""
+    start = time.perf_counter()
+    points = sources[:1] + np.array([(1.0, 0.0), (-1.0, 0.0), (0.0, 1.0), (0.0, -1.0)]) * 0.1
+    h = ls.step_responses(points, sources, time_step, time_steps, thermal_conductivity,
+                          diffusion_coefficient, velocity)
+    fftconvolve(h, Q[None, :], axes=1)
+    return time.perf_counter() - start
+
+
+def output_size(time_steps, n_EWS, n_vertices=0, n_cells=0, n_snapshots=0, n_scenarios=1,
+                n_monitor=0, monitor_every=1, raw=True, aggregates=(), steps_per_year=365):
+    """
+    Uncompressed size of the result file in bytes (upper bound, lzf usually
+    saves a part of it).
+    """
+    size = 0
+    if raw:
+        # time series (f4, days f8) and per-BHE W_el/Temp_EWS (f4)
+        size += time_steps * (8 + 4 * n_scenarios * (len(TIMESERIES) - 1))
+        size += time_steps * 2 * 4 * n_scenarios * n_EWS
+
+    periods = {"daily": time_steps * 365 / steps_per_year, "monthly": time_steps * 12 / steps_per_year,
+               "yearly": time_steps / steps_per_year}
+    for period in aggregates:
+        rows = np.ceil(periods[period])
+        size += rows * (20 + n_scenarios * (2 * 4 * 4 * n_EWS + 8 * len(ENERGY_SERIES)))
+
+    # snapshots: coords (f8), cells (i8), values (f4)
+    size += n_snapshots * n_scenarios * (n_vertices * (2 * 8 + 4) + n_cells * 3 * 8)
+    size += (time_steps // max(monitor_every, 1)) * (8 + 4 * n_scenarios * n_monitor)
+    return size
@@ -0,0 +1,60 @@
+import numpy as np
+from scipy.special import k0e, k1e
+
+
+def diffusion_length(diffusion_coefficient, time):
+    """Thermal diffusion length δ = sqrt(a * t) in m."""
+    return float(np.sqrt(diffusion_coefficient * time))
+
+
+def auto_domain(field_radius, diffusion_coefficient, convection_coefficient,
+                velocity, simulation_time, size_factor):
+    """
+    Sizes the computational domain from the diffusion length and the
+    groundwater drift over the simulation time.
+
+    The field keeps a margin of `field_radius + size_factor * δ` on every side,
+    the domain is extended downstream by the thermal drift b * |v| * t.
+
+    Returns:
+        tuple: (x_length, y_length, x_center, y_center) with the domain centred
+               at the origin and the field centre at (x_center, y_center).
+    """
+    margin = field_radius + size_factor * \
+        diffusion_length(diffusion_coefficient, simulation_time)
+
+    lengths, centers = [], []
+    for v in velocity:
+        drift = convection_coefficient * abs(v) * simulation_time
+        lengths.append(2.0 * margin + drift)
+        centers.append(float(-np.sign(v) * drift / 2.0) + 0.0)
+
+    print(f"Auto domain: {lengths[0]:.1f} m x {lengths[1]:.1f} m, "
+          f"field centre at ({centers[0]:.1f}, {centers[1]:.1f}) m")
+    return lengths[0], lengths[1], centers[0], centers[1]
+
+
+def robin_coefficient(r, thermal_conductivity, diffusion_coefficient,
+                      convection_velocity, simulation_time):
+    """
+    Radial part of the far-field Robin coefficient h in W/m²/K.
+
+    Matched to the decaying exterior solution of the (moving) line source
+    T - T_0 ∝ exp(U·x / 2a) K_0(k r), k² = |U|² / 4a² + 1 / (a t):
+
+        -λ ∂T/∂n = h (T - T_0),
+        h = λ k K_1(k r) / K_0(k r) (r̂·n) - λ (U·n) / 2a
+
+    Only the first factor λ k K_1 / K_0 depends on r and is returned here,
+    (r̂·n) and the advective part are added in the boundary form.
+
+    Args:
+        r (np.ndarray): distance from the field centre in m.
+        convection_velocity (float): |U| = b * |v| in m/s.
+    """
+    k = np.sqrt((convection_velocity / (2.0 * diffusion_coefficient))**2 +
+                1.0 / (diffusion_coefficient * simulation_time))
+    kr = k * np.maximum(np.asarray(r, dtype=float), 1e-12)
+
+    # exponentially scaled Bessel functions: the ratio stays finite for large k r
+    return thermal_conductivity * k * k1e(kr) / k0e(kr)
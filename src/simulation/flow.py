@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from os import path
+
+import numpy as np
+
+from src.simulation.powerprofile import YEAR, TimeSeriesLoad
+from src.simulation.utils.convert_to_si import convert_value_unit
+from src.simulation.utils.paths import BASE_DIR
+
+
+class SeasonalVelocity:
+    """
+    Built-in seasonal flow v(t) = v_0 (1 + amplitude cos(2π (t - phase) / t_year)),
+    evaluated at the end of every time step like the sinusoidal load.
+    """
+
+    def __init__(self, velocity, amplitude, phase, time_step):
+        self.velocity = np.asarray(velocity, dtype=float)
+        self.amplitude = amplitude
+        self.phase = phase
+        self.time_step = time_step
+
+    def at(self, step):
+        t = step * self.time_step
+        return self.velocity * (1.0 + self.amplitude * np.cos(2 * np.pi * (t - self.phase) / YEAR))
+
+
+class VelocitySeriesFile:
+    """
+    Velocity series (CSV/HDF5 columns for v_x and v_y), streamed and averaged
+    over every time step with the resampling of the load series.
+    """
+
+    def __init__(self, file_name, time_step, file_format="csv", time_column="time",
+                 columns=("velocityX", "velocityY"), time_unit="day", velocity_unit="m/s",
+                 repeat=False):
+        scale, _ = convert_value_unit(1.0, velocity_unit)
+        self.components = [TimeSeriesLoad(file_name, time_step, file_format=file_format,
+                                          time_column=time_column, power_column=column,
+                                          time_unit=time_unit, repeat=repeat, scale=scale)
+                           for column in columns]
+
+    def at(self, step):
+        return np.array([component.power(step) for component in self.components])
+
+
+def create_velocity_series(params_si, base_dir=BASE_DIR):
+    """Velocity series of the "flowSeries" block, None for constant flow."""
+    flow = params_si.get("flowSeries", {})
+    if not flow.get("enabled", False) or params_si.enableConvection is not True:
+        return None
+
+    time_step = params_si.time.timeStepHours.value
+    source = flow.get("source", "seasonal")
+    if source == "seasonal":
+        return SeasonalVelocity(
+            velocity=(params_si.groundwater.velocityX.value, params_si.groundwater.velocityY.value),
+            amplitude=flow.get("amplitude", 0.5),
+            phase=flow.get("phase", {}).get("value", 0.0),
+            time_step=time_step
+        )
+    if source in ("csv", "hdf5"):
+        return VelocitySeriesFile(
+            file_name=path.join(base_dir, flow.path),
+            time_step=time_step,
+            file_format=source,
+            time_column=flow.get("timeColumn", "time"),
+            columns=(flow.get("velocityXColumn", "velocityX"), flow.get("velocityYColumn", "velocityY")),
+            time_unit=flow.get("timeUnit", "day"),
+            velocity_unit=flow.get("velocityUnit", "m/s"),
+            repeat=flow.get("repeat", False)
+        )
+    raise ValueError(f"Unknown flow series source: {source}")
+
+
+class FlowStates:
+    """
+    Linear systems for a time-varying velocity.
+
+    The velocity of a step is snapped to a grid of width `tolerance`; the
+    system is only switched when the velocity leaves the tolerance band of
+    the current state. Systems of recurring states (e.g. seasonal pumping)
+    are kept in an LRU cache of `cache_size` factorizations.
+
+    Args:
+        build (callable): velocity (v_x, v_y) -> (stepper, g_flux, flux_offset).
+        series: object with at(step) -> (v_x, v_y) in m/s.
+    """
+
+    def __init__(self, build, series, tolerance, cache_size=8):
+        self.build = build
+        self.series = series
+        self.tolerance = tolerance
+        self.cache_size = max(int(cache_size), 1)
+        self.cache = OrderedDict()
+        self.velocity = None
+        self.system = None
+        self.n_switches = 0
+        self.n_factorizations = 0
+
+    def _key(self, velocity):
+        if self.tolerance <= 0.0:
+            return tuple(velocity)
+        return tuple(np.round(velocity / self.tolerance).astype(np.int64))
+
+    def at(self, step):
+        """(stepper, g_flux, flux_offset) of the velocity state of the step."""
+        velocity = np.asarray(self.series.at(step), dtype=float)
+        if self.velocity is not None and np.max(np.abs(velocity - self.velocity)) <= self.tolerance:
+            return self.system
+
+        key = self._key(velocity)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        else:
+            state = np.asarray(key, dtype=float) * self.tolerance if self.tolerance > 0.0 else velocity
+            self.cache[key] = (state, self.build(tuple(state)))
+            self.n_factorizations += 1
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        self.velocity, self.system = self.cache[key]
+        self.n_switches += 1
+        return self.system
@@ -0,0 +1,152 @@
+import itertools
+import time
+
+from src.simulation import FORM_CACHE
+from src.simulation.utils import form_cache
+
+try:
+    import fenics
+except ImportError:
+    fenics = None
+
+
+class HeatForms:
+    """
+    UFL forms of the FEM engine.
+
+    Material values, velocity, centre and T_0 enter as fenics.Constant, so
+    the generated code only depends on the variant (convection on/off,
+    Dirichlet or Robin far field), not on the parameter values: all
+    conductivity models and parameter sets reuse the compiled forms of their
+    variant from the form cache.
+    """
+
+    def __init__(self, V_space, fd, thermal_conductivity, heat_capacity_density, T_0,
+                 convection_coefficient=None, velocity=(0.0, 0.0), robin=False,
+                 centre=(0.0, 0.0), diffusion_coefficient=1.0):
+        mesh = V_space.mesh()
+
+        # trial and test functions:
+        self.T_trial = fenics.TrialFunction(V_space)
+        self.v_test = fenics.TestFunction(V_space)
+
+        # normal vector:
+        self.n_vector = fenics.FacetNormal(mesh)
+
+        # outer boundary (without symmetry lines)
+        self.ds_far = fenics.Measure("ds", domain=mesh, subdomain_data=fd)(1)
+
+        self.thermal_conductivity = fenics.Constant(thermal_conductivity)
+        self.heat_capacity_density = fenics.Constant(heat_capacity_density)
+        self.T_0 = fenics.Constant(T_0)
+
+        # diffusion term: ∇T·∇v*dx
+        self.diffusion = fenics.dot(fenics.nabla_grad(self.T_trial),
+                                    fenics.nabla_grad(self.v_test)) * fenics.dx
+
+        # mass term: T*v*dx
+        self.mass = self.T_trial * self.v_test * fenics.dx
+
+        self.convection = None
+        self.advection_n = 0
+        if convection_coefficient is not None:
+            # convection coefficient: b = n_porosity * (ρc)_groundwater / (ρc)_ground
+            self.convection_coefficient = fenics.Constant(convection_coefficient)
+
+            # velcoity vector: v = [v_x, v_y]
+            self.v_vec = fenics.as_vector([fenics.Constant(velocity[0]),
+                                           fenics.Constant(velocity[1])])
+
+            # convection term: ∇·(v*T) * v_test * dx
+            self.convection = fenics.div(self.v_vec * self.T_trial) * self.v_test * fenics.dx
+
+        self.h_radial = None
+        self.robin_matrix = None
+        self.robin_vector = None
+        if robin:
+            # absorbing far-field boundary: -λ ∂T/∂n = h (T - T_0); the radial
+            # coefficient h(r) is set by the caller
+            self.h_radial = fenics.Function(V_space)
+            r_vec = fenics.SpatialCoordinate(mesh) - fenics.Constant(centre)
+            self.h_robin = self.h_radial * fenics.dot(r_vec, self.n_vector) / \
+                fenics.sqrt(fenics.dot(r_vec, r_vec))
+
+            # outward advective heat flow: (ρc) b (T - T_0) v·n
+            if self.convection is not None:
+                self.advection_n = self.convection_coefficient * fenics.dot(self.v_vec, self.n_vector)
+                self.h_robin = self.h_robin - self.thermal_conductivity * \
+                    self.advection_n / (2 * fenics.Constant(diffusion_coefficient))
+
+            self.robin_matrix = self.h_robin * self.T_trial * self.v_test * self.ds_far
+            self.robin_vector = self.h_robin * self.T_0 * self.v_test * self.ds_far
+
+    def storage(self, T):
+        # heat content ∫ρc T dx
+        return self.heat_capacity_density * T * fenics.dx
+
+    def boundary_flux(self, T):
+        # heat flow over the far-field boundary
+        if self.h_radial is not None:
+            return (self.h_robin + self.heat_capacity_density * self.advection_n) * \
+                (T - self.T_0) * self.ds_far
+        # far field only, the symmetry lines are adiabatic
+        return -self.thermal_conductivity * fenics.dot(fenics.nabla_grad(T), self.n_vector) * self.ds_far
+
+    def boundary_flux_functional(self):
+        # boundary heat flow as a linear functional of the nodal temperatures
+        if self.h_radial is not None:
+            return (self.h_robin + self.heat_capacity_density * self.advection_n) * \
+                self.v_test * self.ds_far
+        return -self.thermal_conductivity * \
+            fenics.dot(fenics.nabla_grad(self.v_test), self.n_vector) * self.ds_far
+
+    def all_forms(self, T):
+        """All forms the engine assembles for this variant, by name."""
+        forms = {"diffusion": self.diffusion, "mass": self.mass,
+                 "storage": self.storage(T), "volume": self.v_test * fenics.dx,
+                 "boundary_flux": self.boundary_flux(T),
+                 "boundary_flux_functional": self.boundary_flux_functional()}
+        if self.convection is not None:
+            forms["convection"] = self.convection
+        if self.h_radial is not None:
+            forms["robin_matrix"] = self.robin_matrix
+            forms["robin_vector"] = self.robin_vector
+        return forms
+
+
+def warmup():
+    """
+    Compiles every form variant of the FEM engine (convection on/off x
+    Dirichlet/Robin far field) on a small mesh into the form cache and
+    writes its manifest.
+
+    Returns:
+        tuple: (cache directory, {variant: {form: UFL signature}})
+    """
+    if fenics is None:
+        raise ImportError("FEniCS is required for the form warmup")
+    if FORM_CACHE is None:
+        raise OSError(f"Form cache {form_cache.cache_dir()} is not writable")
+
+    mesh = fenics.UnitSquareMesh(2, 2)
+    fd = fenics.MeshFunction("size_t", mesh, mesh.topology().dim() - 1, 0)
+    fenics.AutoSubDomain(lambda x, on_boundary: on_boundary).mark(fd, 1)
+    V_space = fenics.FunctionSpace(mesh, "Lagrange", 1)
+    T = fenics.Function(V_space)
+
+    start = time.perf_counter()
+    variants = {}
+    for convection, robin in itertools.product((False, True), (False, True)):
+        name = f"{'convection' if convection else 'conduction'}_{'robin' if robin else 'dirichlet'}"
+        forms = HeatForms(V_space, fd, 1.0, 1.0, 0.0,
+                          convection_coefficient=1.0 if convection else None,
+                          velocity=(1.0, 0.0), robin=robin, centre=(0.5, 0.5))
+        variants[name] = {}
+        for form_name, form in forms.all_forms(T).items():
+            fenics.assemble(form)
+            variants[name][form_name] = form.signature()
+        print(f"{name}: {len(variants[name])} forms")
+    runtime = time.perf_counter() - start
+
+    form_cache.write_manifest(FORM_CACHE, variants, runtime)
+    return FORM_CACHE, variants
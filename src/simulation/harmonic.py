@@ -0,0 +1,216 @@
+import json
+from os import remove
+
+import numpy as np
+from box import Box
+from scipy.sparse import csr_matrix, diags
+from scipy.sparse.linalg import splu
+
+from src.simulation import monitoring as mon
+from src.simulation import powerprofile as pp
+from src.simulation import sparse_fem as sf
+from src.simulation import watchdog as wd
+from src.simulation.model_setup import borehole_mode, create_writer, prepare_model
+from src.simulation.sparse import sparse_system
+from src.simulation.utils.tools import P_el_array
+
+
+def periodic_response(A, M, source, mask, omega, time_step):
+    """
+    Periodic regime of the implicit Euler system in deviations u = T - T_0,
+
+        A u^n = mask (M u^{n-1} + s q^n),   q^n = q_0 + q_1 Re(e^{iωnΔt}),
+
+    for unit load terms: the steady response u_0 and the complex annual
+    response u_1,
+
+        (A - mask M) u_0 = mask s,    (A - e^{-iωΔt} mask M) u_1 = mask s,
+
+    so u^n = q_0 u_0 + q_1 Re(u_1 e^{iωnΔt}) is the exact periodic solution
+    of the time-stepped model (one real and one complex solve).
+
+    Returns:
+        tuple: (u_0 (n_dofs,), u_1 (n_dofs,) complex)
+    """
+    masked_M = diags(np.asarray(mask, dtype=float)) @ M
+    b = np.asarray(mask, dtype=float) * np.asarray(source, dtype=float)
+    u_0 = splu((A - masked_M).tocsc()).solve(b)
+    u_1 = splu((A - np.exp(-1j * omega * time_step) * masked_M).tocsc()).solve(b.astype(complex))
+    return u_0, u_1
+
+
+def decay_nodes(time_steps, fixed_steps=(), growth=2.0, steps_per_size=4, max_step=30):
+    """
+    Time steps of the transient correction: `steps_per_size` steps of every
+    size, the size growing by `growth` from one model step to `max_step`
+    steps (few distinct sizes, so few factorizations). Every fixed step
+    (snapshots) is a node.
+
+    Returns:
+        np.ndarray: 0 = n_0 < n_1 < ... < n_m = time_steps
+    """
+    fixed = sorted(int(s) for s in fixed_steps if 0 < s <= time_steps)
+    nodes, size = [0], 1.0
+    while nodes[-1] < time_steps:
+        for _ in range(max(int(steps_per_size), 1)):
+            following = next((s for s in fixed if s > nodes[-1]), time_steps)
+            nodes.append(min(nodes[-1] + int(round(size)), following))
+            if nodes[-1] == time_steps:
+                break
+        size = min(size * growth, max_step)
+    return np.array(nodes)
+
+
+def decay(r_0, nodes, linear_system, M, evaluate, keep=()):
+    """
+    Decay of the transient r^n = u^n - u_p^n: homogeneous implicit Euler
+    steps A_k r^{m+1} = mask M r^m over the node spacings k, one
+    factorization per step size (`linear_system(k)` -> (A_k, mask)).
+
+    Args:
+        evaluate (callable): r -> 1-d array of functionals (BHE probes, energy, ...)
+        keep (iterable): nodes whose full states are returned (snapshots).
+
+    Returns:
+        tuple: (functionals at the nodes (n_nodes, n_values), {node: r}, number of factorizations)
+    """
+    systems = {}
+    r = np.asarray(r_0, dtype=float)
+    values = [evaluate(r)]
+    states = {0: r} if 0 in keep else {}
+    for first, last in zip(nodes[:-1], nodes[1:]):
+        k = int(last - first)
+        if k not in systems:
+            A_k, mask_k = linear_system(k)
+            systems[k] = (splu(A_k.tocsc()), np.asarray(mask_k, dtype=float))
+        lu, mask_k = systems[k]
+        r = lu.solve(mask_k * (M @ r))
+        values.append(evaluate(r))
+        if last in keep:
+            states[int(last)] = r
+    return np.array(values), states, len(systems)
+
+
+def interpolate(steps, nodes, values):
+    """Linear interpolation of node values (n_nodes, n_values) to the steps."""
+    steps = np.asarray(steps, dtype=float)
+    i = np.clip(np.searchsorted(nodes, steps, side="right") - 1, 0, len(nodes) - 2)
+    weight = (steps - nodes[i]) / (nodes[i + 1] - nodes[i])
+    return (1.0 - weight)[:, None] * values[i] + weight[:, None] * values[i + 1]
+
+
+def run_harmonic(params: Box, params_si: Box, base_folder: str):
+    """
+    Frequency-domain variant of the sparse engine for the sinusoidal load
+    q = A - B cos(ωt): the periodic regime comes from one steady and one
+    complex solve at the annual frequency, the start-up from the decay of
+    the difference to the periodic regime (homogeneous implicit Euler steps
+    of geometrically growing size, linearly interpolated in between).
+    """
+    model = prepare_model(params_si, base_folder, convert_mesh=False)
+
+    coords, cells, curves = sf.read_mesh_curves(model.mesh_file)
+    remove(model.mesh_file)
+    system = sparse_system(params_si, model, coords, cells, curves)
+    n_EWS = len(model.locations)
+    dt = params_si.time.timeStepHours.value
+    T_0 = params_si.ground.temperature.value
+    settings = params_si.get("harmonic", {})
+
+    # deviations u = T - T_0 (T_0 solves the homogeneous system), unit load terms
+    omega = 2 * np.pi / pp.YEAR
+    c = dt / model.heatCapacityDensity
+    u_0, u_1 = periodic_response(system.A_matrix, system.mass_matrix, system.source,
+                                    system.mask, omega, dt)
+
+    def periodic(steps, operator_0, operator_1):
+        # periodic regime c (A u_0 - B Re(u_1 e^{iωnΔt})) of precomputed functionals
+        phase = np.exp(1j * omega * dt * np.asarray(steps))
+        return c * (model.load.A * operator_0[None, :] - model.load.B * np.real(np.outer(phase, operator_1)))
+
+    writer = create_writer(params, params_si, base_folder, n_EWS, model.steps_per_year)
+    monitor = mon.create_monitor(params_si, writer, coords, cells, model.symmetry)
+    P_monitor = csr_matrix((0, len(coords))) if monitor is None else monitor.operator
+    functionals = [system.P_ews, csr_matrix(system.w_storage[None, :]),
+                   csr_matrix(system.g_flux[None, :]), P_monitor]
+    sizes = np.cumsum([0] + [f.shape[0] for f in functionals])
+    operator = lambda u: np.concatenate([f @ u for f in functionals])
+
+    snapshot_steps = {model.steps_per_year * year: f"T_vertex_{float(year):.1f}a"
+                      for year in [1, 10, 20, 30, 40] if model.steps_per_year * year <= model.time_steps}
+    max_step = max(int(round(settings.get("maxStep", {}).get("value", 10 * 86400.0) / dt)), 1)
+    nodes = decay_nodes(model.time_steps, snapshot_steps, growth=settings.get("growth", 2.0),
+                           steps_per_size=settings.get("stepsPerSize", 4), max_step=max_step)
+    r_0 = -(c * (model.load.A * u_0 - model.load.B * np.real(u_1)))
+    transient, states, n_factorizations = decay(
+        r_0, nodes, lambda k: system.linear_system(k * dt)[:2], system.mass_matrix, operator,
+        keep=set(snapshot_steps))
+    print(f"Harmonic engine: {len(nodes) - 1} decay steps for {model.time_steps} time steps, "
+          f"{n_factorizations + 2} factorizations")
+
+    writer.set_metadata("engine", "harmonic")
+    writer.set_metadata("boundary", "robin" if model.robin_boundary else "dirichlet")
+    writer.set_metadata("num_vertices", len(coords))
+    writer.set_metadata("num_cells", len(cells))
+    writer.set_metadata("boreholes", borehole_mode(params_si))
+    writer.set_metadata("harmonic", json.dumps(dict(
+        decay_steps=len(nodes) - 1, factorizations=n_factorizations + 2,
+        growth=settings.get("growth", 2.0), steps_per_size=settings.get("stepsPerSize", 4),
+        max_step=max_step)))
+
+    operator_0, operator_1 = operator(u_0), operator(u_1)
+    # one check per year block: the warm-up counts blocks
+    watchdog = wd.Watchdog(params_si, per_block=True)
+    try:
+        # periodic regime: mean field and amplitude of the annual oscillation
+        writer.add_vertex_snapshot_arrays("T_harmonic_mean", coords, cells,
+                                          T_0 + c * model.load.A * u_0, symmetry=model.symmetry)
+        writer.add_vertex_snapshot_arrays("T_harmonic_amplitude", coords, cells,
+                                          c * model.load.B * np.abs(u_1), symmetry=model.symmetry)
+
+        w_previous = 0.0
+        for first in range(1, model.time_steps + 1, model.steps_per_year):
+            last = min(first + model.steps_per_year - 1, model.time_steps)
+            steps = np.arange(first, last + 1)
+            values = periodic(steps, operator_0, operator_1) + interpolate(steps, nodes, transient)
+            Temp_EWS, w_u, g_u, T_monitor = (values[:, sizes[i]:sizes[i + 1]] for i in range(4))
+
+            Q = model.load.powers(first, last)
+            Temp_EWS = (T_0 + Temp_EWS +
+                        system.near_field * Q[:, None] * model.load_shares[None, :]).astype(np.float32)
+            w_u = np.concatenate([[w_previous], w_u[:, 0]])
+            w_previous = w_u[-1]
+            E_ground = model.symmetry_factor * (w_u[:-1] - w_u[1:])
+            E_flux = - dt * model.symmetry_factor * g_u[:, 0]
+            E_probe = dt * Q * n_EWS
+            writer.append_steps(
+                day=steps * dt / 86400.0,
+                error=(E_ground + E_flux + E_probe) / (3600.0 * 1000.0),
+                E_probe=E_probe / (3600.0 * 1000.0),
+                E_flux=E_flux / (3600.0 * 1000.0),
+                Delta_E=E_ground / (3600.0 * 1000.0),
+                E_inout=(E_ground + E_probe) / (3600.0 * 1000.0),
+                W_el=P_el_array(
+                    Q=Q[:, None] * model.load_shares[None, :],
+                    T=Temp_EWS,
+                    T_H=params_si.temperatureHot.value,
+                    delta_t=dt,
+                    gamma=params_si.power.efficiency.value
+                ),
+                Temp_EWS=Temp_EWS
+            )
+            if monitor is not None:
+                recorded = steps % monitor.every == 0
+                writer.append_monitoring_steps(steps[recorded] * dt / 86400.0,
+                                               (T_0 + T_monitor[recorded]).astype(np.float32))
+            for step in steps:
+                if step in snapshot_steps:
+                    u = periodic([step], u_0, u_1)[0] + states[step]
+                    writer.add_vertex_snapshot_arrays(snapshot_steps[step], coords, cells,
+                                                      T_0 + u, symmetry=model.symmetry)
+            watchdog.check(last, Temp_EWS=Temp_EWS, error=np.sum(np.abs(E_ground + E_flux + E_probe)),
+                           reference=np.sum(np.abs(E_ground) + np.abs(E_flux) + np.abs(E_probe)))
+    finally:
+        writer.close()
+
+    print("Calculation finished.")
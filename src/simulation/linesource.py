@@ -0,0 +1,246 @@
+import time
+from os import makedirs, path
+
+import numpy as np
+from box import Box
+from scipy.signal import fftconvolve
+from scipy.special import exp1
+
+from src.simulation import mesh as msh
+from src.simulation import monitoring as mon
+from src.simulation import powerprofile as pp
+from src.simulation import watchdog as wd
+from src.simulation.utils.h5py_writer import H5Writer
+from src.simulation.utils.tools import P_el_array, effective_parameters
+
+# Gauss-Legendre nodes for the moving line source integral
+_NODES, _WEIGHTS = np.polynomial.legendre.leggauss(64)
+
+
+def moving_line_source(dx, dy, t, thermal_conductivity, diffusion_coefficient, velocity):
+    """
+    Temperature response in K per W/m of an infinite line source switched on
+    at t = 0, in a groundwater flow with thermal velocity U = b * v:
+
+        ΔT = 1 / (4πλ) exp(U·d / 2a) ∫_{r²/4at}^∞ exp(-ψ - |U|² r² / (16 a² ψ)) / ψ dψ
+
+    For U = 0 this is the infinite line source E_1(r² / 4at) / (4πλ).
+
+    Args:
+        dx, dy (np.ndarray): offset of the evaluation point from the source in m.
+        t (np.ndarray): time since switching on in s (broadcast with dx, dy).
+        velocity (tuple): thermal velocity (U_x, U_y) in m/s.
+    """
+    dx, dy, t = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (dx, dy, t)))
+    r2 = dx**2 + dy**2
+    u = r2 / (4.0 * diffusion_coefficient * t)
+    U_x, U_y = velocity
+
+    if U_x == 0.0 and U_y == 0.0:
+        return exp1(u) / (4.0 * np.pi * thermal_conductivity)
+
+    # substitution ψ = e^s on the interval where the exponent is above -40:
+    # ψ + β²/ψ <= drift + 40  <=>  ψ_lo <= ψ <= ψ_hi
+    drift = (U_x * dx + U_y * dy) / (2.0 * diffusion_coefficient)
+    beta2 = (U_x**2 + U_y**2) * r2 / (16.0 * diffusion_coefficient**2)
+    c = np.maximum(drift + 40.0, 0.0)
+    root = np.sqrt(np.maximum(c**2 - 4.0 * beta2, 0.0))
+    psi_lo = np.maximum(u, 2.0 * beta2 / np.maximum(c + root, 1e-300))
+    psi_hi = np.maximum(0.5 * (c + root), psi_lo)
+
+    s_0 = np.log(psi_lo)
+    half = 0.5 * (np.log(psi_hi) - s_0)
+    s = s_0[..., None] + half[..., None] * (_NODES + 1.0)
+    integrand = np.exp(drift[..., None] - np.exp(s) - beta2[..., None] * np.exp(-s))
+    return half * (integrand @ _WEIGHTS) / (4.0 * np.pi * thermal_conductivity)
+
+
+def step_responses(points, sources, time_step, time_steps, thermal_conductivity,
+                   diffusion_coefficient, velocity, points_per_decade=30, min_distance=0.0,
+                   weights=None):
+    """
+    Response of every evaluation point to one load step of 1 W/m at all sources.
+
+    The superposed unit-step response H(t) = Σ_j G(x - x_j, t) is evaluated on a
+    logarithmic time grid for the distinct offsets only and interpolated in
+    log t to the model steps. h_m = H((m+1)Δt) - H(mΔt) is the response m steps
+    after a load step. Points closer than `min_distance` to a source are
+    evaluated at that distance (the line source is singular on its axis).
+    `weights` scales the load of every source (default 1).
+
+    Returns:
+        np.ndarray: h with shape (n_points, time_steps).
+    """
+    offsets = (np.asarray(points)[:, None, :] - np.asarray(sources)[None, :, :]).reshape(-1, 2)
+    if min_distance > 0.0:
+        r = np.hypot(offsets[:, 0], offsets[:, 1])
+        close = r < min_distance
+        offsets[close & (r == 0.0)] = (min_distance, 0.0)
+        offsets[close & (r > 0.0)] *= (min_distance / r[close & (r > 0.0)])[:, None]
+
+    # distinct offsets (without flow only the distance matters)
+    if velocity[0] == 0.0 and velocity[1] == 0.0:
+        keys = np.round(np.hypot(offsets[:, 0], offsets[:, 1]), 6)[:, None]
+        keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        dx, dy = keys[:, 0], np.zeros(len(keys))
+    else:
+        keys, inverse = np.unique(np.round(offsets, 6), axis=0, return_inverse=True)
+        dx, dy = keys[:, 0], keys[:, 1]
+    inverse = inverse.ravel()
+
+    t_end = time_steps * time_step
+    n_log = max(2, int(np.ceil(points_per_decade * np.log10(max(time_steps, 10)))))
+    t_log = np.geomspace(time_step, t_end, n_log)
+
+    G = moving_line_source(dx[:, None], dy[:, None], t_log[None, :],
+                           thermal_conductivity, diffusion_coefficient, velocity)
+
+    # H(t_log) per point: sum over its sources
+    n_points = len(points)
+    H_log = np.zeros((n_points, n_log))
+    G = G[inverse]
+    if weights is not None:
+        G = G * np.tile(np.asarray(weights, dtype=float), n_points)[:, None]
+    np.add.at(H_log, np.repeat(np.arange(n_points), len(sources)), G)
+
+    # interpolation in log t to t_m = mΔt, H(0) = 0
+    log_t = np.log(np.arange(1, time_steps + 1) * time_step)
+    i = np.clip(np.searchsorted(np.log(t_log), log_t) - 1, 0, n_log - 2)
+    w = (log_t - np.log(t_log[i])) / (np.log(t_log[i + 1]) - np.log(t_log[i]))
+    H = H_log[:, i] * (1.0 - w) + H_log[:, i + 1] * w
+
+    return np.diff(H, axis=1, prepend=0.0)
+
+
+def borehole_field(params_si):
+    """
+    Line-source model of the BHE field: load, layout and borehole
+    temperatures (shared by run_linesource and the layout screening).
+
+    Returns:
+        Box: dt, time_steps, steps_per_year, load, Q (time_steps,), sources
+             (n_EWS, 2), load_shares, r_EWS, temperatures(points, min_distance) ->
+             (n_points, time_steps), block (BHEs per response block),
+             Temp_EWS (time_steps, n_EWS) and W_el.
+    """
+    dt = params_si.time.timeStepHours.value
+    time_steps = int(params_si.time.simulationYears.value / dt)
+    steps_per_year = int(round(365 * 86400.0 / dt))
+
+    load = pp.create_load(params_si)
+    Q = load.powers(1, time_steps)
+
+    thermalConductivity, heatCapacityDensity, convection_value = effective_parameters(params_si)
+    diffusionCoefficient = thermalConductivity / heatCapacityDensity
+    velocity = (convection_value * params_si.groundwater.velocityX.value,
+                convection_value * params_si.groundwater.velocityY.value) \
+        if params_si.enableConvection is True else (0.0, 0.0)
+
+    x_0, y_0 = params_si.mesh.xCenter.value, params_si.mesh.yCenter.value
+    locations, _ = msh.generate_layout(
+        mode=tuple(params_si.meshMode),
+        x_0=x_0,
+        y_0=y_0,
+        distance=params_si.mesh.boreholeDistance.value
+    )
+    sources = np.array([(p.x(), p.y()) for p in locations])
+    n_EWS = len(sources)
+    load_shares = msh.load_shares(locations, x_0, y_0,
+                                  params_si.power.get("outerLoadFactor", {}).get("value", 1.0))
+
+    # four points on the borehole radius, as in the FEM engine
+    r_EWS = params_si.power.pipeRadius.value
+    ring = np.array([(-r_EWS, 0.0), (r_EWS, 0.0), (0.0, -r_EWS), (0.0, r_EWS)])
+
+    def temperatures(points, min_distance=0.0):
+        # temperature history (n_points, time_steps) from the superposed responses
+        h = step_responses(points, sources, dt, time_steps, thermalConductivity,
+                           diffusionCoefficient, velocity, min_distance=min_distance,
+                           weights=load_shares)
+        return params_si.ground.temperature.value + \
+            fftconvolve(h, Q[None, :], axes=1)[:, :time_steps]
+
+    # BHE blocks bound the memory of the (points x steps) responses
+    block = max(1, int(5e6 // (4 * time_steps)))
+    Temp_EWS = np.empty((time_steps, n_EWS), dtype=np.float32)
+    for first in range(0, n_EWS, block):
+        last = min(first + block, n_EWS)
+        points = (sources[first:last, None, :] + ring[None, :, :]).reshape(-1, 2)
+        Temp_EWS[:, first:last] = temperatures(points).reshape(
+            last - first, 4, time_steps).mean(axis=1).T
+
+    W_el = P_el_array(Q[:, None] * load_shares[None, :], Temp_EWS,
+                      T_H=params_si.temperatureHot.value,
+                      delta_t=dt,
+                      gamma=params_si.power.efficiency.value)
+
+    return Box(dt=dt, time_steps=time_steps, steps_per_year=steps_per_year, Q=Q, sources=sources,
+               load_shares=load_shares, r_EWS=r_EWS, temperatures=temperatures, block=block,
+               Temp_EWS=Temp_EWS, W_el=W_el, load=load)
+
+
+def run_linesource(params: Box, params_si: Box, base_folder: str):
+    """
+    Screening engine without mesh and FEM: borehole temperatures from the
+    (moving) infinite line source with spatial superposition over all BHEs
+    and temporal superposition of the load steps (FFT convolution).
+
+    Writes the time series of the H5Writer layout (no field snapshots, the
+    energy balance terms of the FEM domain are not defined and stored as NaN).
+    """
+    start = time.perf_counter()
+    makedirs(base_folder, exist_ok=True)
+
+    field = borehole_field(params_si)
+    dt, time_steps, steps_per_year = field.dt, field.time_steps, field.steps_per_year
+    Q, Temp_EWS, W_el, block = field.Q, field.Temp_EWS, field.W_el, field.block
+    n_EWS = len(field.sources)
+    pp.load_statistics(field.load, time_steps, dt,
+                       output_path=path.join(base_folder, "powerprofile_multi.csv"))
+
+    # monitoring points, recorded every `every` steps
+    monitoring = params_si.get("monitoring", {})
+    groups = mon.monitoring_groups(params_si) if monitoring.get("enabled", False) else []
+    if groups:
+        monitor_points = np.vstack([p for _, p, _ in groups])
+        monitor_steps = np.arange(1, time_steps + 1)
+        monitor_steps = monitor_steps[monitor_steps % max(int(monitoring.get("every", 1)), 1) == 0]
+        Temp_monitor = np.empty((len(monitor_steps), len(monitor_points)), dtype=np.float32)
+        for first in range(0, len(monitor_points), 4 * block):
+            last = min(first + 4 * block, len(monitor_points))
+            # points inside a borehole are evaluated at its wall
+            Temp_monitor[:, first:last] = field.temperatures(
+                monitor_points[first:last], field.r_EWS)[:, monitor_steps - 1].T
+        print(f"Monitoring: {len(monitor_points)} points in {len(groups)} groups")
+
+    output = params_si.get("output", {})
+    writer = H5Writer(path=f"{base_folder}/sim_{params.time.simulationYears.value}years.h5",
+                      n_EWS=n_EWS, compression="lzf", flush_every=steps_per_year,
+                      batch_size=steps_per_year,
+                      aggregates=output.get("aggregates", []),
+                      raw=output.get("raw", True))
+    # energy balance is not defined here: temperature and NaN checks per block
+    watchdog = wd.Watchdog(params_si)
+    try:
+        writer.set_metadata("engine", "linesource")
+        if groups:
+            writer.add_monitoring(groups)
+            writer.append_monitoring_steps(monitor_steps * dt / 86400.0, Temp_monitor)
+        for first in range(0, time_steps, steps_per_year):
+            last = min(first + steps_per_year, time_steps)
+            steps = np.arange(first + 1, last + 1)
+            writer.append_steps(
+                day=steps * dt / 86400.0,
+                error=np.nan,
+                E_probe=dt * Q[first:last] * n_EWS / (3600.0 * 1000.0),
+                E_flux=np.nan,
+                Delta_E=np.nan,
+                E_inout=np.nan,
+                W_el=W_el[first:last],
+                Temp_EWS=Temp_EWS[first:last]
+            )
+            watchdog.check(last, Temp_EWS=Temp_EWS[first:last])
+    finally:
+        writer.close()
+
+    print(f"Line source calculation finished ({time.perf_counter() - start:.1f} s).")
@@ -5,30 +5,117 @@ import os
 import json
 
 from box import Box
-from fenics import Point
 from src.simulation.utils.paths import PARAMETER_FILE_SI, TEMP_DIR
 
+try:
+    from fenics import Point
+except ImportError:
+    # FEniCS-free engines only need the coordinates of the layout
+    class Point:
+        def __init__(self, x=0.0, y=0.0):
+            self._coords = (float(x), float(y))
 
-def generate_mesh(mode, x_0, y_0, distance):
+        def x(self):
+            return self._coords[0]
+
+        def y(self):
+            return self._coords[1]
+
+        def __repr__(self):
+            return f"Point({self._coords[0]}, {self._coords[1]})"
+
+# physical curve of the wall of BHE k (BH{k:02d}) in the resolved geometry
+BOREHOLE_TAG = 1000
+
+
+def generate_mesh(mode, x_0, y_0, distance, symmetry=(False, False)):
+    locations, EWS_dict = generate_layout(mode, x_0, y_0, distance)
+    meshing(EWS_dict, symmetry=symmetry)
+
+    return locations
+
+
+def generate_layout(mode, x_0, y_0, distance):
     print("--------------------------------------------------------------------")
     if mode[0] == 'hexa':
-        locations, EWS_dict = generate_hexa_ews(
-            x_b0=x_0, y_b0=y_0, d=distance, rings=mode[1])
-        meshing(EWS_dict)
-
-        return locations
+        return generate_hexa_ews(x_b0=x_0, y_b0=y_0, d=distance, rings=mode[1])
 
     elif mode[0] == 'square':
-        locations, EWS_dict = generate_square_ews(
-            x_b0=x_0, y_b0=y_0, d=distance, rings=mode[1])
-        meshing(EWS_dict)
-
-        return locations
+        return generate_square_ews(x_b0=x_0, y_b0=y_0, d=distance, rings=mode[1])
 
     else:
         raise ValueError(f"Unknown mode: {mode}")
 
 
+def detect_symmetry(locations, velocity_x, velocity_y, convection=True, tol=1e-6):
+    """
+    Checks whether the BHE field, the domain (centred at the origin) and the
+    groundwater flow are mirror symmetric about the lines x = 0 and y = 0.
+
+    Returns:
+        tuple: (x_symmetric, y_symmetric) for the mirrors x -> -x and y -> -y.
+    """
+    coords = np.array([[p.x(), p.y()] for p in locations])
+
+    def mirrored(axis):
+        mirror = coords.copy()
+        mirror[:, axis] *= -1
+        distances = np.linalg.norm(coords[:, None, :] - mirror[None, :, :], axis=2)
+        return bool(np.all(distances.min(axis=0) < tol))
+
+    x_symmetric = mirrored(0) and (not convection or velocity_x == 0.0)
+    y_symmetric = mirrored(1) and (not convection or velocity_y == 0.0)
+
+    print(f"Symmetry about x = 0: {x_symmetric}, about y = 0: {y_symmetric}")
+    return x_symmetric, y_symmetric
+
+
+def reduce_layout(locations, symmetry, tol=1e-6):
+    """
+    BHEs of the reduced (half or quarter) domain.
+
+    Returns:
+        tuple: (reduced locations,
+                point source weights: 1/2 for every symmetry line the BHE lies on,
+                index of the reduced representative for every BHE of the full field)
+    """
+    x_symmetric, y_symmetric = symmetry
+    reduced, weights, mirror = [], [], []
+
+    for p in locations:
+        x = abs(p.x()) if x_symmetric else p.x()
+        y = abs(p.y()) if y_symmetric else p.y()
+
+        for j, q in enumerate(reduced):
+            if abs(q.x() - x) < tol and abs(q.y() - y) < tol:
+                mirror.append(j)
+                break
+        else:
+            on_lines = int(x_symmetric and abs(x) < tol) + \
+                int(y_symmetric and abs(y) < tol)
+            reduced.append(Point(x, y))
+            weights.append(0.5 ** on_lines)
+            mirror.append(len(reduced) - 1)
+
+    return reduced, np.array(weights), np.array(mirror, dtype=int)
+
+
+def load_shares(locations, x_0, y_0, outer_factor=1.0):
+    """
+    Share of the field load per BHE: rises linearly with the distance from
+    the field centre to `outer_factor` times the centre value at the
+    outermost BHEs and is normalized to a mean of 1, so the load of the
+    whole field is unchanged.
+    """
+    r = np.array([math.hypot(p.x() - x_0, p.y() - y_0) for p in locations])
+    if r.max() == 0.0:
+        return np.ones(len(r))
+    shares = 1.0 + (outer_factor - 1.0) * r / r.max()
+    if np.any(shares < 0.0):
+        raise ValueError("outerLoadFactor must be >= 0")
+    return shares / shares.mean()
+
+
 def generate_hexa_ews(x_b0, y_b0, d, rings):
     locations = []
     hexa_EWS = {}
@@ -78,88 +165,8 @@ def generate_square_ews(x_b0, y_b0, d, rings):
     return locations, square_EWS
 
 
-def geo_template_circles_alt(EWS_dict, ms, ms_fine, x_len, y_len, x_0, y_0, radius):
-    num = len(EWS_dict)
-    number_list = np.arange(5, 5+num, 1).tolist()
-    number_list = "{" + ", ".join(map(str, number_list)) + "}"
-
-    # Initialize point entries based on the dictionary
-    circle_num = 12
-    point_entries = ""
-    counter_point = 5
-    counter_line = 5
-    for i, (_, coords) in enumerate(EWS_dict.items(), start=2):
-        x, y = coords  # Directly unpack the tuple
-        point_entries += f"Point({counter_point}) = {{{x}, {y}, 0, ms_fine}};\n    "
-        start_point = counter_point
-        start_line = counter_line
-        for j in range(circle_num):
-            angle = 2*np.pi/circle_num * j
-            point_entries += f"Point({counter_point+1}) = {{{x + radius*np.cos(angle)}, {y + radius*np.sin(angle)}, 0, ms_fine}};\n    "
-            counter_point += 1
-
-        for k in range(circle_num-1):
-            point_entries += f"Line({counter_line}) = {{{start_point + k + 1}, {start_point + k+2}}};\n    "
-            counter_line += 1
-
-        point_entries += f"Line({counter_line}) = {{{start_point + circle_num}, {start_point + 1}}};\n    "
-        point_entries += f"Curve Loop({i}) = {{{start_line}:{counter_line}}};\n    "
-        counter_point += 1
-        counter_line += 1
-
-    geo_template = f"""
-    SetFactory("OpenCASCADE");
-
-    // Mesh Size Factor
-    ms = {ms};
-    ms_fine = {ms_fine};
-
-    // Define the coordinates of the points
-    x_m = {x_0};                // x-coordinate of the center
-    y_m = {y_0};                // y-coordinate of the center
-
-    // Create the boundary lines
-    Point(1) = {{-{x_len}, -{y_len}, 0, ms}};
-    Point(2) = {{ {x_len}, -{y_len}, 0, ms}};
-    Point(3) = {{ {x_len},  {y_len}, 0, ms}};
-    Point(4) = {{-{x_len},  {y_len}, 0, ms}};
-
-    Line(1) = {{1, 2}};
-    Line(2) = {{2, 3}};
-    Line(3) = {{3, 4}};
-    Line(4) = {{4, 1}};
-
-    Curve Loop(1) = {{1, 2, 3, 4}};
-
-    // Define mesh points
-    {point_entries} 
-    
-    // Physical Groups 
-    Plane Surface(1) = {{1, 2:{num+1}}};
-    Physical Curve("Boundary") = {{1, 2, 3, 4}};
-    Physical Curve("Boreholes") = {{77:{counter_line-1}}};
-    Physical Surface("Ground") = {{1}};
-
-    Field[1] = Distance;
-    Field[1].CurvesList = {{5:{counter_line-1}}}; // Alle Kreiskanten für das Distanzfeld
-
-    Field[2] = Threshold;
-    Field[2].InField = 1;
-    Field[2].SizeMin = ms_fine;  // Feines Mesh nah an den Kreisen
-    Field[2].SizeMax = ms;       // Grobes Mesh weiter weg
-    Field[2].DistMin = 5;        // Bis 2 Einheiten Abstand fein
-    Field[2].DistMax = 15;       // Danach wird es grober
-
-    Background Field = 2;
-
-    Mesh.CharacteristicLengthMin = 1;
-    Mesh.CharacteristicLengthMax = ms;
-    """
-
-    return geo_template
-
-
-def geo_template_points(EWS_dict, ms, ms_fine, x_len, y_len, x_0, y_0, radius):
+def geo_template_points(EWS_dict, ms, ms_fine, x_len, y_len, x_0, y_0, radius,
+                        symmetry=(False, False), size_field=None, bounds=None):
 
     num = len(EWS_dict)
     number_list = np.arange(5, 5+num, 1).tolist()
@@ -171,6 +178,23 @@ def geo_template_points(EWS_dict, ms, ms_fine, x_len, y_len, x_0, y_0, radius):
         x, y = coords  # Directly unpack the tuple
         point_entries += f"    Point({i}) = {{{x}, {y}, 0, ms_fine}};\n"
 
+    # symmetry lines x = 0 (Line 4) and y = 0 (Line 1) keep the natural zero-flux condition
+    x_symmetric, y_symmetric = symmetry
+    x_min = 0 if x_symmetric else -x_len
+    y_min = 0 if y_symmetric else -y_len
+    x_max, y_max = x_len, y_len
+    if bounds is not None:
+        # rectangle (x_min, x_max, y_min, y_max), e.g. the field patch of nested meshes
+        x_min, x_max, y_min, y_max = bounds
+    boundary_lines = [1] * (not y_symmetric) + [2, 3] + [4] * (not x_symmetric)
+    boundary_lines = ", ".join(map(str, boundary_lines))
+
+    # adaptive remeshing: the element sizes of a gmsh view replace the threshold field
+    background = "Background Field = 2;" if size_field is None else f"""Merge "{size_field}";
+    Field[3] = PostView;
+    Field[3].ViewIndex = 0;
+    Background Field = 3;"""
+
     geo_template = f"""
     SetFactory("OpenCASCADE");
 
@@ -198,13 +222,13 @@ def geo_template_points(EWS_dict, ms, ms_fine, x_len, y_len, x_0, y_0, radius):
     Field[2].DistMax = 30;     // Distance of the effect
 
     // Set the background field to the threshold
-    Background Field = 2;
+    {background}
 
     // Create the boundary lines
-    Point(1) = {{-{x_len}, -{y_len}, 0, ms}};
-    Point(2) = {{ {x_len}, -{y_len}, 0, ms}};
-    Point(3) = {{ {x_len},  {y_len}, 0, ms}};
-    Point(4) = {{-{x_len},  {y_len}, 0, ms}};
+    Point(1) = {{ {x_min},  {y_min}, 0, ms}};
+    Point(2) = {{ {x_max},  {y_min}, 0, ms}};
+    Point(3) = {{ {x_max},  {y_max}, 0, ms}};
+    Point(4) = {{ {x_min},  {y_max}, 0, ms}};
 
     Line(1) = {{1, 2}};
     Line(2) = {{2, 3}};
@@ -215,57 +239,47 @@ def geo_template_points(EWS_dict, ms, ms_fine, x_len, y_len, x_0, y_0, radius):
     Plane Surface(1) = {{1}};
 
     // Physical Groups (optional)
-    Physical Curve("Boundary") = {{1, 2, 3, 4}};
+    Physical Curve("Boundary") = {{{boundary_lines}}};
     Physical Surface("Ground") = {{1}};
     """
 
     return geo_template
 
 
-def geo_template_circles(EWS_dict, ms, ms_fine, x_len, y_len, x_0, y_0, radius):
-    num = len(EWS_dict)
-    number_list = np.arange(5, 5+num, 1).tolist()
-    number_list = "{" + ", ".join(map(str, number_list)) + "}"
-
-    # TODO: Remove unused code
-    # Initialize point entries based on the dictionary
-    # circle_num = 12
-    # point_entries = ""
-    # counter_point = 5
-    # counter_line = 5
-    # for i, (key, coords) in enumerate(EWS_dict.items(), start=2):
-    #     x, y = coords  # Directly unpack the tuple
-    #     point_entries += f"Point({counter_point}) = {{{x}, {y}, 0, ms_fine}};\n    "
-    #     start_point = counter_point
-    #     start_line = counter_line
-    #     for j in range(circle_num):
-    #         angle = 2*np.pi/circle_num * j
-    #         point_entries += f"Point({counter_point+1}) = {{{x + radius*np.cos(angle)}, {y+ radius*np.sin(angle)}, 0, ms_fine}};\n    "
-    #         counter_point += 1
-
-    #     for k in range(circle_num-1):
-    #         point_entries +=f"Line({counter_line}) = {{{start_point + k + 1}, {start_point + k+2}}};\n    "
-    #         counter_line += 1
-
-    #     point_entries +=f"Line({counter_line}) = {{{start_point + circle_num}, {start_point + 1}}};\n    "
-    #     point_entries +=f"Curve Loop({i}) = {{{start_line}:{counter_line}}};\n    "
-    #     counter_point += 1
-    #     counter_line += 1
-    
-    cylinder_entries = ""
-    counter_cylinder = 2
-
-    for i, (key, coords) in enumerate(EWS_dict.items(), start=2):
-        x, y = coords  # Directly unpack the tuple
-        cylinder_entries += f"Circle({counter_cylinder}) = {{{x}, {y}, 0, {radius}, 0 , 2*Pi}},\n     "
-        counter_cylinder += 1
+def geo_template_circles(EWS_dict, ms, x_len, y_len, x_0, y_0, radius, wall_segments=24,
+                         first_layer=0.005, layer_ratio=1.3, layer_thickness=0.1):
+    """
+    Resolved boreholes for any layout: every BHE is a hole of the pipe radius
+    (four circle arcs, physical curve BOREHOLE_TAG + k for BH{k:02d}) with
+    `wall_segments` elements on the wall and a boundary layer of triangles
+    (first layer `first_layer`, growth `layer_ratio`, total `layer_thickness`).
+    """
+    wall_size = 2 * np.pi * radius / wall_segments
+
+    hole_entries = ""
+    physical_entries = ""
+    hole_curves = []
+    for k, (key, (x, y)) in enumerate(EWS_dict.items(), start=1):
+        # points 5k..5k+4 (centre, arc ends), curves 4k+1..4k+4, curve loop k+1
+        p_0 = 5 * k
+        c_0 = 4 * k + 1
+        hole_entries += f"    Point({p_0}) = {{{x}, {y}, 0, wall_size}};\n"
+        for j, (dx, dy) in enumerate([(1, 0), (0, 1), (-1, 0), (0, -1)], start=1):
+            hole_entries += f"    Point({p_0 + j}) = {{{x + dx * radius}, {y + dy * radius}, 0, wall_size}};\n"
+        curves = [c_0 + j for j in range(4)]
+        for j, curve in enumerate(curves):
+            hole_entries += f"    Circle({curve}) = {{{p_0 + 1 + j}, {p_0}, {p_0 + 1 + (j + 1) % 4}}};\n"
+        hole_entries += f"    Curve Loop({k + 1}) = {{{', '.join(map(str, curves))}}};\n"
+        physical_entries += f"    Physical Curve(\"{key}\", {BOREHOLE_TAG + k}) = {{{', '.join(map(str, curves))}}};\n"
+        hole_curves += curves
+
+    loops = ", ".join(map(str, range(1, len(EWS_dict) + 2)))
+    hole_curves = ", ".join(map(str, hole_curves))
 
     geo_template = f"""
-    SetFactory("OpenCASCADE");
-
     // Mesh Size Factor
     ms = {ms};
-    ms_fine = {ms_fine};
+    wall_size = {wall_size};
 
     // Define the coordinates of the points
     x_m = {x_0};                // x-coordinate of the center
@@ -283,69 +297,139 @@ def geo_template_circles(EWS_dict, ms, ms_fine, x_len, y_len, x_0, y_0, radius):
     Line(4) = {{4, 1}};
 
     Curve Loop(1) = {{1, 2, 3, 4}};
-    Plane Surface(1) = {{1}};
 
-    // Define mesh points
-    cylinders[] = {{
-        {cylinder_entries} 
-    }};
-    BooleanDifference(9) = {{ Surface{{1}}; Delete; }}{{ Surface{{2:8}}; }};
+    // Boreholes
+{hole_entries}
+    Plane Surface(1) = {{{loops}}};
 
+    // Physical Groups
+    Physical Curve("Boundary", 1) = {{1, 2, 3, 4}};
+{physical_entries}
+    Physical Surface("Ground", 1) = {{1}};
 
-    // Physical Groups 
-    Physical Curve("Boundary") = {{1, 2, 3, 4}};
-    Physical Surface("Ground") = {{9}};
-
-    // Create Distance Field for Cylinders
+    // wall_size on the borehole walls, growing to ms
     Field[1] = Distance;
-    Field[1].SurfacesList = {{GetEntities(Surface)}}; // Gets all Cylinder surfaces
+    Field[1].CurvesList = {{{hole_curves}}};
+    Field[1].Sampling = {4 * wall_segments};
 
-    // Create Threshold Field for mesh refinement
     Field[2] = Threshold;
     Field[2].InField = 1;
-    Field[2].SizeMin = ms_fine;
+    Field[2].SizeMin = wall_size;
     Field[2].SizeMax = ms;
-    Field[2].DistMin = 3;  // Reduced to avoid unnecessary fine areas
-    Field[2].DistMax = 10;
+    Field[2].DistMin = {layer_thickness};
+    Field[2].DistMax = 30;
 
-    // Set Background Field
     Background Field = 2;
 
+    // boundary layer of triangles around every borehole
+    Field[3] = BoundaryLayer;
+    Field[3].CurvesList = {{{hole_curves}}};
+    Field[3].Size = {first_layer};
+    Field[3].Ratio = {layer_ratio};
+    Field[3].Thickness = {layer_thickness};
+    Field[3].Quads = 0;
+    BoundaryLayer Field = 3;
+
     // Mesh settings
+    Mesh.MeshSizeExtendFromBoundary = 0;
+    Mesh.MeshSizeFromPoints = 0;
     Mesh.CharacteristicLengthMax = ms;
     """
 
     return geo_template
 
 
-def meshing(EWS_dict):
-    with open(PARAMETER_FILE_SI, "r") as f:
-        param = Box(json.load(f))
+def meshing(EWS_dict, symmetry=(False, False), domain=None, convert=True, size_field=None,
+            bounds=None, sizes=None, param=None, output_dir=TEMP_DIR):
+    """
+    Writes the .geo file, meshes it with gmsh and converts it for FEniCS.
+
+    With convert=False the gmsh .msh file is kept instead (FEniCS-free engines).
+    `size_field` is a gmsh view (.pos) of the element sizes that replaces the
+    refinement around the BHEs (adaptive remeshing, not for resolved boreholes).
+    `bounds` (x_min, x_max, y_min, y_max) replaces the domain and `sizes`
+    (meshFactor, meshFine) the element sizes (levels of nested meshes).
+    `param` are the SI parameters of the run, read from the SI parameter
+    file if not given. The mesh files are written to `output_dir`.
+
+    Returns:
+        str: path of the mesh file (.xml or .msh).
+    """
+    if param is None:
+        with open(PARAMETER_FILE_SI, "r") as f:
+            param = Box(json.load(f))
+
+    # domain = (xLength, yLength) overrides the parameter file (auto sizing)
+    x_length, y_length = domain if domain is not None else (
+        param.mesh.xLength.value, param.mesh.yLength.value)
+
+    # only BHEs inside the reduced domain refine the mesh
+    x_symmetric, y_symmetric = symmetry
+    EWS_dict = {key: (x, y) for key, (x, y) in EWS_dict.items()
+                if not (x_symmetric and x < 0) and not (y_symmetric and y < 0)}
 
     # Create the .geo file
-    template = geo_template_points(
-        EWS_dict,
-        ms=param.mesh.meshFactor.value,
-        ms_fine=param.mesh.meshFine.value,
-        x_len=param.mesh.xLength.value / 2,
-        y_len=param.mesh.yLength.value / 2,
-        x_0=param.mesh.xCenter.value,
-        y_0=param.mesh.yCenter.value,
-        radius=param.power.pipeRadius.value
-    )
+    geometry = param.get("boreholeGeometry", {})
+    if geometry.get("mode", "points") == "resolved":
+        if size_field is not None or bounds is not None:
+            raise ValueError("Adaptive remeshing and nested meshes are not available for resolved boreholes")
+        radius = param.power.pipeRadius.value
+        layer_thickness = geometry.get("layerThickness", {}).get("value", 0.1)
+        coords = np.array(list(EWS_dict.values()))
+        if len(coords) > 1:
+            spacing = np.linalg.norm(coords[:, None, :] - coords[None, :, :], axis=2)
+            np.fill_diagonal(spacing, np.inf)
+            if 2 * (radius + layer_thickness) >= spacing.min():
+                raise ValueError(f"Boundary layers of {layer_thickness} m overlap at a BHE spacing "
+                                 f"of {spacing.min():.2f} m")
+        template = geo_template_circles(
+            EWS_dict,
+            ms=param.mesh.meshFactor.value,
+            x_len=x_length / 2,
+            y_len=y_length / 2,
+            x_0=param.mesh.xCenter.value,
+            y_0=param.mesh.yCenter.value,
+            radius=radius,
+            wall_segments=int(geometry.get("wallSegments", 24)),
+            first_layer=geometry.get("firstLayer", {}).get("value", 0.005),
+            layer_ratio=geometry.get("layerRatio", 1.3),
+            layer_thickness=layer_thickness
+        )
+    else:
+        ms, ms_fine = sizes if sizes is not None else (
+            param.mesh.meshFactor.value, param.mesh.meshFine.value)
+        template = geo_template_points(
+            EWS_dict,
+            ms=ms,
+            ms_fine=ms_fine,
+            x_len=x_length / 2,
+            y_len=y_length / 2,
+            x_0=param.mesh.xCenter.value,
+            y_0=param.mesh.yCenter.value,
+            radius=param.power.pipeRadius.value,
+            symmetry=symmetry,
+            size_field=size_field,
+            bounds=bounds
+        )
 
     # Write .geo file
-    geo_file_name = TEMP_DIR + "/temp_mesh.geo"
+    geo_file_name = os.path.join(output_dir, "temp_mesh.geo")
     with open(geo_file_name, "w") as geo_file:
         geo_file.write(template)
 
     # Run Gmsh
-    msh_file_name = TEMP_DIR + "temp_mesh.msh"  # Gmsh's default output file
+    msh_file_name = os.path.join(output_dir, "temp_mesh.msh")  # Gmsh's default output file
     subprocess.run(["gmsh", "-2", geo_file_name, "-o",
                    msh_file_name, "-format", "msh2"])
 
+    if not convert:
+        os.remove(geo_file_name)
+        print(f"Mesh successfully created: {msh_file_name}.")
+        print("--------------------------------------------------------------------")
+        return msh_file_name
+
     # Convert mesh to XML
-    xml_file_name = TEMP_DIR + "/temp_mesh.xml"
+    xml_file_name = os.path.join(output_dir, "temp_mesh.xml")
     subprocess.run(["dolfin-convert", msh_file_name, xml_file_name])
 
     # Clean up temporary files
@@ -368,3 +452,5 @@ def meshing(EWS_dict):
     # plt.xticks(fontsize = 18)
     # plt.yticks(fontsize = 18)
     # plt.show()
+
+    return xml_file_name
@@ -0,0 +1,171 @@
+from functools import partial
+from os import makedirs, path
+from typing import NamedTuple
+
+import numpy as np
+from box import Box
+
+from src.simulation import farfield as ff
+from src.simulation import mesh as msh
+from src.simulation import powerprofile as pp
+from src.simulation.utils.h5py_writer import AsyncH5Writer, H5Writer
+from src.simulation.utils.paths import PARAMETER_FILE_SI, TEMP_DIR
+from src.simulation.utils.tools import effective_parameters
+
+# point sources, regularized sources (Gaussian, disc) or resolved borehole walls
+BOREHOLE_MODES = ("points", "gaussian", "disc", "resolved")
+
+
+class ModelSetup(NamedTuple):
+    """Engine-independent setup: load, ground parameters, BHE layout and mesh."""
+    base_folder: str
+    time_steps: int
+    steps_per_year: int
+    load: object
+    thermalConductivity: float
+    heatCapacityDensity: float
+    convection_value: float
+    diffusionCoefficient: float
+    x_center: float
+    y_center: float
+    velocity: tuple
+    robin_boundary: bool
+    locations: list
+    symmetry: tuple
+    symmetry_factor: int
+    ews_locations: list
+    ews_weights: np.ndarray
+    ews_mirror: np.ndarray
+    mesh_file: str
+    load_shares: np.ndarray
+    remesh: object
+
+
+def prepare_model(params_si: Box, base_folder: str, convert_mesh=True, mesh=True,
+                   mesh_dir=TEMP_DIR):
+    """
+    Shared setup of the FEM engines, the mesh is written to `mesh_dir` (mesh=False:
+    no mesh, the engine meshes its own levels with `remesh`).
+    """
+    makedirs(base_folder, exist_ok=True)
+
+    print(f"Starting calculation with parameters from {PARAMETER_FILE_SI}")
+
+    # Iteration over time steps in hours
+    time_steps = int(params_si.time.simulationYears.value /
+                     params_si.time.timeStepHours.value)
+    steps_per_year = int(round(365 * 86400.0 / params_si.time.timeStepHours.value))
+
+    # TODO: Remove unused variables
+    # load model: A - B * cos(2 * pi * t / year) or a streamed load series
+    load = pp.create_load(params_si)
+    eta, Q_out, Q_in = pp.load_statistics(
+        load, time_steps, params_si.time.timeStepHours.value,
+        output_path=path.join(base_folder, "powerprofile_multi.csv"))
+
+    # effective ground parameters
+    thermalConductivity, heatCapacityDensity, convection_value = effective_parameters(
+        params_si)
+
+    # a = λ / (ρc)
+    diffusionCoefficient = thermalConductivity / heatCapacityDensity
+
+    # create meshgrid
+    x_center = params_si.mesh.xCenter.value
+    y_center = params_si.mesh.yCenter.value
+    locations, EWS_dict = msh.generate_layout(
+        mode=tuple(params_si.meshMode),
+        x_0=x_center,
+        y_0=y_center,
+        distance=params_si.mesh.boreholeDistance.value
+    )
+
+    # far field: Dirichlet T = T_0 or absorbing Robin boundary, optional auto sizing
+    far_field = params_si.get("farField", {})
+    robin_boundary = far_field.get("boundary", "dirichlet") == "robin"
+    velocity = (params_si.groundwater.velocityX.value,
+                params_si.groundwater.velocityY.value) \
+        if params_si.enableConvection is True else (0.0, 0.0)
+    domain = None
+
+    if far_field.get("autoSize", False):
+        field_radius = max(np.hypot(p.x() - x_center, p.y() - y_center)
+                           for p in locations)
+        x_length, y_length, x_center, y_center = ff.auto_domain(
+            field_radius=field_radius,
+            diffusion_coefficient=diffusionCoefficient,
+            convection_coefficient=convection_value,
+            velocity=velocity,
+            simulation_time=params_si.time.simulationYears.value,
+            size_factor=far_field.sizeFactor.value
+        )
+        domain = (x_length, y_length)
+        locations, EWS_dict = msh.generate_layout(
+            mode=tuple(params_si.meshMode),
+            x_0=x_center,
+            y_0=y_center,
+            distance=params_si.mesh.boreholeDistance.value
+        )
+
+    # mirror symmetry: mesh only the half/quarter domain
+    symmetry = (False, False)
+    if params_si.get("useSymmetry", False):
+        symmetry = msh.detect_symmetry(
+            locations,
+            velocity_x=params_si.groundwater.velocityX.value,
+            velocity_y=params_si.groundwater.velocityY.value,
+            convection=params_si.enableConvection
+        )
+    symmetry_factor = 2 ** sum(symmetry)
+
+    # mesh of the run parameters; with a size view (adaptive remeshing) or other
+    # bounds and sizes (levels of nested meshes) for the same layout
+    remesh = partial(msh.meshing, EWS_dict, symmetry=symmetry, domain=domain, convert=convert_mesh,
+                     param=params_si, output_dir=mesh_dir)
+    mesh_file = remesh() if mesh else None
+
+    # BHEs of the reduced domain, their point source weights and the
+    # reduced representative of every BHE of the full field
+    ews_locations, ews_weights, ews_mirror = msh.reduce_layout(locations, symmetry)
+
+    # share of the field load per BHE (symmetric, so the reduced BHEs inherit it)
+    load_shares = _load_shares(params_si, locations, x_center, y_center)
+    reduced_shares = np.empty(len(ews_locations))
+    reduced_shares[ews_mirror] = load_shares
+    ews_weights = ews_weights * reduced_shares
+
+    return ModelSetup(base_folder, time_steps, steps_per_year, load, thermalConductivity,
+                      heatCapacityDensity, convection_value, diffusionCoefficient,
+                      x_center, y_center, velocity, robin_boundary, locations, symmetry,
+                      symmetry_factor, ews_locations, ews_weights, ews_mirror, mesh_file,
+                      load_shares, remesh)
+
+
+def borehole_mode(params_si):
+    mode = params_si.get("boreholeGeometry", {}).get("mode", "points")
+    if mode not in BOREHOLE_MODES:
+        raise ValueError(f"Unknown borehole geometry '{mode}', use one of {list(BOREHOLE_MODES)}")
+    return mode
+
+
+def resolved_boreholes(params_si):
+    return borehole_mode(params_si) == "resolved"
+
+
+def _load_shares(params_si, locations, x_center, y_center):
+    return msh.load_shares(locations, x_center, y_center,
+                           params_si.power.get("outerLoadFactor", {}).get("value", 1.0))
+
+
+def create_writer(params, params_si, base_folder, n_EWS, steps_per_year, scenario_names=None):
+    # HDF5-Writer (optional in a background thread)
+    output = params_si.get("output", {})
+    writer_options = dict(path=f"{base_folder}/sim_{params.time.simulationYears.value}years.h5",
+                          n_EWS=n_EWS, compression="lzf", flush_every=steps_per_year,
+                          batch_size=int(output.get("batchSize", 64)),
+                          n_scenarios=None if scenario_names is None else len(scenario_names),
+                          aggregates=output.get("aggregates", []),
+                          raw=output.get("raw", True))
+    if output.get("asyncWriter", False):
+        return AsyncH5Writer(queue_size=int(output.get("queueSize", 64)), **writer_options)
+    return H5Writer(**writer_options)
@@ -0,0 +1,104 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from src.simulation.utils.probes import probe_matrix
+
+
+def monitoring_groups(params_si):
+    """
+    Monitoring points of the "monitoring" block (coordinates in m):
+
+        points: [{"name", "x", "y"}]                       single wells
+        lines:  [{"name", "start": [x, y], "end": [x, y], "n"}]  transects
+        grids:  [{"name", "x": [x_0, x_1], "y": [y_0, y_1], "nx", "ny"}]
+
+    Returns:
+        list: [(name, points (n, 2), shape)] with shape (n,) for points and
+              lines and (ny, nx) for grids.
+    """
+    monitoring = params_si.get("monitoring", {})
+    groups = []
+
+    for point in monitoring.get("points", []):
+        groups.append((point["name"], np.array([[point["x"], point["y"]]], dtype=float), (1,)))
+
+    for line in monitoring.get("lines", []):
+        n = int(line.get("n", 2))
+        if n < 2:
+            raise ValueError(f"monitoring line '{line['name']}' needs n >= 2 points")
+        t = np.linspace(0.0, 1.0, n)[:, None]
+        start, end = np.asarray(line["start"], dtype=float), np.asarray(line["end"], dtype=float)
+        groups.append((line["name"], start + t * (end - start), (n,)))
+
+    for grid in monitoring.get("grids", []):
+        nx, ny = int(grid.get("nx", 2)), int(grid.get("ny", 2))
+        X, Y = np.meshgrid(np.linspace(*grid["x"], nx), np.linspace(*grid["y"], ny))
+        groups.append((grid["name"], np.column_stack([X.ravel(), Y.ravel()]), (ny, nx)))
+
+    names = [name for name, _, _ in groups]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate monitoring names: {', '.join(duplicates)}")
+    return groups
+
+
+def monitoring_operator(coords, cells, groups, symmetry=(False, False), columns=None):
+    """
+    All monitoring points as one sparse evaluation operator (rows in the order
+    of the groups). Points outside a symmetry-reduced domain are mirrored back
+    into it.
+
+    Returns:
+        scipy.sparse.csr_matrix: shape (n_points, n_vertices).
+    """
+    points = np.vstack([p for _, p, _ in groups])
+    x_symmetric, y_symmetric = symmetry
+    if x_symmetric:
+        points[:, 0] = np.abs(points[:, 0])
+    if y_symmetric:
+        points[:, 1] = np.abs(points[:, 1])
+
+    try:
+        return csr_matrix(probe_matrix(coords, cells, points, columns=columns))
+    except ValueError as e:
+        raise ValueError(f"monitoring: {e}") from e
+
+
+class Monitor:
+    """
+    Records the monitoring points every `every` steps into the writer
+    (datasets monitoring/<name>/values).
+    """
+
+    def __init__(self, writer, groups, operator, every=1):
+        self.writer = writer
+        self.groups = groups
+        self.operator = operator
+        self.every = max(int(every), 1)
+        writer.add_monitoring(groups)
+
+    def due(self, time_step):
+        return time_step % self.every == 0
+
+    def rebuild(self, coords, cells, symmetry=(False, False), columns=None):
+        """Evaluation operator of a new mesh (adaptive remeshing)."""
+        self.operator = monitoring_operator(coords, cells, self.groups, symmetry, columns)
+
+    def record(self, time_step, day, T):
+        """T: state vector (n_vertices,) or block (n_vertices, n_scenarios)."""
+        if self.due(time_step):
+            # (n_points[, n_scenarios]) -> ([n_scenarios,] n_points)
+            self.writer.append_monitoring(day, (self.operator @ T).T)
+
+
+def create_monitor(params_si, writer, coords, cells, symmetry=(False, False), columns=None):
+    """Monitor of the "monitoring" block, None if it is disabled or empty."""
+    monitoring = params_si.get("monitoring", {})
+    if not monitoring.get("enabled", False):
+        return None
+    groups = monitoring_groups(params_si)
+    if not groups:
+        return None
+    operator = monitoring_operator(coords, cells, groups, symmetry, columns)
+    print(f"Monitoring: {operator.shape[0]} points in {len(groups)} groups")
+    return Monitor(writer, groups, operator, monitoring.get("every", 1))
@@ -0,0 +1,170 @@
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from scipy.sparse.linalg import splu
+
+from src.simulation import sparse_fem as sf
+from src.simulation.utils.probes import probe_matrix
+
+
+def patch_bounds(locations, margin, domain):
+    """
+    Field patch of nested meshes: bounding box of the BHEs plus `margin`.
+
+    Args:
+        domain (tuple): (x_min, x_max, y_min, y_max) of the regional model.
+
+    Returns:
+        tuple: (x_min, x_max, y_min, y_max)
+    """
+    x = np.array([p.x() for p in locations])
+    y = np.array([p.y() for p in locations])
+    bounds = (x.min() - margin, x.max() + margin, y.min() - margin, y.max() + margin)
+    if bounds[0] <= domain[0] or bounds[1] >= domain[1] or \
+            bounds[2] <= domain[2] or bounds[3] >= domain[3]:
+        raise ValueError(f"field patch {tuple(round(b, 1) for b in bounds)} m is not inside "
+                         f"the regional domain {tuple(round(b, 1) for b in domain)} m")
+    return bounds
+
+
+def inside(points, bounds, distance=0.0):
+    """Points at least `distance` inside the rectangle bounds."""
+    x_min, x_max, y_min, y_max = bounds
+    return (points[:, 0] > x_min + distance) & (points[:, 0] < x_max - distance) & \
+        (points[:, 1] > y_min + distance) & (points[:, 1] < y_max - distance)
+
+
+def transfer(coords_from, cells_from, coords_to, nodes):
+    """
+    Interpolation of a P1 field onto the vertices `nodes` of another mesh,
+    zero rows elsewhere: shape (n_vertices_to, n_vertices_from).
+    """
+    P = probe_matrix(coords_from, cells_from, coords_to[nodes]).tocoo()
+    return csr_matrix((P.data, (np.asarray(nodes)[P.row], P.col)),
+                      shape=(len(coords_to), len(coords_from)))
+
+
+def composite_operator(points, fine, coarse, bounds):
+    """
+    Evaluation operator of the composite field [T_fine; T_coarse]: points in
+    the patch from the fine level, all others from the coarse level.
+
+    Args:
+        fine, coarse (tuple): (coords, cells) of the levels.
+    """
+    in_patch = inside(points, bounds)
+    n_fine, n_coarse = len(fine[0]), len(coarse[0])
+    P = csr_matrix((len(points), n_fine + n_coarse))
+    rows = np.arange(len(points))
+    for mask, (coords, cells), columns in ((in_patch, fine, 0), (~in_patch, coarse, n_fine)):
+        if mask.any():
+            P_level = probe_matrix(coords, cells, points[mask]).tocoo()
+            P = P + csr_matrix((P_level.data, (rows[mask][P_level.row], columns + P_level.col)),
+                               shape=P.shape)
+    return P
+
+
+def advective_flux(coords, cells, heat_capacity_density, convection_coefficient, velocity):
+    """
+    Advective heat flow out of the patch, ∮ ρc b (v·n) (T - T_0) ds, as a
+    linear functional g: flux = g·T - T_0 Σg. The patch boundary carries the
+    regional temperatures, so unlike the far field of the single mesh the
+    plume crosses it.
+    """
+    edges, _, _, normal, length = sf.boundary_edges(coords, cells)
+    _, g = sf.edge_mass(coords, edges, length, heat_capacity_density * convection_coefficient *
+                        (normal @ np.asarray(velocity, dtype=float)))
+    return g
+
+
+class CoarseLevel:
+    """
+    Regional model on the coarse mesh: implicit Euler system with the far
+    field T_0 on the outer boundary and Dirichlet rows on the vertices
+    inside the field patch (their values come from the fine level).
+    """
+
+    def __init__(self, coords, cells, boundary_lines, inner_nodes, dt, diffusion_coefficient,
+                 convection_coefficient, velocity, T_0):
+        self.coords, self.cells = coords, cells
+        mass_matrix, diffusion_matrix, convection_matrix = sf.assemble(coords, cells, velocity)
+        A = mass_matrix + dt * diffusion_coefficient * diffusion_matrix + \
+            dt * convection_coefficient * convection_matrix
+
+        outer_nodes = np.unique(boundary_lines)
+        self.inner_nodes = np.asarray(inner_nodes)
+        fixed = np.union1d(outer_nodes, self.inner_nodes)
+        self.lu = splu(sf.apply_dirichlet(A, fixed).tocsc())
+        mask = np.ones(len(coords))
+        mask[fixed] = 0.0
+        # b = diag(mask) M T^n + far field
+        self.M = (diags(mask) @ mass_matrix).tocsr()
+        self.offset = np.zeros(len(coords))
+        self.offset[outer_nodes] = T_0
+
+
+class SchwarzStepper:
+    """
+    Overlapping Schwarz coupling of the fine field patch and the coarse
+    regional model per implicit Euler step:
+
+        coarse: A_c T_c = mask_c M_c T_c^n + T_0 (outer) + I_fc T_f (inner region)
+        fine:   A_f T_f = mask_f (M_f T_f^n + s Q^n) + I_cf T_c (patch boundary)
+
+    alternated until the interface values change by less than `tolerance`.
+    The Dirichlet node sets are fixed, so each level keeps one factorization
+    and only the interface values change. The coarse state is kept by the
+    stepper, the fine state is the state of the time loop.
+    """
+
+    def __init__(self, fine, coarse, to_coarse, to_fine, tolerance=1e-3, max_iterations=10):
+        """
+        Args:
+            fine (SparseSystem): system of the field patch (Dirichlet rows on its boundary).
+            coarse (CoarseLevel): regional model.
+            to_coarse (csr_matrix): fine state -> inner region of the coarse level.
+            to_fine (csr_matrix): coarse state -> boundary of the patch.
+        """
+        self.fine = fine
+        self.lu_fine = fine.stepper.lu
+        self.coarse = coarse
+        self.to_coarse = to_coarse
+        self.to_fine = to_fine
+        self.tolerance = tolerance
+        self.max_iterations = max(int(max_iterations), 1)
+        self.T_coarse = None
+        self.n_steps = 0
+        self.n_iterations = 0
+        self.n_unconverged = 0
+
+    def start(self, T_0):
+        self.T_coarse = np.full(len(self.coarse.coords), T_0)
+
+    def step(self, T_1, Q):
+        """
+        Args:
+            T_1 (np.ndarray): previous fine states, shape (n_dofs, K).
+            Q (np.ndarray): source strength per scenario, shape (K,).
+        """
+        if self.T_coarse.ndim == 1:
+            self.T_coarse = np.tile(self.T_coarse[:, None], (1, T_1.shape[1]))
+        fine = self.fine
+        b_fine = fine.mask[:, None] * (fine.mass_matrix @ T_1 + np.outer(fine.source, Q))
+        b_coarse = self.coarse.M @ self.T_coarse + self.coarse.offset[:, None]
+
+        T_fine = T_1
+        interface = self.to_coarse @ T_fine
+        for iteration in range(1, self.max_iterations + 1):
+            T_coarse = self.coarse.lu.solve(b_coarse + interface)
+            T_fine = self.lu_fine.solve(b_fine + self.to_fine @ T_coarse)
+            update = self.to_coarse @ T_fine
+            change = np.abs(update - interface).max(initial=0.0)
+            interface = update
+            if change < self.tolerance:
+                break
+        else:
+            self.n_unconverged += 1
+
+        self.n_steps += 1
+        self.n_iterations += iteration
+        self.T_coarse = T_coarse
+        return T_fine
@@ -0,0 +1,289 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from scipy.sparse.linalg import splu
+
+from src.simulation import sparse_fem as sf
+
+# memory of the cached Woodbury columns A_ref⁻¹ e_i (dense, n_dofs each)
+COLUMN_CACHE_BYTES = 256 * 2 ** 20
+
+
+class FreezingGround:
+    """
+    Temperature-dependent ground properties with a freezing band
+    [T_f - ΔT, T_f] of the pore water:
+
+        f(T)  = clip((T_f - T) / ΔT, 0, 1)             frozen fraction
+        λ(T)  = λ_u + f(T) (λ_f - λ_u)
+        ρc(T) = ρc_u + f(T) (ρc_f - ρc_u)
+        H(T)  = ∫_{T_f}^{T} ρc dτ - L f(T)             enthalpy in J/m³
+
+    with the latent heat L = n ρ_w h_f of the pore water.
+    """
+
+    def __init__(self, thermal_conductivity, heat_capacity_density, frozen_conductivity,
+                 frozen_heat_capacity, freezing_temperature, freezing_range, latent_heat):
+        if freezing_range <= 0.0:
+            raise ValueError("nonlinear.freezingRange must be > 0")
+        self.conductivity_unfrozen = thermal_conductivity
+        self.conductivity_frozen = frozen_conductivity
+        self.capacity_unfrozen = heat_capacity_density
+        self.capacity_frozen = frozen_heat_capacity
+        self.T_f = freezing_temperature
+        self.dT = freezing_range
+        self.latent_heat = latent_heat
+
+    def frozen_fraction(self, T):
+        return np.clip((self.T_f - T) / self.dT, 0.0, 1.0)
+
+    def conductivity(self, T):
+        return self.conductivity_unfrozen + self.frozen_fraction(T) * \
+            (self.conductivity_frozen - self.conductivity_unfrozen)
+
+    def enthalpy(self, T):
+        # d: depth into the band, e: distance below the band
+        d = np.clip(self.T_f - T, 0.0, self.dT)
+        e = np.maximum(self.T_f - self.dT - T, 0.0)
+        return self.capacity_unfrozen * (T - self.T_f) - \
+            (self.capacity_frozen - self.capacity_unfrozen) * (d**2 / (2.0 * self.dT) + e) - \
+            self.latent_heat * d / self.dT
+
+    def apparent_capacity(self, T):
+        in_band = (T < self.T_f) & (T > self.T_f - self.dT)
+        return self.capacity_unfrozen + self.frozen_fraction(T) * \
+            (self.capacity_frozen - self.capacity_unfrozen) + in_band * self.latent_heat / self.dT
+
+    def secant_capacity(self, T_a, T_b):
+        """(H(T_b) - H(T_a)) / (T_b - T_a): conserves the enthalpy change of a step."""
+        difference = T_b - T_a
+        close = np.abs(difference) < 1e-9
+        secant = (self.enthalpy(T_b) - self.enthalpy(T_a)) / np.where(close, 1.0, difference)
+        secant = np.where(close, self.apparent_capacity(T_b), secant)
+        # exact values outside the band (cells without phase change stay linear)
+        secant = np.where((T_a >= self.T_f) & (T_b >= self.T_f), self.capacity_unfrozen, secant)
+        return np.where((T_a <= self.T_f - self.dT) & (T_b <= self.T_f - self.dT),
+                        self.capacity_frozen, secant)
+
+
+def create_ground(params_si, thermal_conductivity, heat_capacity_density):
+    """FreezingGround of the "nonlinear" block, None if it is disabled."""
+    nonlinear = params_si.get("nonlinear", {})
+    if not nonlinear.get("enabled", False):
+        return None
+    water_density = params_si.groundwater.density.value
+    return FreezingGround(
+        thermal_conductivity=thermal_conductivity,
+        heat_capacity_density=heat_capacity_density,
+        frozen_conductivity=nonlinear.frozenThermalConductivity.value,
+        frozen_heat_capacity=nonlinear.frozenHeatCapacityDensity.value,
+        freezing_temperature=nonlinear.freezingTemperature.value,
+        freezing_range=nonlinear.freezingRange.value,
+        latent_heat=params_si.ground.porosity.value * water_density * nonlinear.latentHeat.value
+    )
+
+
+class NonlinearStepper:
+    """
+    Implicit Euler step with temperature-dependent λ(T) and ρc(T) (single
+    load, same interface as EnsembleStepper):
+
+        M_c (T^{n+1} - T^n) + Δt (K_λ / ρc_0 + b C) T^{n+1} = Δt s Q / ρc_0
+
+    M_c is the mass matrix weighted per cell with the secant capacity between
+    the cell temperatures of T^n and T^{n+1} / ρc_0 (enthalpy-conserving
+    latent heat), K_λ the stiffness matrix weighted with λ(T^{n+1}) / ρc_0.
+
+    The coefficients of a cell are re-evaluated only when its mean temperature
+    moved more than `threshold` since the last evaluation (lagged elsewhere).
+    The cells whose coefficients differ from those of the factorized
+    reference operator form a correction E = A - A_ref on a few vertices S;
+    the Picard iterations solve with A_ref and the capacitance matrix of E
+    (Woodbury), the columns A_ref⁻¹ e_i of S are cached across iterations and
+    steps (least recently used first out, at most `cache_bytes`). The
+    reference is refactorized with the current coefficients when S exceeds
+    `max_correction_dofs` vertices or the columns that fit into the cache. Without deviating cells a step is
+    a single solve, as in the linear model.
+
+    After every step `w_storage` (∫ρc T dx functional of the step) and
+    `g_flux` (boundary heat flow) hold the energy-balance functionals.
+    `conduction` = (boundary cells, λ per cell -> g_flux) updates the
+    Dirichlet boundary heat flow when λ of a boundary cell changes.
+    """
+
+    def __init__(self, ground, coords, cells, A, M, source, mask, offset, time_step,
+                 heat_capacity_density, g_flux, conduction=None,
+                 threshold=0.05, tolerance=1e-3, max_iterations=20, max_correction_dofs=200,
+                 cache_bytes=COLUMN_CACHE_BYTES):
+        if int(max_iterations) < 1:
+            raise ValueError(f"nonlinear.maxIterations must be at least 1, got {max_iterations}")
+        self.ground = ground
+        self.cells = cells
+        self.dt = time_step
+        self.rho_c = heat_capacity_density
+        self.source = np.asarray(source, dtype=float)
+        self.mask = np.asarray(mask, dtype=float)
+        self.offset = np.asarray(offset, dtype=float)
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self.max_iterations = int(max_iterations)
+        self.conduction = conduction
+
+        # element matrices of unit coefficients for the sparse corrections
+        n = len(coords)
+        self.cache_columns = max(int(cache_bytes // (8 * n)), 1)
+        self.max_correction_dofs = min(int(max_correction_dofs), self.cache_columns)
+        area, grad = sf.gradients(coords, cells)
+        self.M_local = area[:, None, None] / 12.0 * (np.ones((3, 3)) + np.eye(3))
+        self.K_local = area[:, None, None] * np.einsum("cik,cjk->cij", grad, grad)
+        self.rows = np.repeat(cells, 3, axis=1)
+        self.cols = np.tile(cells, (1, 3))
+        self.shape = (n, n)
+
+        # reference: the linear operator A with the unfrozen properties
+        n_cells = len(cells)
+        self.capacity_ref = np.full(n_cells, ground.capacity_unfrozen / heat_capacity_density)
+        self.kappa_ref = np.full(n_cells, ground.conductivity_unfrozen / heat_capacity_density)
+        self.A_ref = A.tocsr()
+        self.M_ref = M.tocsr()
+        self.lu = splu(self.A_ref.tocsc())
+        self.columns = OrderedDict()
+        self.w_ref = heat_capacity_density * np.asarray(self.M_ref.sum(axis=0)).ravel()
+
+        # lagged coefficients and the cell temperatures they were evaluated at
+        self.capacity = self.capacity_ref.copy()
+        self.kappa = self.kappa_ref.copy()
+        self.T_old_eval = np.full(n_cells, np.nan)
+        self.T_new_eval = np.full(n_cells, np.nan)
+        self.boundary_kappa = None
+
+        self.w_storage = self.w_ref
+        self.g_flux = np.asarray(g_flux, dtype=float)
+        self.n_steps = 0
+        self.n_iterations = 0
+        self.n_factorizations = 1
+        self.n_unconverged = 0
+
+    def _evaluate(self, T_old_cells, T_new_cells):
+        # re-evaluates the cells that moved past the threshold, True if a coefficient changed
+        moved = np.flatnonzero(~(np.abs(T_old_cells - self.T_old_eval) <= self.threshold) |
+                               ~(np.abs(T_new_cells - self.T_new_eval) <= self.threshold))
+        if len(moved) == 0:
+            return False
+        self.T_old_eval[moved] = T_old_cells[moved]
+        self.T_new_eval[moved] = T_new_cells[moved]
+        capacity = self.ground.secant_capacity(T_old_cells[moved], T_new_cells[moved]) / self.rho_c
+        kappa = self.ground.conductivity(T_new_cells[moved]) / self.rho_c
+        changed = np.any(capacity != self.capacity[moved]) or np.any(kappa != self.kappa[moved])
+        self.capacity[moved] = capacity
+        self.kappa[moved] = kappa
+        return changed
+
+    def _corrections(self):
+        # (vertices S, ΔM, E = mask (ΔM + Δt ΔK)) of the cells deviating from the reference
+        deviating = np.flatnonzero((self.capacity != self.capacity_ref) | (self.kappa != self.kappa_ref))
+        if len(deviating) == 0:
+            return deviating, None, None
+        rows, cols = self.rows[deviating].ravel(), self.cols[deviating].ravel()
+        delta_M = csr_matrix((((self.capacity - self.capacity_ref)[deviating, None, None] *
+                               self.M_local[deviating]).ravel(), (rows, cols)), shape=self.shape)
+        delta_K = csr_matrix((((self.kappa - self.kappa_ref)[deviating, None, None] *
+                               self.K_local[deviating]).ravel(), (rows, cols)), shape=self.shape)
+        return np.unique(self.cells[deviating]), delta_M, \
+            (diags(self.mask) @ (delta_M + self.dt * delta_K)).tocsr()
+
+    def _refactorize(self, delta_M, E):
+        # current coefficients become the reference
+        self.A_ref = (self.A_ref + E).tocsr()
+        self.M_ref = (self.M_ref + delta_M).tocsr()
+        self.w_ref = self.rho_c * np.asarray(self.M_ref.sum(axis=0)).ravel()
+        self.capacity_ref = self.capacity.copy()
+        self.kappa_ref = self.kappa.copy()
+        self.lu = splu(self.A_ref.tocsc())
+        self.columns.clear()
+        self.n_factorizations += 1
+
+    def _solve(self, r, dofs, E):
+        # (A_ref + E)⁻¹ r with E supported on the vertices `dofs` (Woodbury)
+        y = self.lu.solve(r)
+        if E is None:
+            return y
+        missing = [i for i in dofs if i not in self.columns]
+        if missing:
+            unit = np.zeros((self.shape[0], len(missing)))
+            unit[missing, np.arange(len(missing))] = 1.0
+            for i, column in zip(missing, self.lu.solve(unit).T):
+                self.columns[i] = column
+        for i in dofs:
+            self.columns.move_to_end(i)
+        Z = np.column_stack([self.columns[i] for i in dofs])
+        # at most max_correction_dofs <= cache_columns are in use
+        while len(self.columns) > self.cache_columns:
+            self.columns.popitem(last=False)
+        D = E[dofs][:, dofs].toarray()
+        capacitance = np.eye(len(dofs)) + D @ Z[dofs]
+        return y - Z @ np.linalg.solve(capacitance, D @ y[dofs])
+
+    def _update_flux(self):
+        # boundary heat flow with λ of the boundary cells (Dirichlet far field)
+        if self.conduction is None:
+            return
+        cells, function = self.conduction
+        kappa = self.kappa[cells]
+        if self.boundary_kappa is None or np.any(kappa != self.boundary_kappa):
+            self.boundary_kappa = kappa.copy()
+            self.g_flux = function(self.kappa * self.rho_c)
+
+    def step(self, T_1, Q):
+        """
+        Args:
+            T_1 (np.ndarray): previous state, shape (n_dofs, 1).
+            Q (np.ndarray): source strength, shape (1,).
+        """
+        T_old = np.asarray(T_1, dtype=float)[:, 0]
+        T_old_cells = T_old[self.cells].mean(axis=1)
+        load = self.source * float(np.asarray(Q).ravel()[0])
+        T = T_old.copy()
+        self._evaluate(T_old_cells, T_old_cells)
+
+        converged = False
+        storage = None
+        relaxation, previous = 1.0, np.inf
+        for iteration in range(1, self.max_iterations + 1):
+            dofs, delta_M, E = self._corrections()
+            if len(dofs) > self.max_correction_dofs:
+                self._refactorize(delta_M, E)
+                dofs, delta_M, E = self._corrections()
+
+            # Picard iteration: residual of the current coefficients, exact corrected solve
+            b = self.M_ref @ T_old + load
+            A_T = self.A_ref @ T
+            if E is not None:
+                b = b + delta_M @ T_old
+                A_T = A_T + E @ T
+            correction = self._solve(self.mask * b + self.offset - A_T, dofs, E)
+            self.n_iterations += 1
+            step_size = np.max(np.abs(correction))
+
+            # under-relaxation against oscillations at the edges of the freezing band
+            if step_size > 0.9 * previous:
+                relaxation = max(0.5 * relaxation, 0.125)
+            T = T + relaxation * correction
+            previous = step_size
+            storage = delta_M
+
+            changed = self._evaluate(T_old_cells, T[self.cells].mean(axis=1))
+            if (relaxation == 1.0 and not changed) or step_size < self.tolerance:
+                converged = True
+                break
+
+        if not converged:
+            self.n_unconverged += 1
+
+        # energy functionals of the coefficients of the last solve
+        self.w_storage = self.w_ref if storage is None else \
+            self.w_ref + self.rho_c * np.asarray(storage.sum(axis=0)).ravel()
+        self._update_flux()
+        self.n_steps += 1
+        return T[:, None]
@@ -0,0 +1,239 @@
+import itertools
+import json
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from os import cpu_count, makedirs, path
+
+import numpy as np
+from box import Box
+
+from src.simulation import linesource as ls
+from src.simulation import mesh as msh
+from src.simulation.utils.catalog import KELVIN, summarize
+from src.simulation.utils.convert_to_si import convert_value_unit
+from src.simulation.utils.run_store import run_key
+
+OBJECTIVES = ("W_el", "extraction")
+
+
+def candidates(optimization):
+    """Layouts of the search space: all combinations of the "optimization" lists."""
+    distance = optimization.get("boreholeDistance", {})
+    # the list is not converted with the parameter file
+    distances = [convert_value_unit(float(d), distance.get("unit", "m"))[0]
+                 for d in np.atleast_1d(distance.get("value", [5.0]))]
+    return [dict(layout=layout, rings=int(rings), distance=float(distance),
+                 outer_factor=float(outer_factor))
+            for layout, rings, distance, outer_factor in itertools.product(
+                optimization.get("layouts", ["hexa"]), optimization.get("rings", [2]),
+                distances, optimization.get("outerLoadFactors", [1.0]))]
+
+
+@lru_cache(maxsize=None)
+def n_boreholes(layout, rings):
+    return len(msh.generate_layout((layout, rings), 0.0, 0.0, 1.0)[0])
+
+
+def scale_load(parameters, factor):
+    """Scales the load of a (raw or SI) parameter set in place."""
+    if parameters.get("load", {}).get("source", "sinusoidal") == "sinusoidal":
+        parameters.power.coefficientA.value *= factor
+        parameters.power.coefficientB.value *= factor
+    else:
+        parameters.load.scale = parameters.load.get("scale", 1.0) * factor
+
+
+def candidate_parameters(parameters, candidate, load_factor=1.0, engine=None):
+    """Copy of a (raw or SI) parameter set with the candidate layout and a scaled load."""
+    p = Box(deepcopy(parameters.to_dict()))
+    p.meshMode = [candidate["layout"], candidate["rings"]]
+    p.mesh.boreholeDistance.value = candidate["distance"]
+    p.power.outerLoadFactor = {"value": candidate["outer_factor"], "unit": "1"}
+    if engine is not None:
+        p.engine = engine
+    scale_load(p, load_factor)
+    return p
+
+
+def screen(params_si, temperature_min=None, temperature_max=None):
+    """
+    Line-source screening of one layout.
+
+    The model is linear in the load: the temperature changes scale with a
+    load factor s, so the largest factor within the temperature limits is
+    `scale_limit` = min((T_lim - T_0) / ΔT_extreme).
+
+    Returns:
+        dict: n_EWS, T_min, T_max (°C), W_el (ΣW_el in Wh/m), extraction
+              (mean extraction rate of the field in W/m) and scale_limit.
+    """
+    field = ls.borehole_field(params_si)
+    T_0 = params_si.ground.temperature.value
+    dT_min = float(field.Temp_EWS.min()) - T_0
+    dT_max = float(field.Temp_EWS.max()) - T_0
+
+    scale_limit = np.inf
+    if temperature_min is not None and dT_min < 0.0:
+        scale_limit = min(scale_limit, (temperature_min - T_0) / dT_min)
+    if temperature_max is not None and dT_max > 0.0:
+        scale_limit = min(scale_limit, (temperature_max - T_0) / dT_max)
+
+    Q = field.Q[:, None] * field.load_shares[None, :]
+    return dict(n_EWS=len(field.sources), T_min=T_0 + dT_min - KELVIN, T_max=T_0 + dT_max - KELVIN,
+                W_el=float(field.W_el.sum()),
+                extraction=float(-np.clip(Q, None, 0.0).sum() / field.time_steps),
+                scale_limit=float(max(scale_limit, 0.0)))
+
+
+def _screen(task):
+    # worker of the process pool
+    params_si, temperature_min, temperature_max = task
+    return screen(Box(params_si), temperature_min, temperature_max)
+
+
+class ScreeningCache:
+    """Screening results by run key in <results>/optimization/screening.json."""
+
+    def __init__(self, results_dir):
+        self.file_name = path.join(results_dir, "optimization", "screening.json")
+        self.entries = {}
+        if path.exists(self.file_name):
+            with open(self.file_name, "r") as f:
+                self.entries = json.load(f)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        self.entries[key] = value
+
+    def save(self):
+        makedirs(path.dirname(self.file_name), exist_ok=True)
+        with open(self.file_name, "w") as f:
+            json.dump(self.entries, f, indent=2)
+
+
+def rank(results, objective, target=None):
+    """
+    Feasible candidates in the order of the objective:
+
+        W_el        same field load for all layouts, within the temperature
+                    limits, least electric energy |ΣW_el|
+        extraction  largest sustainable extraction (load factor at the
+                    temperature limits); with a target the smallest field
+                    that reaches it
+    """
+    if objective == "W_el":
+        feasible = [r for r in results if r["screening"]["scale_limit"] >= 1.0]
+        return sorted(feasible, key=lambda r: abs(r["screening"]["W_el"]))
+
+    for r in results:
+        r["max_extraction"] = r["screening"]["extraction"] * r["load_factor"] * \
+            r["screening"]["scale_limit"]
+    if target:
+        feasible = [r for r in results if r["max_extraction"] >= target]
+        return sorted(feasible, key=lambda r: (r["screening"]["n_EWS"], -r["max_extraction"]))
+    return sorted([r for r in results if r["max_extraction"] > 0.0],
+                  key=lambda r: -r["max_extraction"])
+
+
+def optimize(params, params_si, run, results_dir, workers=None, confirm=None):
+    """
+    Layout optimization of the "optimization" block: screening of all
+    candidates with the line-source model in parallel (cached by run key),
+    then the best `confirm` candidates with the engine of the parameter file.
+
+    Args:
+        run (callable): (params, params_si) -> result file of a full run or None.
+
+    Returns:
+        list: ranked candidates with screening and confirmation metrics.
+    """
+    optimization = params_si.get("optimization", {})
+    objective = optimization.get("objective", "W_el")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective '{objective}', use one of {list(OBJECTIVES)}")
+    temperature_min = optimization.get("temperatureMin", {}).get("value", None)
+    temperature_max = optimization.get("temperatureMax", {}).get("value", None)
+    target = optimization.get("extractionTarget", {}).get("value", None)
+    if objective == "extraction" and temperature_min is None and temperature_max is None:
+        # the model is linear in the load: without a limit the extraction is unbounded
+        raise ValueError('objective "extraction" requires "temperatureMin" or "temperatureMax"')
+    workers = workers or int(optimization.get("workers", 0)) or cpu_count()
+    confirm = int(optimization.get("confirm", 3) if confirm is None else confirm)
+
+    # W_el: every layout delivers the load of the reference layout of the parameter file
+    n_reference = n_boreholes(*params_si.meshMode)
+    results = []
+    for candidate in candidates(optimization):
+        load_factor = n_reference / n_boreholes(candidate["layout"], candidate["rings"]) \
+            if objective == "W_el" else 1.0
+        results.append(dict(candidate=candidate, load_factor=load_factor))
+
+    cache = ScreeningCache(results_dir)
+    tasks = []
+    for r in results:
+        p = candidate_parameters(params_si, r["candidate"], r["load_factor"], engine="linesource")
+        r["key"] = run_key(p)
+        r["screening"] = cache.get(r["key"])
+        if r["screening"] is None:
+            tasks.append((r, (p.to_dict(), temperature_min, temperature_max)))
+    print(f"Optimization ({objective}): {len(results)} candidates, "
+          f"{len(results) - len(tasks)} cached, screening {len(tasks)} on {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (r, _), screening in zip(tasks, pool.map(_screen, [task for _, task in tasks])):
+            r["screening"] = screening
+            cache.put(r["key"], screening)
+    cache.save()
+
+    ranked = rank(results, objective, target)
+    print(f"{len(ranked)} feasible candidates")
+
+    # confirmation with the full model (run store: repeated candidates are reused)
+    engine = params_si.get("engine", "fem")
+    if engine != "linesource":
+        for r in ranked[:confirm]:
+            load_factor = r["load_factor"]
+            if objective == "extraction":
+                # target load, otherwise the largest load within the limits
+                load_factor *= min(target / r["screening"]["extraction"], r["screening"]["scale_limit"]) \
+                    if target else r["screening"]["scale_limit"]
+                if not np.isfinite(load_factor):
+                    # the layout never reaches the limit that is set, no finite load to confirm
+                    continue
+            h5_path = run(candidate_parameters(params, r["candidate"], load_factor),
+                          candidate_parameters(params_si, r["candidate"], load_factor))
+            if h5_path is None:
+                r["confirmed"] = dict(engine=engine, aborted=True)
+                continue
+            steps_per_year = int(round(365 * 86400.0 / params_si.time.timeStepHours.value))
+            _, T_min, T_max, W_el, E_probe, _ = summarize(h5_path, steps_per_year)[0][0]
+            T_min, T_max, W_el, E_probe = map(float, (T_min, T_max, W_el, E_probe))
+            r["confirmed"] = dict(
+                engine=engine, h5_path=h5_path, load_factor=load_factor, T_min=T_min, T_max=T_max,
+                W_el=W_el, E_probe=E_probe,
+                feasible=(temperature_min is None or T_min >= temperature_min - KELVIN) and
+                         (temperature_max is None or T_max <= temperature_max - KELVIN))
+
+    report = path.join(results_dir, "optimization", "optimization.json")
+    with open(report, "w") as f:
+        json.dump(dict(objective=objective, candidates=ranked), f, indent=2)
+    print_ranking(ranked)
+    print(f"Report: {report}")
+    return ranked
+
+
+def print_ranking(ranked, n=10):
+    print(f"\n{'#':>3} {'layout':>8} {'rings':>5} {'d (m)':>6} {'outer':>6} {'BHEs':>5} "
+          f"{'T_min':>7} {'|W_el|':>10} {'extr.':>8} {'confirmed':>10}")
+    for i, r in enumerate(ranked[:n], start=1):
+        c, s = r["candidate"], r["screening"]
+        confirmed = r.get("confirmed")
+        status = "-" if confirmed is None else \
+            "aborted" if confirmed.get("aborted") else \
+            f"{confirmed['T_min']:.2f} °C" + ("" if confirmed["feasible"] else " (!)")
+        extraction = r.get("max_extraction", s["extraction"] * r["load_factor"])
+        print(f"{i:>3} {c['layout']:>8} {c['rings']:>5} {c['distance']:>6.1f} {c['outer_factor']:>6.2f} "
+              f"{s['n_EWS']:>5} {s['T_min']:>7.2f} {abs(s['W_el']):>10.0f} {extraction:>8.1f} {status:>10}")
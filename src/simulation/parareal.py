@@ -0,0 +1,133 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.simulation.ensemble import EnsembleStepper
+
+# fine propagator of a worker process (SuperLU factorizations cannot be pickled)
+_FINE = {}
+
+
+def _init_fine(A, M, source, mask, offset, Q_scaled, P_ews, w_storage, g_flux,
+               flux_offset, snapshot_steps, P_monitor=None, monitor_every=1):
+    _FINE.update(
+        stepper=EnsembleStepper(A, M, source, mask, offset),
+        Q_scaled=Q_scaled, P_ews=P_ews, w_storage=w_storage, g_flux=g_flux,
+        flux_offset=flux_offset, snapshot_steps=snapshot_steps,
+        P_monitor=P_monitor, monitor_every=monitor_every
+    )
+
+
+def _fine_slice(task):
+    """
+    Fine propagation of one time slice with output.
+
+    Returns:
+        tuple: (end state, Temp_EWS (n, n_EWS), ΔE_ground (n,), boundary heat flow (n,),
+                {step: vertex values} of the snapshots in the slice,
+                (recorded steps, monitoring values (n_recorded, n_points)))
+    """
+    first_step, last_step, T_start = task
+    fine = _FINE
+    n = last_step - first_step + 1
+
+    Temp_EWS = np.empty((n, fine["P_ews"].shape[0]), dtype=np.float32)
+    E_ground = np.empty(n)
+    flux = np.empty(n)
+    snapshots = {}
+    monitor_steps, monitor_values = [], []
+
+    T = np.asarray(T_start, dtype=float)[:, None]
+    for i, step in enumerate(range(first_step, last_step + 1)):
+        T_next = fine["stepper"].step(T, fine["Q_scaled"][step - 1:step])
+        Temp_EWS[i] = fine["P_ews"] @ T_next[:, 0]
+        E_ground[i] = fine["w_storage"] @ (T[:, 0] - T_next[:, 0])
+        flux[i] = fine["g_flux"] @ T_next[:, 0] + fine["flux_offset"]
+        if step in fine["snapshot_steps"]:
+            snapshots[step] = T_next[:, 0].copy()
+        if fine["P_monitor"] is not None and step % fine["monitor_every"] == 0:
+            monitor_steps.append(step)
+            monitor_values.append((fine["P_monitor"] @ T_next[:, 0]).astype(np.float32))
+        T = T_next
+    monitoring = (np.array(monitor_steps), np.array(monitor_values, dtype=np.float32))
+    return T[:, 0], Temp_EWS, E_ground, flux, snapshots, monitoring
+
+
+def coarse_loads(Q_scaled, first_step, last_step, coarse_factor):
+    """Mean load per coarse step (groups of `coarse_factor` fine steps) and group sizes."""
+    q = Q_scaled[first_step - 1:last_step]
+    sizes = np.full(int(np.ceil(len(q) / coarse_factor)), coarse_factor)
+    sizes[-1] = len(q) - coarse_factor * (len(sizes) - 1)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    return np.add.reduceat(q, starts) / sizes, sizes
+
+
+def run_parareal(fine_system, coarse_steppers, slices, T_init, tolerance, max_iterations,
+                 coarse_factor, workers=None):
+    """
+    Parareal iteration over time slices (e.g. years):
+
+        U_{j+1}^{k+1} = G(U_j^{k+1}) + F(U_j^k) - G(U_j^k)
+
+    The fine propagator F (model time step) runs for all open slices in
+    parallel worker processes, the coarse propagator G (coarse_factor x dt)
+    runs serially. After iteration k the first k slices are exact and are not
+    recomputed. Stops when the start states change by less than `tolerance`
+    (max norm, K).
+
+    Args:
+        fine_system (dict): keyword arguments of _init_fine.
+        coarse_steppers (dict): {number of fine steps per coarse step: EnsembleStepper}.
+        slices (list): [(first step, last step)].
+
+    Returns:
+        list: fine output of every slice (see _fine_slice).
+    """
+    Q_scaled = fine_system["Q_scaled"]
+
+    def coarse(j, U):
+        first_step, last_step = slices[j]
+        q, sizes = coarse_loads(Q_scaled, first_step, last_step, coarse_factor)
+        T = np.asarray(U, dtype=float)[:, None]
+        for q_c, size in zip(q, sizes):
+            # the source term scales with the step length
+            T = coarse_steppers[size].step(T, np.array([q_c * size]))
+        return T[:, 0]
+
+    n_slices = len(slices)
+    U = [np.asarray(T_init, dtype=float)]
+    for j in range(n_slices):
+        U.append(coarse(j, U[j]))
+    G_previous = U[1:]
+
+    results = [None] * n_slices
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_fine,
+                             initargs=tuple(fine_system[key] for key in (
+                                 "A", "M", "source", "mask", "offset", "Q_scaled", "P_ews",
+                                 "w_storage", "g_flux", "flux_offset", "snapshot_steps",
+                                 "P_monitor", "monitor_every"))) as pool:
+        for k in range(max_iterations):
+            # slices 0..k-1 start from exact states and are already done
+            open_slices = range(k, n_slices)
+            tasks = [(slices[j][0], slices[j][1], U[j]) for j in open_slices]
+            for j, result in zip(open_slices, pool.map(_fine_slice, tasks)):
+                results[j] = result
+
+            # serial correction with the coarse propagator
+            U_next = U[:k + 1]
+            change = 0.0
+            for j in range(k, n_slices):
+                G_next = coarse(j, U_next[j])
+                U_next.append(G_next + results[j][0] - G_previous[j])
+                G_previous[j] = G_next
+                change = max(change, float(np.max(np.abs(U_next[j + 1] - U[j + 1]))))
+            U = U_next
+
+            print(f"parareal iteration {k + 1}: max. change of the slice start states = {change:.2e} K")
+            if change < tolerance or k + 1 == n_slices:
+                return results
+
+    print(f"Warning: parareal not converged after {max_iterations} iterations")
+    return results
@@ -0,0 +1,179 @@
+import numpy as np
+
+
+class YearlyTrend:
+    """
+    Reduced model of the one-year map T_{n+1} = M T_n + c built from the
+    year-over-year changes d_k = T_{k+1} - T_k of the first simulated years.
+
+    With D = [d_0 .. d_{m-1}] and M D ≈ D G the start-of-year states are
+    T_n ≈ T_p + D G^n y, with the periodic state T_p = T_0 - D y and
+    y = -(I - G)^{-1} e_1. Years that were actually simulated are exact.
+    """
+
+    def __init__(self, T_init, differences):
+        self.T_init = np.asarray(T_init, dtype=float)
+        self.differences = np.column_stack(differences)
+        self.D = self.differences
+        m = self.D.shape[1] - 1
+
+        # least squares fit of M D ≈ D G in the (truncated) range of D
+        U, s, Vt = np.linalg.svd(self.D[:, :m], full_matrices=False)
+        keep = s > s[0] * 1e-10
+        U, s, Vt = U[:, keep], s[keep], Vt[keep]
+        self.G = Vt.T @ ((U.T @ self.D[:, 1:]) / s[:, None])
+
+        e_1 = np.zeros(m)
+        e_1[0] = 1.0
+        self.y = -np.linalg.lstsq(np.eye(m) - self.G, e_1, rcond=None)[0]
+        self.D = self.D[:, :m]
+        self.T_periodic = self.T_init - self.D @ self.y
+
+    @property
+    def years_simulated(self):
+        # the fit uses one difference less than the years advanced
+        return self.differences.shape[1]
+
+    def state(self, n):
+        """Start-of-year state after n years of operation (n = 0: initial state)."""
+        if n <= self.years_simulated:
+            return self.T_init + self.differences[:, :n].sum(axis=1)
+        return self.T_periodic + self.D @ (np.linalg.matrix_power(self.G, n) @ self.y)
+
+
+def extrapolate_periodic_state(advance_year, T_init, tolerance, max_years, min_years=3):
+    """
+    Runs the one-year map until the extrapolated periodic state changes by
+    less than `tolerance` (max norm, K) between two consecutive years.
+
+    Args:
+        advance_year (callable): maps a start-of-year state to the next one.
+        T_init (np.ndarray): initial state.
+        tolerance (float): convergence tolerance in K.
+        max_years (int): maximum number of simulated years.
+        min_years (int): minimum number of year-over-year changes.
+
+    Returns:
+        YearlyTrend: reduced model with the periodic state and the yearly trend.
+    """
+    T_n = np.asarray(T_init, dtype=float)
+    differences = []
+    trend = None
+    T_previous = None
+
+    for year in range(1, max_years + 1):
+        T_next = advance_year(T_n)
+        differences.append(T_next - T_n)
+        T_n = T_next
+
+        change = float(np.max(np.abs(differences[-1])))
+        if change < tolerance and len(differences) >= 2:
+            trend = YearlyTrend(T_init, differences)
+            print(f"Periodic regime reached after {year} years (ΔT = {change:.2e} K)")
+            return trend
+
+        if len(differences) <= min_years:
+            continue
+
+        trend = YearlyTrend(T_init, differences)
+        if T_previous is not None:
+            change = float(np.max(np.abs(trend.T_periodic - T_previous)))
+            print(f"year {year}: change of extrapolated periodic state = {change:.2e} K")
+            if change < tolerance:
+                return trend
+        T_previous = trend.T_periodic
+
+    if trend is None:
+        raise ValueError(
+            f"periodic.maxYears = {max_years} is too small for the extrapolation (min. {min_years + 1})")
+    print(f"Warning: periodic extrapolation not converged after {max_years} years")
+    return trend
+
+
+def shoot_periodic_state(advance_year, T_init, tolerance, max_iterations):
+    """
+    Newton-Krylov shooting on the one-year map: solves (I - M) u = d_0 with
+    GMRES, where every matrix-vector product is one simulated year.
+
+    The residual is measured as RMS temperature in K.
+
+    Returns:
+        np.ndarray: periodic start-of-year state.
+    """
+    T_init = np.asarray(T_init, dtype=float)
+    T_1 = advance_year(T_init)
+    d_0 = T_1 - T_init
+    n = d_0.size
+
+    beta = np.linalg.norm(d_0)
+    if beta / np.sqrt(n) < tolerance:
+        return T_1
+
+    # Arnoldi basis and Hessenberg matrix
+    V = [d_0 / beta]
+    H = np.zeros((max_iterations + 1, max_iterations))
+    u = np.zeros(n)
+
+    for k in range(max_iterations):
+        w = V[k] - (advance_year(T_init + V[k]) - T_1)
+        for j in range(k + 1):
+            H[j, k] = np.dot(V[j], w)
+            w -= H[j, k] * V[j]
+        H[k + 1, k] = np.linalg.norm(w)
+
+        rhs = np.zeros(k + 2)
+        rhs[0] = beta
+        coeffs, *_ = np.linalg.lstsq(H[:k + 2, :k + 1], rhs, rcond=None)
+        residual = np.linalg.norm(H[:k + 2, :k + 1] @ coeffs - rhs) / np.sqrt(n)
+        u = np.column_stack(V) @ coeffs
+        print(f"shooting iteration {k + 1}: residual = {residual:.2e} K")
+
+        if residual < tolerance or H[k + 1, k] == 0.0:
+            return T_init + u
+        V.append(w / H[k + 1, k])
+
+    print(f"Warning: periodic shooting not converged after {max_iterations} iterations")
+    return T_init + u
+
+
+def periodic_segments(periodic, advance_year, T_init, steps_per_year, time_steps):
+    """
+    Solves for the periodic regime as configured in the `periodic` block and
+    returns the segments that are simulated with output.
+
+    Without `targetYears` the extrapolation writes the last year of the
+    simulation period, the shooting method one year of the periodic regime.
+
+    Returns:
+        tuple: (YearlyTrend or None, segments [(first step, last step, start state)],
+                snapshot steps or None for the default snapshots,
+                written years or None for the year of the periodic regime)
+    """
+    trend = None
+    tolerance = periodic.tolerance.value
+    max_years = int(periodic.get("maxYears", 30))
+
+    if periodic.get("method", "extrapolation") == "shooting":
+        T_periodic = shoot_periodic_state(
+            advance_year, T_init, tolerance, max_iterations=max_years)
+    else:
+        trend = extrapolate_periodic_state(
+            advance_year, T_init, tolerance, max_years=max_years)
+        T_periodic = trend.T_periodic
+
+    target_years = sorted(int(y) for y in periodic.get("targetYears", []))
+    if not target_years and trend is not None:
+        target_years = [max(time_steps // steps_per_year, 1)]
+    if target_years:
+        if trend is None:
+            raise ValueError(
+                "periodic.targetYears requires the method 'extrapolation'")
+        if target_years[-1] * steps_per_year > time_steps:
+            raise ValueError(
+                f"periodic.targetYears {target_years} exceed simulationYears")
+        segments = [((year - 1) * steps_per_year + 1, year * steps_per_year, trend.state(year - 1))
+                    for year in target_years]
+        return trend, segments, None, target_years
+
+    # write one year of the periodic regime
+    return trend, [(1, steps_per_year, T_periodic)], {steps_per_year: "T_vertex_periodic"}, None
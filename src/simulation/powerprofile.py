@@ -1,61 +1,230 @@
 import numpy as np
-from src.simulation.utils.paths import RESULTS_DIR, PARAMETER_FILE, TEMP_DIR, BASE_DIR
-from scipy.integrate import simps
+from src.simulation.utils.paths import BASE_DIR
+from itertools import islice
 import os
 
 
-def powerprofile(A: float, B: float):
-    powerprofile = {}
-    days = np.arange(1, 366, dtype=int)  # 1..365
-    resulting_power = A - np.cos(2 * np.pi / 365 * days) * B
-
-    powerprofile = {int(d): float(v) for d, v in zip(days, resulting_power)}
-
-    output_dir = RESULTS_DIR
-    os.makedirs(output_dir, exist_ok=True)
-
-    return powerprofile
-
-
-def multiple_powerprofile(years: int, A: float, B: float):
-    # Basis-Jahresprofil
-    dict_year = powerprofile(A, B)
-
-    base_vals = np.array(list(dict_year.values()), dtype=float)  # Länge 365
-    total_days = years * 365
-    days = np.arange(1, total_days + 1, dtype=int)
-    resulting_power = np.tile(base_vals, years)
-
-    # geordnetes Dict
-    powerprofile_multi = {int(d): float(v)
-                          for d, v in zip(days, resulting_power)}
-
-    # Positive/Negative Anteile
-    positive_integral = np.clip(resulting_power, 0.0, None)
-    negative_integral = np.clip(resulting_power, None, 0.0)
-
-    # Integrale
-    Q_in = float(simps(positive_integral, days))
-    Q_out = float(simps(negative_integral, days))
+YEAR = 365 * 86400.0
+TIME_UNITS = {"s": 1.0, "min": 60.0, "h": 3600.0, "day": 86400.0}
+
+
+class SinusoidalLoad:
+    """
+    Built-in load profile q(t) = A - B cos(2π t / t_year) in W/m,
+    evaluated at the end of every time step (step 1 ends at t = Δt).
+    """
+
+    def __init__(self, A: float, B: float, time_step: float):
+        self.A = A
+        self.B = B
+        self.time_step = time_step
+
+    def powers(self, first_step: int, last_step: int) -> np.ndarray:
+        t = np.arange(first_step, last_step + 1) * self.time_step
+        return self.A - np.cos(2 * np.pi * t / YEAR) * self.B
+
+    def power(self, step: int) -> float:
+        return float(self.powers(step, step)[0])
+
+
+class TimeSeriesLoad:
+    """
+    Measured or forecast load series (W/m) streamed from CSV or HDF5 and
+    resampled on the fly to the model time step.
+
+    Every sample holds its value until the next time stamp (the last one for
+    the preceding interval), the power of a time step is the mean over
+    ((step - 1) Δt, step Δt]. Only a window of samples is kept in memory;
+    going back in time restarts the stream. With `repeat` the series is
+    continued periodically (e.g. a single measured year).
+    """
+
+    def __init__(self, path: str, time_step: float, file_format="csv",
+                 time_column="time", power_column="power", time_unit="h",
+                 repeat=False, scale=1.0, chunk_size=100_000):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Load series not found: {path}")
+        if time_unit not in TIME_UNITS:
+            raise ValueError(f"Unknown timeUnit '{time_unit}', use one of {list(TIME_UNITS)}")
+
+        self.path = path
+        self.file_format = file_format
+        self.time_step = time_step
+        self.time_column = time_column
+        self.power_column = power_column
+        self.time_factor = TIME_UNITS[time_unit]
+        self.scale = scale
+        self.chunk_size = chunk_size
+
+        self.period = None
+        self.period_energy = 0.0
+        if repeat:
+            # one streaming pass for duration and energy of a period
+            self._restart()
+            while self._read_chunk():
+                self._t, self._p, self._F = self._t[-2:], self._p[-2:], self._F[-2:]
+            self.period = self._t_end - self._t0
+            self.period_energy = self._integral(self.period)
+        self._restart()
+
+    # ---- streaming ----
+
+    def _chunks(self):
+        if self.file_format == "hdf5":
+            import h5py
+            with h5py.File(self.path, "r") as h5:
+                t_ds, p_ds = h5[self.time_column], h5[self.power_column]
+                for i in range(0, t_ds.shape[0], self.chunk_size):
+                    yield t_ds[i:i + self.chunk_size], p_ds[i:i + self.chunk_size]
+        else:
+            with open(self.path, "r") as f:
+                header = [c.strip() for c in f.readline().split(",")]
+                columns = (header.index(self.time_column),
+                           header.index(self.power_column))
+                while True:
+                    lines = list(islice(f, self.chunk_size))
+                    if not lines:
+                        break
+                    data = np.loadtxt(lines, delimiter=",", usecols=columns, ndmin=2)
+                    yield data[:, 0], data[:, 1]
+
+    def _restart(self):
+        self._stream = self._chunks()
+        self._t = np.empty(0)
+        self._p = np.empty(0)
+        self._F = np.empty(0)       # ∫ q dt from the first sample to _t
+        self._t0 = None
+        self._t_end = None
+        self._exhausted = False
+        self._read_chunk()
+        if self._t.size < 2:
+            raise ValueError(f"Load series {self.path} needs at least two samples")
+
+    def _read_chunk(self):
+        chunk = next(self._stream, None)
+        if chunk is None:
+            self._exhausted = True
+            return False
+
+        t = np.asarray(chunk[0], dtype=float) * self.time_factor
+        p = np.asarray(chunk[1], dtype=float) * self.scale
+        if self._t0 is None:
+            self._t0 = t[0]
+
+        t_all = np.concatenate([self._t, t])
+        p_all = np.concatenate([self._p, p])
+        if np.any(np.diff(t_all) <= 0):
+            raise ValueError(f"Time stamps in {self.path} must be strictly increasing")
+
+        F_start = self._F[-1] if self._F.size else 0.0
+        n_old = max(self._t.size - 1, 0)
+        F_new = F_start + np.concatenate(
+            [[0.0], np.cumsum(p_all[n_old:-1] * np.diff(t_all[n_old:]))])
+
+        self._F = np.concatenate([self._F[:n_old], F_new])
+        self._t, self._p = t_all, p_all
+        # the last sample holds for the preceding interval
+        if t_all.size > 1:
+            self._t_end = t_all[-1] + (t_all[-1] - t_all[-2])
+        return True
+
+    def _integral(self, t):
+        """∫ q dt from the first sample to t (t relative to the series start)."""
+        t = t + self._t0
+        while t > self._t[-1] and not self._exhausted:
+            self._read_chunk()
+        if t > self._t_end * (1 + 1e-12):
+            raise ValueError(
+                f"Load series {self.path} ends at {(self._t_end - self._t0) / 86400:.2f} days")
+        if t < self._t[0]:
+            self._restart()
+            return self._integral(t - self._t0)
+
+        i = np.searchsorted(self._t, t, side="right") - 1
+        return self._F[i] + self._p[i] * (t - self._t[i])
+
+    def _cumulative(self, t):
+        if self.period is None:
+            return self._integral(t)
+        n, t_rel = divmod(t, self.period)
+        return n * self.period_energy + self._integral(t_rel)
+
+    def power(self, step: int) -> float:
+        t_0 = (step - 1) * self.time_step
+        t_1 = step * self.time_step
+        F_0 = self._cumulative(t_0)
+        q = (self._cumulative(t_1) - F_0) / self.time_step
+
+        # drop samples before the current one
+        t_now = t_1 % self.period if self.period else t_1
+        i = np.searchsorted(self._t, self._t0 + t_now, side="right") - 1
+        if i > 0:
+            self._t, self._p, self._F = self._t[i:], self._p[i:], self._F[i:]
+        return float(q)
+
+    def powers(self, first_step: int, last_step: int) -> np.ndarray:
+        return np.array([self.power(step) for step in range(first_step, last_step + 1)])
+
+
+def create_load(params_si, base_dir=BASE_DIR):
+    """Load model from the `load` block of the parameter file (default: sinusoidal)."""
+    load = params_si.get("load", {})
+    source = load.get("source", "sinusoidal")
+    time_step = params_si.time.timeStepHours.value
+
+    if source == "sinusoidal":
+        return SinusoidalLoad(
+            A=params_si.power.coefficientA.value,
+            B=params_si.power.coefficientB.value,
+            time_step=time_step
+        )
+
+    if source in ("csv", "hdf5"):
+        return TimeSeriesLoad(
+            path=os.path.join(base_dir, load.path),
+            time_step=time_step,
+            file_format=source,
+            time_column=load.get("timeColumn", "time"),
+            power_column=load.get("powerColumn", "power"),
+            time_unit=load.get("timeUnit", "h"),
+            repeat=load.get("repeat", False),
+            scale=load.get("scale", 1.0)
+        )
+
+    raise ValueError(f"Unknown load source: {source}")
+
+
+def load_statistics(load, time_steps: int, time_step: float, output_path=None,
+                    chunk_size=8760):
+    """
+    Streams the resampled load once: Q_in, Q_out in kWh m⁻¹ and the heat
+    utilization rate eta. Optionally writes the per-step load as CSV.
+    """
+    Q_in = Q_out = 0.0
+    f = open(output_path, "w") if output_path else None
+    try:
+        if f:
+            f.write("day,power\n")
+        for first in range(1, time_steps + 1, chunk_size):
+            last = min(first + chunk_size - 1, time_steps)
+            q = load.powers(first, last)
+            Q_in += float(np.clip(q, 0.0, None).sum()) * time_step
+            Q_out += float(np.clip(q, None, 0.0).sum()) * time_step
+            if f:
+                days = np.arange(first, last + 1) * time_step / 86400.0
+                np.savetxt(f, np.column_stack([days, q]), delimiter=",", fmt=["%.10g", "%.17g"])
+    finally:
+        if f:
+            f.close()
 
     ratio = float(np.abs(Q_out / Q_in)) if Q_in != 0.0 else float("nan")
 
     # Umrechnung in kWh m⁻¹
-    Q_in *= 24 / 1000
-    Q_out *= 24 / 1000
+    Q_in /= 3600.0 * 1000.0
+    Q_out /= 3600.0 * 1000.0
 
-    # Ergebnisse ausgeben
     print(f"Q_in  = {Q_in:.0f} kWh m⁻¹")
     print(f"Q_out = {Q_out:.0f} kWh m⁻¹")
     print(f"eta   = {ratio:.2f}")
 
-    # Save results
-    output_dir = RESULTS_DIR
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, "powerprofile_multi.csv")
-    with open(output_path, "w") as f:
-        f.write("day,power\n")
-        for day, power in powerprofile_multi.items():
-            f.write(f"{day},{power}\n")
-
-    return powerprofile_multi, ratio, Q_out, Q_in
+    return ratio, Q_out, Q_in
@@ -0,0 +1,617 @@
+import json
+from os import remove
+from typing import NamedTuple
+
+import numpy as np
+from alive_progress import alive_bar
+from box import Box
+from psutil import cpu_percent, virtual_memory
+
+from src.simulation import adaptivity as ad
+from src.simulation import ensemble as ens
+from src.simulation import farfield as ff
+from src.simulation import flow as fl
+from src.simulation import mesh as msh
+from src.simulation import monitoring as mon
+from src.simulation import nested as nst
+from src.simulation import nonlinear as nl
+from src.simulation import parareal as pr
+from src.simulation import periodic as per
+from src.simulation import powerprofile as pp
+from src.simulation import sparse_fem as sf
+from src.simulation import watchdog as wd
+from src.simulation.model_setup import (ModelSetup, borehole_mode, create_writer, prepare_model,
+                                        resolved_boreholes)
+from src.simulation.utils.probes import ews_probe_matrix, probe_matrix
+from src.simulation.utils.tools import P_el_array
+
+
+class SparseSystem(NamedTuple):
+    """Mesh-dependent part of the sparse engine: operators, sources, probes and far field."""
+    coords: np.ndarray
+    cells: np.ndarray
+    mass_matrix: object
+    source: np.ndarray
+    P_ews: object
+    near_field: float
+    w_storage: np.ndarray
+    A_matrix: object
+    mask: np.ndarray
+    offset: np.ndarray
+    g_flux: np.ndarray
+    flux_offset: float
+    stepper: object
+    linear_system: object
+    far_field: object
+    check_peclet: object
+    conduction: object
+
+
+def sparse_system(params_si: Box, model: ModelSetup, coords, cells, curves, report=True):
+    """
+    Assembles the sparse engine on a mesh (coords, cells, physical curves),
+    again for every mesh of an adaptive run.
+    """
+
+    boundary_lines = curves.get(1, np.empty((0, 2), dtype=cells.dtype))
+
+    # resolved boreholes: walls BOREHOLE_TAG + k of the BHEs in layout order
+    wall_lines = None
+    if resolved_boreholes(params_si):
+        walls = [curves[msh.BOREHOLE_TAG + k] for k in range(1, len(model.ews_locations) + 1)]
+        wall_lines = np.vstack(walls)
+    n_dofs = len(coords)
+    dt = params_si.time.timeStepHours.value
+    T_0 = params_si.ground.temperature.value
+    print(f"Sparse P1 engine: {n_dofs} vertices, {len(cells)} triangles")
+
+    # velocity of the convection term (b is applied separately, as in the FEniCS forms)
+    v_x, v_y = (params_si.groundwater.velocityX.value, params_si.groundwater.velocityY.value) \
+        if params_si.enableConvection is True else (0.0, 0.0)
+    mass_matrix, diffusion_matrix, _ = sf.assemble(coords, cells)
+    # C(v) = v_x C_x + v_y C_y, recombined for every velocity state of a flow series
+    convection_x, convection_y = sf.convection_matrices(coords, cells)
+
+    edges, owner, _, normal, length = sf.boundary_edges(coords, cells)
+    # longest edge (mesh.hmax() of FEniCS)
+    max_distance = max(np.linalg.norm(coords[cells[:, i]] - coords[cells[:, j]], axis=1).max()
+                       for i, j in [(0, 1), (1, 2), (2, 0)])
+
+    def check_peclet(v, report=False):
+        peclet_number = max(v) * max_distance / model.diffusionCoefficient
+        if peclet_number > 2.0:
+            raise wd.SimulationAborted(
+                "peclet", f"peclet_number_max = {peclet_number:.2f} \n Warning: calculation numerical unstable",
+                details={"peclet_number": peclet_number, "velocity": list(v)})
+        if report:
+            print(f"peclet_number_max = {peclet_number:.2f}")
+
+    if params_si.enableConvection is True:
+        check_peclet((v_x, v_y), report=report)
+    elif report:
+        print(f"Ne_max = {model.diffusionCoefficient * dt / max_distance**2:.2f}")
+
+    # far field on the physical curve 1 (symmetry lines stay natural)
+    far = sf.select_edges(edges, boundary_lines)
+    if model.robin_boundary:
+        centre = np.array([model.x_center, model.y_center])
+        midpoint = 0.5 * (coords[edges[far, 0]] + coords[edges[far, 1]])
+        r_vec = midpoint - centre
+        r = np.linalg.norm(r_vec, axis=1)
+        r_normal = np.einsum("ek,ek->e", r_vec, normal[far]) / r
+    else:
+        dirichlet_nodes = np.unique(boundary_lines)
+        # far field only: symmetry lines are adiabatic, borehole walls carry the source
+        conduction_flux = sf.conduction_flux(coords, cells, model.thermalConductivity, lines=boundary_lines)
+
+    def wall_flux(v):
+        # the uniform Darcy velocity crosses resolved holes: advective heat flow over the walls
+        if wall_lines is None or params_si.enableConvection is not True:
+            return 0.0
+        wall = sf.select_edges(edges, wall_lines)
+        _, g = sf.edge_mass(coords, edges[wall], length[wall], model.heatCapacityDensity *
+                            model.convection_value * (normal[wall] @ np.asarray(v, dtype=float)))
+        return g
+
+    def far_field(v):
+        # (robin_matrix, robin_vector, g_flux, flux_offset) of the velocity v
+        if not model.robin_boundary:
+            return None, None, conduction_flux + wall_flux(v), 0.0
+        advection_n = model.convection_value * (normal[far] @ np.asarray(v, dtype=float))
+        h_robin = ff.robin_coefficient(
+            r=r,
+            thermal_conductivity=model.thermalConductivity,
+            diffusion_coefficient=model.diffusionCoefficient,
+            convection_velocity=model.convection_value * np.hypot(*v),
+            simulation_time=params_si.time.simulationYears.value
+        ) * r_normal - model.thermalConductivity * advection_n / (2 * model.diffusionCoefficient)
+
+        robin_matrix, robin_vector = sf.edge_mass(coords, edges[far], length[far], h_robin)
+        _, g = sf.edge_mass(coords, edges[far], length[far],
+                            h_robin + model.heatCapacityDensity * advection_n)
+        return robin_matrix, robin_vector, g + wall_flux(v), -T_0 * g.sum()
+
+    def linear_system(dt_step, v=(v_x, v_y)):
+        # A = M + dt (a K + b C) with the far field, RHS treatment b -> mask * b + offset
+        A = mass_matrix + dt_step * model.diffusionCoefficient * diffusion_matrix + \
+            dt_step * model.convection_value * (v[0] * convection_x + v[1] * convection_y)
+        mask = np.ones(n_dofs)
+        offset = np.zeros(n_dofs)
+        robin_matrix, robin_vector, _, _ = far_field(v)
+        if model.robin_boundary:
+            A = A + dt_step / model.heatCapacityDensity * robin_matrix
+            offset = dt_step / model.heatCapacityDensity * T_0 * robin_vector
+        else:
+            A = sf.apply_dirichlet(A, dirichlet_nodes)
+            mask[dirichlet_nodes] = 0.0
+            offset[dirichlet_nodes] = T_0
+        return A, mask, offset
+
+    _, _, g_flux, flux_offset = far_field((v_x, v_y))
+
+    # point sources, BHE temperatures and stored energy
+    r_EWS = params_si.power.pipeRadius.value
+    mode = borehole_mode(params_si)
+    near_field = 0.0
+    if mode == "points":
+        source = probe_matrix(coords, cells, [(p.x(), p.y()) for p in model.ews_locations]).T @ \
+            np.asarray(model.ews_weights)
+        P_ews = ews_probe_matrix(coords, cells, model.ews_locations, r_EWS, model.symmetry)[model.ews_mirror]
+    elif mode in ("gaussian", "disc"):
+        # regularized sources assembled once; wall temperature = weighted mean over
+        # the source + analytical near-field correction R_near * q
+        smoothing_radius = params_si.boreholeGeometry.smoothingRadius.value
+        P_source = sf.smoothed_sources(coords, cells, [(p.x(), p.y()) for p in model.ews_locations],
+                                       smoothing_radius, mode)
+        source = P_source.T @ np.asarray(model.ews_weights)
+        P_ews = P_source[model.ews_mirror]
+        near_field = sf.near_field_resistance(mode, smoothing_radius, r_EWS, model.thermalConductivity)
+        if report:
+            print(f"{mode} sources, R = {smoothing_radius} m, near-field resistance {near_field:.4f} K/(W/m)")
+    else:
+        # flux boundary condition: the heat flow of a BHE spread uniformly over
+        # its wall, wall temperature = mean over the wall
+        P_wall = sf.curve_average(coords, walls)
+        source = P_wall.T @ np.asarray(model.ews_weights)
+        P_ews = P_wall[model.ews_mirror]
+    w_storage = model.heatCapacityDensity * np.asarray(mass_matrix.sum(axis=0)).ravel()
+
+    A_matrix, mask, offset = linear_system(dt)
+    stepper = ens.EnsembleStepper(A_matrix, mass_matrix, source, mask, offset)
+
+    # boundary flux with a temperature-dependent conductivity (Dirichlet far field)
+    conduction = None if model.robin_boundary else \
+        (np.unique(owner[far]), lambda conductivity: sf.conduction_flux(
+            coords, cells, conductivity, lines=boundary_lines) + wall_flux((v_x, v_y)))
+
+    return SparseSystem(coords, cells, mass_matrix, source, P_ews, near_field, w_storage,
+                        A_matrix, mask, offset, g_flux, flux_offset, stepper, linear_system,
+                        far_field, check_peclet, conduction)
+
+
+def nested_levels(params_si: Box, model: ModelSetup):
+    """
+    Nested meshes: coarse regional mesh of the whole domain and a fine mesh of
+    the field patch, coupled by a SchwarzStepper.
+
+    Returns:
+        tuple: (SparseSystem of the patch with the Schwarz stepper and the
+               patch boundary flux, CoarseLevel, patch bounds)
+    """
+    nested = params_si.nested
+    dt = params_si.time.timeStepHours.value
+    T_0 = params_si.ground.temperature.value
+    margin = nested.patchMargin.value
+    overlap = nested.overlap.value
+    if not 0.0 < overlap < margin:
+        raise ValueError(f"nested.overlap ({overlap} m) must be between 0 and nested.patchMargin ({margin} m)")
+
+    coarse_size = nested.coarseSize.value
+    coarse_file = model.remesh(sizes=(coarse_size, coarse_size))
+    coarse_coords, coarse_cells, coarse_curves = sf.read_mesh_curves(coarse_file)
+    remove(coarse_file)
+    peclet_number = max(model.velocity) * coarse_size / model.diffusionCoefficient
+    if peclet_number > 2.0:
+        raise wd.SimulationAborted(
+            "peclet", f"peclet_number_max = {peclet_number:.2f} of the coarse level (nested.coarseSize)",
+            details={"peclet_number": peclet_number, "velocity": list(model.velocity)})
+
+    domain = (coarse_coords[:, 0].min(), coarse_coords[:, 0].max(),
+              coarse_coords[:, 1].min(), coarse_coords[:, 1].max())
+    bounds = nst.patch_bounds(model.locations, margin, domain)
+    fine_file = model.remesh(bounds=bounds)
+    coords, cells, curves = sf.read_mesh_curves(fine_file)
+    remove(fine_file)
+    # the patch boundary takes the regional temperatures (Dirichlet rows)
+    fine = sparse_system(params_si, model._replace(robin_boundary=False), coords, cells, curves)
+
+    inner_nodes = np.flatnonzero(nst.inside(coarse_coords, bounds, overlap))
+    coarse = nst.CoarseLevel(coarse_coords, coarse_cells, coarse_curves[1], inner_nodes, dt,
+                             model.diffusionCoefficient, model.convection_value, model.velocity, T_0)
+    stepper = nst.SchwarzStepper(
+        fine, coarse,
+        to_coarse=nst.transfer(coords, cells, coarse_coords, inner_nodes),
+        to_fine=nst.transfer(coarse_coords, coarse_cells, coords, np.unique(curves[1])),
+        tolerance=nested.get("tolerance", {}).get("value", 1e-3),
+        max_iterations=nested.get("maxIterations", 10))
+    stepper.start(T_0)
+    print(f"Nested meshes: patch {len(coords)} vertices, regional {len(coarse_coords)} vertices, "
+          f"{len(inner_nodes)} coupled")
+
+    g_advection = nst.advective_flux(coords, cells, model.heatCapacityDensity,
+                                     model.convection_value, model.velocity)
+    return fine._replace(stepper=stepper, g_flux=fine.g_flux + g_advection,
+                         flux_offset=-T_0 * g_advection.sum()), coarse, bounds
+
+
+def run_sparse(params: Box, params_si: Box, base_folder: str):
+    """
+    FEniCS-free P1 engine: same model, boundary conditions, probes and energy
+    check as the FEniCS engine, assembled with NumPy/SciPy on the gmsh mesh.
+    """
+    nested = params_si.get("nested", {}).get("enabled", False)
+    model = prepare_model(params_si, base_folder, convert_mesh=False, mesh=not nested)
+
+    dt = params_si.time.timeStepHours.value
+    T_0 = params_si.ground.temperature.value
+
+    coarse = None
+    if nested:
+        system, coarse, patch = nested_levels(params_si, model)
+    else:
+        coords, cells, curves = sf.read_mesh_curves(model.mesh_file)
+        remove(model.mesh_file)
+        system = sparse_system(params_si, model, coords, cells, curves)
+    T_init = np.full(len(system.coords), T_0)
+
+    # time-varying groundwater flow: one factorized system per velocity state
+    flow = None
+    velocity_series = fl.create_velocity_series(params_si)
+    if velocity_series is not None:
+
+        def flow_system(v):
+            system.check_peclet(v)
+            A_flow, mask_flow, offset_flow = system.linear_system(dt, v)
+            _, _, g_flow, offset_flux = system.far_field(v)
+            return (ens.EnsembleStepper(A_flow, system.mass_matrix, system.source, mask_flow, offset_flow),
+                    g_flow, offset_flux)
+
+        flow_series = params_si.flowSeries
+        flow = fl.FlowStates(flow_system, velocity_series,
+                             tolerance=flow_series.get("tolerance", {}).get("value", 0.0),
+                             cache_size=flow_series.get("cacheSize", 8))
+
+    # temperature-dependent ground properties (freezing band), one load only
+    ground = nl.create_ground(params_si, model.thermalConductivity, model.heatCapacityDensity)
+    if ground is not None:
+        nonlinear = params_si.nonlinear
+        system = system._replace(stepper=nl.NonlinearStepper(
+            ground, system.coords, system.cells, system.A_matrix, system.mass_matrix, system.source,
+            system.mask, system.offset, dt, model.heatCapacityDensity, system.g_flux,
+            conduction=system.conduction,
+            threshold=nonlinear.get("updateThreshold", {}).get("value", 0.05),
+            tolerance=nonlinear.get("tolerance", {}).get("value", 1e-3),
+            max_iterations=nonlinear.get("maxIterations", 20),
+            max_correction_dofs=nonlinear.get("maxCorrectionDofs", 200)
+        ))
+    stepper = system.stepper
+
+    segments = [(1, model.time_steps, None)]
+    snapshot_steps = {model.steps_per_year * year: f"T_vertex_{float(year):.1f}a"
+                      for year in [1, 10, 20, 30, 40]}
+
+    trend = None
+    periodic = params_si.get("periodic", {})
+    if periodic.get("enabled", False):
+
+        def advance_year(T_start):
+            # one-year map without output: T(start of year) -> T(end of year)
+            T_state = np.asarray(T_start, dtype=float)[:, None]
+            for step in range(1, model.steps_per_year + 1):
+                step_system = stepper if flow is None else flow.at(step)[0]
+                T_state = step_system.step(
+                    T_state, np.array([model.load.power(step) * dt / model.heatCapacityDensity]))
+            return T_state[:, 0]
+
+        trend, segments, periodic_snapshots, periodic_years = per.periodic_segments(
+            periodic, advance_year, T_init, model.steps_per_year, model.time_steps)
+        if periodic_snapshots is not None:
+            snapshot_steps = periodic_snapshots
+
+    scenario_names, loads = None, [model.load]
+    if params_si.get("ensemble", {}).get("enabled", False):
+        scenario_names, scenario_params = ens.scenario_parameters(params_si)
+        loads = [pp.create_load(p) for p in scenario_params]
+        print(f"Ensemble with {len(scenario_names)} scenarios: {', '.join(scenario_names)}")
+
+    # error-driven remeshing during the run
+    adaptivity = None
+    settings = params_si.get("adaptivity", {})
+    if settings.get("enabled", False):
+
+        def remesh_to(size_field):
+            adapted_file = model.remesh(size_field=size_field)
+            adapted = sf.read_mesh_curves(adapted_file)
+            remove(adapted_file)
+            return adapted
+
+        adaptivity = ad.Adaptivity(
+            settings, system, remesh_to,
+            lambda *mesh: sparse_system(params_si, model, *mesh, report=False),
+            steps_per_interval=round(settings.interval.value / dt), T_0=T_0,
+            symmetry_factor=model.symmetry_factor)
+
+    writer = create_writer(params, params_si, base_folder, len(model.locations), model.steps_per_year,
+                           scenario_names)
+    writer.set_metadata("engine", "sparse")
+    writer.set_metadata("boundary", "robin" if model.robin_boundary else "dirichlet")
+    writer.set_metadata("num_vertices", len(system.coords))
+    writer.set_metadata("num_cells", len(system.cells))
+    writer.set_metadata("boreholes", borehole_mode(params_si))
+    # nested meshes: monitoring points outside the patch are evaluated on the regional level
+    monitor = mon.create_monitor(params_si, writer, *((system.coords, system.cells) if coarse is None else
+                                                      (coarse.coords, coarse.cells)), model.symmetry)
+    if coarse is not None:
+        writer.set_metadata("nested", json.dumps(dict(
+            patch=[float(b) for b in patch], regional_vertices=len(coarse.coords),
+            regional_cells=len(coarse.cells))))
+        if monitor is not None:
+            monitor.operator = nst.composite_operator(
+                np.vstack([points for _, points, _ in monitor.groups]),
+                (system.coords, system.cells), (coarse.coords, coarse.cells), patch)
+    if periodic.get("enabled", False):
+        writer.set_metadata("periodic", periodic.get("method", "extrapolation"))
+        # the file holds these years only, not the whole simulation period
+        writer.set_metadata("periodic_years", "periodic regime" if periodic_years is None
+                            else json.dumps(periodic_years))
+    if flow is not None:
+        writer.set_metadata("flow", params_si.flowSeries.get("source", "seasonal"))
+    if ground is not None:
+        writer.set_metadata("nonlinear", "freezing")
+    if scenario_names is not None:
+        writer.set_metadata("scenarios", json.dumps(scenario_names))
+
+    if trend is not None:
+        # start-of-year borehole temperatures of the yearly trend
+        years = np.arange(model.time_steps // model.steps_per_year + 1)
+        # near-field correction with the load of the last step of the previous year
+        writer.add_periodic_trend(years, np.array(
+            [system.P_ews @ trend.state(n) + system.near_field *
+             (model.load.power(n * model.steps_per_year) if n else 0.0) * model.load_shares
+             for n in years], dtype=np.float32))
+
+    if params_si.get("parareal", {}).get("enabled", False):
+        _run_parareal(writer, params_si, model, system, T_init, snapshot_steps, monitor)
+        print("Calculation finished.")
+        return
+
+    run_linear_steps(
+        writer, params_si, model, step_operators(system), loads, T_init, segments, snapshot_steps,
+        scenario_names, monitor, flow, nonlinear=ground is not None, adaptivity=adaptivity,
+        nested=coarse is not None)
+    if flow is not None:
+        print(f"Flow series: {flow.n_switches} state switches, "
+              f"{flow.n_factorizations} factorizations")
+    if coarse is not None:
+        print(f"Nested meshes: {stepper.n_iterations / max(stepper.n_steps, 1):.2f} Schwarz "
+              f"iterations per step, {stepper.n_unconverged} steps not converged")
+    if adaptivity is not None:
+        print(f"Adaptivity: {len(adaptivity.history)} remeshings, "
+              f"{len(adaptivity.system.coords)} vertices at the end")
+    if ground is not None:
+        print(f"Nonlinear ground: {stepper.n_iterations / max(stepper.n_steps, 1):.2f} iterations "
+              f"per step, {stepper.n_factorizations} factorizations, "
+              f"{stepper.n_unconverged} steps not converged")
+    print("Calculation finished.")
+
+
+def _run_parareal(writer, params_si, model, system, T_init, snapshot_steps, monitor):
+    # year-long slices, fine propagators in parallel, coarse propagator with coarseFactor x dt
+    parareal = params_si.parareal
+    dt = params_si.time.timeStepHours.value
+    n_EWS = len(model.locations)
+    writer.set_metadata("parareal", "enabled")
+    Q = model.load.powers(1, model.time_steps)
+    Q_scaled = Q * dt / model.heatCapacityDensity
+    slices = [(first, min(first + model.steps_per_year - 1, model.time_steps))
+              for first in range(1, model.time_steps + 1, model.steps_per_year)]
+    coarse_factor = int(parareal.get("coarseFactor", 10))
+
+    coarse_steppers = {}
+    for first, last in slices:
+        for size in pr.coarse_loads(Q_scaled, first, last, coarse_factor)[1]:
+            if size not in coarse_steppers:
+                A_coarse, mask_coarse, offset_coarse = system.linear_system(size * dt)
+                coarse_steppers[size] = ens.EnsembleStepper(
+                    A_coarse, system.mass_matrix, system.source, mask_coarse, offset_coarse)
+
+    # one check per slice: the warm-up counts slices
+    watchdog = wd.Watchdog(params_si, per_block=True)
+    try:
+        results = pr.run_parareal(
+            fine_system=dict(A=system.A_matrix, M=system.mass_matrix, source=system.source,
+                             mask=system.mask, offset=system.offset, Q_scaled=Q_scaled,
+                             P_ews=system.P_ews, w_storage=system.w_storage, g_flux=system.g_flux,
+                             flux_offset=system.flux_offset, snapshot_steps=set(snapshot_steps),
+                             P_monitor=None if monitor is None else monitor.operator,
+                             monitor_every=1 if monitor is None else monitor.every),
+            coarse_steppers=coarse_steppers,
+            slices=slices,
+            T_init=T_init,
+            tolerance=parareal.tolerance.value,
+            max_iterations=int(parareal.get("maxIterations", 10)),
+            coarse_factor=coarse_factor,
+            workers=int(parareal.get("workers", 0)) or None
+        )
+
+        for (first, last), (_, Temp_EWS, E_ground, flux, snapshots, monitoring) in zip(slices, results):
+            Q_slice = Q[first - 1:last]
+            Temp_EWS = (Temp_EWS + system.near_field * Q_slice[:, None] *
+                        model.load_shares[None, :]).astype(np.float32)
+            E_ground = model.symmetry_factor * E_ground
+            E_flux = - dt * model.symmetry_factor * flux
+            E_probe = dt * Q_slice * n_EWS
+            writer.append_steps(
+                day=np.arange(first, last + 1) * dt / 86400.0,
+                error=(E_ground + E_flux + E_probe) / (3600.0 * 1000.0),
+                E_probe=E_probe / (3600.0 * 1000.0),
+                E_flux=E_flux / (3600.0 * 1000.0),
+                Delta_E=E_ground / (3600.0 * 1000.0),
+                E_inout=(E_ground + E_probe) / (3600.0 * 1000.0),
+                W_el=P_el_array(
+                    Q=Q_slice[:, None] * model.load_shares[None, :],
+                    T=Temp_EWS,
+                    T_H=params_si.temperatureHot.value,
+                    delta_t=dt,
+                    gamma=params_si.power.efficiency.value
+                ),
+                Temp_EWS=Temp_EWS
+            )
+            for step, values in sorted(snapshots.items()):
+                writer.add_vertex_snapshot_arrays(
+                    snapshot_steps[step], system.coords, system.cells, values, symmetry=model.symmetry)
+            if monitor is not None and len(monitoring[0]):
+                writer.append_monitoring_steps(monitoring[0] * dt / 86400.0, monitoring[1])
+            watchdog.check(last, Temp_EWS=Temp_EWS, error=np.sum(np.abs(E_ground + E_flux + E_probe)),
+                           reference=np.sum(np.abs(E_ground) + np.abs(E_flux) + np.abs(E_probe)))
+    finally:
+        writer.close()
+
+
+class StepOperators(NamedTuple):
+    """State of the time loop on one mesh: stepper, probes and energy functionals."""
+    stepper: object
+    P_ews: object
+    w_storage: np.ndarray
+    g_flux: np.ndarray
+    flux_offset: float
+    coords: np.ndarray
+    cells: np.ndarray
+    vertex_to_dof: np.ndarray
+    near_field: float = 0.0
+
+
+def step_operators(system):
+    """StepOperators of a SparseSystem (vertices are the DOFs)."""
+    return StepOperators(system.stepper, system.P_ews, system.w_storage, system.g_flux,
+                         system.flux_offset, system.coords, system.cells,
+                         np.arange(len(system.coords)), system.near_field)
+
+
+def run_linear_steps(writer, params_si, model, operators, loads, T_init, segments, snapshot_steps,
+                     scenario_names=None, monitor=None, flow=None, nonlinear=False, adaptivity=None,
+                     nested=False):
+    """
+    Time loop on the linear system in SciPy form (sparse engine, ensemble mode).
+
+    All loads are advanced together as a block of right-hand sides. Without
+    scenario names there is a single load and the output has no scenario
+    dimension. The monitoring points are recorded if a monitor is given. With
+    a flow series (FlowStates) the system and the far-field flux of every step
+    follow the velocity state. With `nonlinear` the stepper is a
+    NonlinearStepper and the energy functionals are those of each step.
+    The load shares of the model scale the load per BHE for W_el; the
+    `near_field` of the operators (K per W/m) adds the near-field correction
+    of regularized sources to Temp_EWS. With an Adaptivity the mesh is adapted
+    to the state at its interval, and the operators and monitoring points of
+    the new mesh are used from the next step on. With `nested` the stepper is
+    a SchwarzStepper: monitoring points see the composite of the patch and
+    the regional state, and every snapshot is also written for the regional
+    mesh (suffix "_regional"). The writer is closed at the end.
+    """
+    dt = params_si.time.timeStepHours.value
+    n_EWS = len(model.locations)
+    n_loads = len(loads)
+    shares = np.asarray(model.load_shares)
+
+    def columns(T_start):
+        return np.tile(np.asarray(T_start, dtype=float)[:, None], (1, n_loads))
+
+    def output(values):
+        return values if scenario_names is not None else values[0]
+
+    T_state = columns(T_init)
+    watchdog = wd.Watchdog(params_si)
+    try:
+        with alive_bar(sum(last - first + 1 for first, last, _ in segments),
+                       title='SubTerra is running', bar='smooth') as bar:
+            for first_step, last_step, T_start in segments:
+                if T_start is not None:
+                    T_state = columns(T_start)
+
+                for time_step in range(first_step, last_step + 1):
+                    # show CPU and RAM
+                    cpu = cpu_percent(interval=0.0)
+                    ram = virtual_memory().percent
+                    bar.text(f'(CPU: {cpu:.1f}%, RAM: {ram:.1f}%)')
+
+                    Q_step = np.array([load.power(time_step) for load in loads])
+                    if flow is not None:
+                        stepper, g_flux, flux_offset = flow.at(time_step)
+                        operators = operators._replace(stepper=stepper, g_flux=g_flux,
+                                                       flux_offset=flux_offset)
+                    T_next = operators.stepper.step(T_state, Q_step * dt / model.heatCapacityDensity)
+                    if nonlinear:
+                        operators = operators._replace(w_storage=operators.stepper.w_storage,
+                                                       g_flux=operators.stepper.g_flux)
+
+                    # (n_loads, n_EWS)
+                    Temp_EWS = ((operators.P_ews @ T_next).T +
+                                operators.near_field * Q_step[:, None] * shares[None, :]).astype(np.float32)
+                    W_el = P_el_array(
+                        Q=Q_step[:, None] * shares[None, :],
+                        T=Temp_EWS,
+                        T_H=params_si.temperatureHot.value,
+                        delta_t=dt,
+                        gamma=params_si.power.efficiency.value
+                    ).astype(np.float32)
+
+                    # conversion of energy (reduced domain scaled to the full field)
+                    E_ground = model.symmetry_factor * (operators.w_storage @ (T_state - T_next))
+                    E_flux = - dt * model.symmetry_factor * (operators.g_flux @ T_next + operators.flux_offset)
+                    E_probe = dt * Q_step * n_EWS
+
+                    writer.append_step(
+                        day=time_step * dt / 86400.0,
+                        error=output((E_ground + E_flux + E_probe) / (3600.0 * 1000.0)),
+                        E_probe=output(E_probe / (3600.0 * 1000.0)),
+                        E_flux=output(E_flux / (3600.0 * 1000.0)),
+                        Delta_E=output(E_ground / (3600.0 * 1000.0)),
+                        E_inout=output((E_ground + E_probe) / (3600.0 * 1000.0)),
+                        W_el_row=output(W_el),
+                        Temp_EWS_row=output(Temp_EWS)
+                    )
+                    if monitor is not None:
+                        T_monitor = np.vstack([T_next, operators.stepper.T_coarse]) if nested else T_next
+                        monitor.record(time_step, time_step * dt / 86400.0,
+                                       T_monitor if scenario_names is not None else T_monitor[:, 0])
+                    watchdog.check(time_step, T=T_next, Temp_EWS=Temp_EWS,
+                                   error=E_ground + E_flux + E_probe,
+                                   reference=np.abs(E_ground) + np.abs(E_flux) + np.abs(E_probe))
+                    T_state = T_next
+
+                    # create snapshots
+                    if time_step in snapshot_steps:
+                        for k in range(n_loads):
+                            name = snapshot_steps[time_step]
+                            if scenario_names is not None:
+                                name = f"{name}_{scenario_names[k]}"
+                            writer.add_vertex_snapshot_arrays(
+                                name, operators.coords, operators.cells,
+                                T_state[operators.vertex_to_dof, k], symmetry=model.symmetry)
+                            if nested:
+                                writer.add_vertex_snapshot_arrays(
+                                    f"{name}_regional", operators.stepper.coarse.coords,
+                                    operators.stepper.coarse.cells, operators.stepper.T_coarse[:, k])
+
+                    # adaptive remeshing: state, operators and probes move to the new mesh
+                    if adaptivity is not None and adaptivity.due(time_step) and time_step < last_step:
+                        T_state = adaptivity.adapt(time_step, T_state)
+                        operators = step_operators(adaptivity.system)
+                        if monitor is not None:
+                            monitor.rebuild(operators.coords, operators.cells, model.symmetry)
+                        writer.set_metadata("adaptivity", json.dumps(adaptivity.history))
+                    bar()
+    finally:
+        # always flush pending results, also if the solver fails
+        writer.close()
@@ -0,0 +1,279 @@
+import meshio
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+
+def read_mesh(msh_file, boundary_tag=1):
+    """
+    Reads the gmsh mesh (triangles of the physical surface and the lines of
+    the physical curve `boundary_tag`). Vertices that belong to no triangle
+    are dropped.
+
+    Returns:
+        tuple: (coords (n_vertices, 2), cells (n_cells, 3), boundary lines (n_lines, 2))
+    """
+    coords, cells, curves = read_mesh_curves(msh_file)
+    return coords, cells, curves.get(boundary_tag, np.empty((0, 2), dtype=cells.dtype))
+
+
+def read_mesh_curves(msh_file):
+    """
+    As read_mesh, with the lines of every physical curve (e.g. the borehole
+    walls of the resolved geometry).
+
+    Returns:
+        tuple: (coords (n_vertices, 2), cells (n_cells, 3), {tag: lines (n_lines, 2)})
+    """
+    mesh = meshio.read(msh_file)
+    physical = mesh.cell_data.get("gmsh:physical", [None] * len(mesh.cells))
+
+    cells, lines, line_tags = [], [], []
+    for block, tags in zip(mesh.cells, physical):
+        if block.type == "triangle":
+            cells.append(block.data)
+        elif block.type == "line" and tags is not None:
+            lines.append(block.data)
+            line_tags.append(np.asarray(tags))
+    cells = np.vstack(cells)
+    lines = np.vstack(lines) if lines else np.empty((0, 2), dtype=cells.dtype)
+    line_tags = np.concatenate(line_tags) if line_tags else np.empty(0, dtype=int)
+
+    used, cells = np.unique(cells, return_inverse=True)
+    cells = cells.reshape(-1, 3)
+    renumber = np.full(len(mesh.points), -1)
+    renumber[used] = np.arange(len(used))
+
+    curves = {int(tag): renumber[lines[line_tags == tag]] for tag in np.unique(line_tags)}
+    return mesh.points[used, :2].astype(float), cells, curves
+
+
+def gradients(coords, cells):
+    """
+    Areas and (constant) gradients of the P1 basis functions per triangle.
+
+    Returns:
+        tuple: (area (n_cells,), grad (n_cells, 3, 2))
+    """
+    x = coords[cells]
+    d_1 = x[:, 1] - x[:, 0]
+    d_2 = x[:, 2] - x[:, 0]
+    det = d_1[:, 0] * d_2[:, 1] - d_1[:, 1] * d_2[:, 0]
+
+    grad = np.empty((len(cells), 3, 2))
+    grad[:, 1] = np.column_stack([d_2[:, 1], -d_2[:, 0]]) / det[:, None]
+    grad[:, 2] = np.column_stack([-d_1[:, 1], d_1[:, 0]]) / det[:, None]
+    grad[:, 0] = -grad[:, 1] - grad[:, 2]
+    return 0.5 * np.abs(det), grad
+
+
+def _global(cells, local, n_vertices):
+    # element matrices (n_cells, 3, 3) -> sparse matrix
+    rows = np.repeat(cells, 3, axis=1).ravel()
+    cols = np.tile(cells, (1, 3)).ravel()
+    return csr_matrix((local.ravel(), (rows, cols)), shape=(n_vertices, n_vertices))
+
+
+def assemble(coords, cells, velocity=(0.0, 0.0)):
+    """
+    P1 mass, stiffness and convection matrices:
+
+        M_ij = ∫ φ_j φ_i dx,  K_ij = ∫ ∇φ_j·∇φ_i dx,  C_ij = ∫ (v·∇φ_j) φ_i dx
+
+    Returns:
+        tuple: (M, K, C) as scipy.sparse.csr_matrix
+    """
+    n = len(coords)
+    area, grad = gradients(coords, cells)
+
+    M_local = area[:, None, None] / 12.0 * (np.ones((3, 3)) + np.eye(3))
+    K_local = area[:, None, None] * np.einsum("cik,cjk->cij", grad, grad)
+    v_grad = grad @ np.asarray(velocity, dtype=float)                    # (n_cells, 3)
+    C_local = np.broadcast_to(area[:, None, None] / 3.0 * v_grad[:, None, :], (len(cells), 3, 3))
+
+    return _global(cells, M_local, n), _global(cells, K_local, n), _global(cells, C_local, n)
+
+
+def convection_matrices(coords, cells):
+    """
+    Convection matrices of the unit velocities in x and y: C(v) = v_x C_x + v_y C_y
+    (time-varying flow without reassembly).
+    """
+    n = len(coords)
+    area, grad = gradients(coords, cells)
+    return tuple(_global(cells, np.broadcast_to(area[:, None, None] / 3.0 * grad[:, None, :, axis],
+                                                (len(cells), 3, 3)), n)
+                 for axis in (0, 1))
+
+
+def boundary_edges(coords, cells):
+    """
+    Edges of the outer mesh boundary with their triangle.
+
+    Returns:
+        tuple: (edges (n_edges, 2), owner triangle, local index of the opposite
+                vertex, outward unit normal (n_edges, 2), length)
+    """
+    n_cells = len(cells)
+    edges = np.vstack([cells[:, [1, 2]], cells[:, [2, 0]], cells[:, [0, 1]]])
+    owner = np.tile(np.arange(n_cells), 3)
+    opposite = np.repeat(np.arange(3), n_cells)
+
+    _, inverse, counts = np.unique(np.sort(edges, axis=1), axis=0,
+                                   return_inverse=True, return_counts=True)
+    outer = counts[inverse.ravel()] == 1
+    edges, owner, opposite = edges[outer], owner[outer], opposite[outer]
+
+    # the gradient of the opposite basis function points inwards
+    _, grad = gradients(coords, cells)
+    normal = -grad[owner, opposite]
+    normal /= np.linalg.norm(normal, axis=1)[:, None]
+    length = np.linalg.norm(coords[edges[:, 1]] - coords[edges[:, 0]], axis=1)
+    return edges, owner, opposite, normal, length
+
+
+def select_edges(edges, lines):
+    """Mask of the boundary edges that are contained in `lines` (e.g. physical curve 1)."""
+    n = max(int(edges.max(initial=0)), int(lines.max(initial=0))) + 1
+    keys = np.sort(edges, axis=1) @ np.array([n, 1])
+    return np.isin(keys, np.sort(lines, axis=1) @ np.array([n, 1]))
+
+
+def conduction_flux(coords, cells, thermal_conductivity, exclude=None, lines=None):
+    """
+    Boundary heat flow ∫ -λ ∇T·n ds over the outer boundary as a linear
+    functional g (flux = g·T), with the exact P1 gradient of the boundary triangle.
+    λ is a scalar or an array of per-cell values. With `lines` (e.g. the far
+    field, physical curve 1) only their edges count, so adiabatic symmetry
+    lines stay out; the edges of the lines `exclude` (e.g. resolved borehole
+    walls) are left out.
+    """
+    area, grad = gradients(coords, cells)
+    edges, owner, opposite, _, _ = boundary_edges(coords, cells)
+    keep = np.ones(len(edges), dtype=bool)
+    if lines is not None:
+        keep &= select_edges(edges, lines)
+    if exclude is not None and len(exclude):
+        keep &= ~select_edges(edges, exclude)
+    owner, opposite = owner[keep], opposite[keep]
+    thermal_conductivity = np.broadcast_to(np.asarray(thermal_conductivity, dtype=float), area.shape)
+
+    # |e| n = -2 A ∇φ_k (k: vertex opposite the edge)
+    values = 2.0 * thermal_conductivity[owner, None] * area[owner, None] * \
+        np.einsum("eik,ek->ei", grad[owner], grad[owner, opposite])
+    g = np.zeros(len(coords))
+    np.add.at(g, cells[owner], values)
+    return g
+
+
+def edge_mass(coords, edges, length, h):
+    """
+    Boundary matrix ∫ h φ_j φ_i ds and vector ∫ h φ_i ds for an edgewise
+    constant coefficient h.
+
+    Returns:
+        tuple: (scipy.sparse.csr_matrix, np.ndarray)
+    """
+    n = len(coords)
+    local = (h * length / 6.0)[:, None, None] * np.array([[2.0, 1.0], [1.0, 2.0]])
+    rows = np.repeat(edges, 2, axis=1).ravel()
+    cols = np.tile(edges, (1, 2)).ravel()
+    matrix = csr_matrix((local.ravel(), (rows, cols)), shape=(n, n))
+
+    vector = np.zeros(n)
+    np.add.at(vector, edges, (h * length / 2.0)[:, None])
+    return matrix, vector
+
+
+def curve_average(coords, curves):
+    """
+    Mean over each curve, ∫ φ_i ds / |Γ|, as one sparse operator (e.g. the
+    wall temperatures of resolved boreholes; its transpose spreads a unit
+    heat flow uniformly over the walls).
+
+    Returns:
+        scipy.sparse.csr_matrix: shape (n_curves, n_vertices).
+    """
+    rows, cols, data = [], [], []
+    for k, lines in enumerate(curves):
+        length = np.linalg.norm(coords[lines[:, 1]] - coords[lines[:, 0]], axis=1)
+        # ∫ φ_i ds = |e| / 2 for both vertices of every edge (duplicates are summed)
+        rows.append(np.full(lines.size, k))
+        cols.append(lines.ravel())
+        data.append(np.repeat(length / (2.0 * length.sum()), 2))
+    return csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                      shape=(len(curves), len(coords)))
+
+
+# 6-point rule of degree 4 on the triangle: barycentric coordinates and weights
+_QUADRATURE_POINTS = np.array([
+    [0.445948490915965, 0.445948490915965, 0.108103018168070],
+    [0.445948490915965, 0.108103018168070, 0.445948490915965],
+    [0.108103018168070, 0.445948490915965, 0.445948490915965],
+    [0.091576213509771, 0.091576213509771, 0.816847572980459],
+    [0.091576213509771, 0.816847572980459, 0.091576213509771],
+    [0.816847572980459, 0.091576213509771, 0.091576213509771]])
+_QUADRATURE_WEIGHTS = np.array([0.223381589678011] * 3 + [0.109951743655322] * 3)
+
+
+def smoothed_sources(coords, cells, centres, radius, kind="gaussian"):
+    """
+    Regularized line sources: ∫ φ_i ρ_k dx for the density ρ_k of source k,
+    a Gaussian (standard deviation `radius`, cut off at 4 radii) or a uniform
+    disc of `radius` around the centre. Every row is normalized to 1, so the
+    transpose spreads a unit heat flow and a row gives the ρ-weighted mean
+    temperature.
+
+    Returns:
+        scipy.sparse.csr_matrix: shape (n_sources, n_vertices).
+    """
+    area, _ = gradients(coords, cells)
+    x_q = np.einsum("qj,cjk->cqk", _QUADRATURE_POINTS, coords[cells])    # (n_cells, 6, 2)
+    centroid = coords[cells].mean(axis=1)
+    diameter = np.max(np.linalg.norm(coords[cells] - centroid[:, None, :], axis=2), axis=1)
+    cutoff = 4.0 * radius if kind == "gaussian" else radius
+
+    rows, cols, data = [], [], []
+    for k, centre in enumerate(np.asarray(centres, dtype=float)):
+        near = np.flatnonzero(np.linalg.norm(centroid - centre, axis=1) <= cutoff + diameter)
+        r_2 = np.sum((x_q[near] - centre) ** 2, axis=2)
+        if kind == "gaussian":
+            density = np.exp(-0.5 * r_2 / radius ** 2)
+        elif kind == "disc":
+            density = (r_2 <= radius ** 2).astype(float)
+        else:
+            raise ValueError(f"Unknown source distribution: {kind}")
+        # (cells, vertices): Σ_q w_q A ρ(x_q) λ_j(x_q)
+        local = area[near, None] * ((_QUADRATURE_WEIGHTS * density) @ _QUADRATURE_POINTS)
+        if local.sum() <= 0.0:
+            raise ValueError(f"Source radius {radius} m is not resolved by the mesh, "
+                             f"refine meshFine or increase smoothingRadius")
+        rows.append(np.full(local.size, k))
+        cols.append(cells[near].ravel())
+        data.append((local / local.sum()).ravel())
+    return csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                      shape=(len(centres), len(coords)))
+
+
+def near_field_resistance(kind, radius, r_b, thermal_conductivity):
+    """
+    Steady near-field correction of a regularized source (K per W/m): wall
+    temperature at r_b of a line source minus the ρ-weighted mean temperature
+    of the smoothed source,
+
+        disc:      (ln(R² / r_b²) - 1/2) / (4πλ)
+        gaussian:  (ln(4σ² / r_b²) - γ) / (4πλ)     (γ: Euler's constant)
+    """
+    if radius <= r_b:
+        raise ValueError("smoothingRadius must be larger than the pipe radius")
+    if kind == "disc":
+        return (np.log(radius ** 2 / r_b ** 2) - 0.5) / (4 * np.pi * thermal_conductivity)
+    if kind == "gaussian":
+        return (np.log(4 * radius ** 2 / r_b ** 2) - np.euler_gamma) / (4 * np.pi * thermal_conductivity)
+    raise ValueError(f"Unknown source distribution: {kind}")
+
+
+def apply_dirichlet(A, nodes):
+    """Replaces the rows of the Dirichlet nodes by identity rows (as DirichletBC.apply)."""
+    mask = np.zeros(A.shape[0])
+    mask[nodes] = 1.0
+    return (diags(1.0 - mask) @ A + diags(mask)).tocsr()
@@ -0,0 +1,285 @@
+'''Catalog of all runs (SQLite) with summary metrics, queryable without opening the HDF5 files.'''
+
+import json
+import sqlite3
+from os import makedirs, path
+
+import h5py
+import numpy as np
+
+from src.simulation.utils.h5py_writer import period_index
+from src.simulation.utils.run_store import RunStore
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CATALOG_FILE = "catalog.sqlite"
+
+# BHE temperatures are stored in °C
+KELVIN = 273.15
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    key TEXT PRIMARY KEY,
+    alias TEXT,
+    engine TEXT,
+    mesh_mode TEXT,
+    n_ews INTEGER,
+    borehole_distance REAL,
+    n_vertices INTEGER,
+    n_cells INTEGER,
+    years REAL,
+    runtime_s REAL,
+    finished TEXT,
+    code TEXT,
+    h5_path TEXT,
+    parameters TEXT
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    key TEXT REFERENCES runs(key) ON DELETE CASCADE,
+    name TEXT,
+    value
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    key TEXT REFERENCES runs(key) ON DELETE CASCADE,
+    scenario TEXT,
+    min_temp_ews REAL,
+    max_temp_ews REAL,
+    w_el_total REAL,
+    e_probe_total REAL,
+    max_abs_error REAL
+);
+CREATE TABLE IF NOT EXISTS yearly (
+    key TEXT REFERENCES runs(key) ON DELETE CASCADE,
+    scenario TEXT,
+    year INTEGER,
+    min_temp_ews REAL,
+    mean_temp_ews REAL,
+    max_temp_ews REAL,
+    w_el REAL,
+    e_probe REAL
+);
+CREATE INDEX IF NOT EXISTS parameters_name ON parameters(name, value);
+CREATE INDEX IF NOT EXISTS metrics_key ON metrics(key);
+CREATE INDEX IF NOT EXISTS yearly_year ON yearly(year, min_temp_ews);
+CREATE INDEX IF NOT EXISTS yearly_key ON yearly(key);
+CREATE VIEW IF NOT EXISTS run_metrics AS
+    SELECT runs.*, metrics.scenario, metrics.min_temp_ews, metrics.max_temp_ews,
+           metrics.w_el_total, metrics.e_probe_total, metrics.max_abs_error
+    FROM runs JOIN metrics USING (key);
+CREATE VIEW IF NOT EXISTS run_years AS
+    SELECT runs.*, yearly.scenario, yearly.year, yearly.min_temp_ews, yearly.mean_temp_ews,
+           yearly.max_temp_ews, yearly.w_el, yearly.e_probe
+    FROM runs JOIN yearly USING (key);
+"""
+
+
+def flatten_parameters(parameters, prefix=""):
+    """
+    Nested SI parameters -> {"ground.thermalConductivity": 2.0, ...}; value/unit
+    pairs are reduced to the value, lists are stored as JSON.
+    """
+    flat = {}
+    for name, value in parameters.items():
+        name = f"{prefix}{name}"
+        if isinstance(value, dict):
+            if "value" in value and set(value) <= {"value", "unit"}:
+                flat.update(flatten_parameters({name: value["value"]}))
+            else:
+                flat.update(flatten_parameters(value, f"{name}."))
+        elif isinstance(value, (list, tuple)):
+            flat[name] = json.dumps(value, ensure_ascii=False)
+        else:
+            flat[name] = value
+    return flat
+
+
+def summarize(h5_path, steps_per_year):
+    """
+    Summary metrics of a result file (temperatures in °C), from the yearly
+    (or else monthly) aggregates if the writer stored them, otherwise read
+    year by year from the raw time series. Without either the metrics are None.
+
+    Returns:
+        tuple: (metrics [(scenario, min T, max T, ΣW_el, ΣE_probe, max |error|)],
+                yearly [(scenario, year, min T, mean T, max T, W_el, E_probe)])
+    """
+    with h5py.File(h5_path, "r") as f:
+        scenarios = json.loads(f.attrs["scenarios"]) if "scenarios" in f.attrs else [""]
+        n_scenarios = len(scenarios)
+
+        yearly = []
+        period = next((p for p in ("yearly", "monthly") if f"aggregates/{p}" in f), None)
+        if period is not None:
+            g = f[f"aggregates/{period}"]
+            n_periods = g["period"].shape[0]
+            years = np.asarray(g["period"], dtype=int) // (12 if period == "monthly" else 1)
+            steps = np.asarray(g["steps"], dtype=float)
+            T_min, T_sum, T_max = (np.asarray(g[f"Temp_EWS_{s}"], dtype=float).reshape(n_periods, n_scenarios, -1)
+                                   for s in ("min", "sum", "max"))
+            W = np.asarray(g["W_el_sum"], dtype=float).reshape(n_periods, n_scenarios, -1)
+            E = np.asarray(g["E_probe_result_sum"], dtype=float).reshape(n_periods, n_scenarios)
+            for year in np.unique(years):
+                rows = years == year
+                for k, scenario in enumerate(scenarios):
+                    yearly.append((scenario, int(year) + 1, T_min[rows, k].min() - KELVIN,
+                                   T_sum[rows, k].sum(axis=0).mean() / steps[rows].sum() - KELVIN,
+                                   T_max[rows, k].max() - KELVIN, W[rows, k].sum(), E[rows, k].sum()))
+        elif "per_ews/Temp_EWS_values" in f:
+            temp = f["per_ews/Temp_EWS_values"]
+            w_el = f["per_ews/W_el_values"]
+            e_probe = f["timeseries/E_probe_result"]
+            n_steps = temp.shape[0]
+            # year of every step from its day, files of the periodic mode hold selected years only
+            years = period_index(f["timeseries/days"][:n_steps], "yearly") if "timeseries/days" in f \
+                else np.arange(n_steps) // steps_per_year
+            for year in np.unique(years):
+                rows = np.flatnonzero(years == year)
+                first, last = int(rows[0]), int(rows[-1]) + 1
+                # uniform shape (steps, scenarios, n_EWS)
+                T = np.asarray(temp[first:last], dtype=float).reshape(last - first, n_scenarios, -1) \
+                    - KELVIN
+                W = np.asarray(w_el[first:last], dtype=float).reshape(last - first, n_scenarios, -1)
+                E = np.asarray(e_probe[first:last], dtype=float).reshape(last - first, n_scenarios)
+                for k, scenario in enumerate(scenarios):
+                    yearly.append((scenario, int(year) + 1, T[:, k].min(), T[:, k].mean(), T[:, k].max(),
+                                   W[:, k].sum(), E[:, k].sum()))
+
+        # the energy-balance error is only available in the raw time series
+        errors = None
+        if "timeseries/error_result" in f:
+            error = f["timeseries/error_result"]
+            errors = np.abs(np.asarray(error, dtype=float)).reshape(error.shape[0], n_scenarios)
+
+    metrics = []
+    for k, scenario in enumerate(scenarios):
+        rows = [row for row in yearly if row[0] == scenario]
+        max_error = np.nanmax(errors[:, k]) \
+            if errors is not None and np.isfinite(errors[:, k]).any() else None
+        if not rows:
+            metrics.append((scenario, None, None, None, None, max_error))
+            continue
+        metrics.append((scenario,
+                        min(row[2] for row in rows), max(row[4] for row in rows),
+                        sum(row[5] for row in rows), sum(row[6] for row in rows),
+                        max_error))
+    return metrics, yearly
+
+
+class Catalog:
+    """SQLite catalog <results>/catalog.sqlite, one entry per run key."""
+
+    def __init__(self, results_dir):
+        makedirs(results_dir, exist_ok=True)
+        self.file = path.join(results_dir, CATALOG_FILE)
+        self.db = sqlite3.connect(self.file)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add_run(self, key, meta, h5_path, steps_per_year, runtime=None):
+        """
+        Enters a finished run (replaces an existing entry with the same key).
+
+        Args:
+            meta (dict): run.json of the run store (alias, code, finished, parameters).
+        """
+        parameters = meta["parameters"]
+        flat = flatten_parameters(parameters)
+        metrics, yearly = summarize(h5_path, steps_per_year)
+
+        with h5py.File(h5_path, "r") as f:
+            attrs = dict(f.attrs)
+            n_ews = f["per_ews/Temp_EWS_values"].shape[-1]
+
+        with self.db:
+            self.db.execute("DELETE FROM runs WHERE key = ?", (key,))
+            self.db.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, meta["alias"], attrs.get("engine", parameters.get("engine", "fem")),
+                 "_".join(map(str, parameters["meshMode"])), n_ews,
+                 flat.get("mesh.boreholeDistance"),
+                 _int(attrs.get("num_vertices")), _int(attrs.get("num_cells")),
+                 flat.get("time.simulationYears", 0.0) / (365 * 86400.0),
+                 runtime, meta.get("finished"), meta.get("code"), h5_path,
+                 json.dumps(parameters, ensure_ascii=False))
+            )
+            self.db.executemany("INSERT INTO parameters VALUES (?, ?, ?)",
+                                [(key, name, value) for name, value in flat.items()])
+            self.db.executemany("INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [(key,) + row for row in metrics])
+            self.db.executemany("INSERT INTO yearly VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                [(key,) + row for row in yearly])
+
+    def query(self, where=None, columns="*", yearly=False, order_by=None):
+        """
+        Selects from the view run_years (yearly=True) or run_metrics.
+
+        Returns:
+            tuple: (column names, rows)
+        """
+        sql = f"SELECT {columns} FROM {'run_years' if yearly else 'run_metrics'}"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        cursor = self.db.execute(sql)
+        return [d[0] for d in cursor.description], cursor.fetchall()
+
+
+def rebuild(results_dir):
+    """Enters all completed runs of the run store (e.g. runs from before the catalog)."""
+    store = RunStore(results_dir)
+    catalog = Catalog(results_dir)
+    try:
+        for key, meta in store.completed():
+            h5_path = store.lookup(key)
+            if h5_path is None:
+                continue
+            steps_per_year = int(round(365 * 86400.0 / meta["parameters"]["time"]["timeStepHours"]["value"]))
+            catalog.add_run(key, meta, h5_path, steps_per_year, meta.get("runtime"))
+            print(f"catalog: {key} ({meta['alias']})")
+    finally:
+        catalog.close()
+
+
+def _int(value):
+    return None if value is None else int(value)
+
+
+def export_timeseries(h5_path, output_path):
+    """
+    Writes the time series and the per-BHE series of a result file as a
+    Parquet table (one column per series and BHE; requires pyarrow).
+    """
+    if pyarrow is None:
+        raise ImportError("the Parquet export requires pyarrow (pip install pyarrow)")
+
+    columns = {}
+    with h5py.File(h5_path, "r") as f:
+        scenarios = json.loads(f.attrs["scenarios"]) if "scenarios" in f.attrs else None
+        for name, ds in f["timeseries"].items():
+            data = ds[:]
+            if data.ndim == 1:
+                columns[name] = data
+            else:
+                for k, scenario in enumerate(scenarios):
+                    columns[f"{name}_{scenario}"] = data[:, k]
+        for name, ds in f["per_ews"].items():
+            data = ds[:]
+            base = name.replace("_values", "")
+            if data.ndim == 2:
+                for i in range(data.shape[1]):
+                    columns[f"{base}_{i}"] = data[:, i]
+            else:
+                for k, scenario in enumerate(scenarios):
+                    for i in range(data.shape[2]):
+                        columns[f"{base}_{scenario}_{i}"] = data[:, k, i]
+
+    pyarrow.parquet.write_table(pyarrow.table(columns), output_path, compression="zstd")
+    return output_path
@@ -13,6 +13,7 @@ Beispiele:
   - cm/day   -> m/s
   - MJ/m^3/K -> J/m^3/K
   - kJ/m^3/K -> J/m^3/K
+  - kJ/kg    -> J/kg
   - m, kg/m^3, J/kg/K, W/m/K, W/m, 1 bleiben erhalten
 
 Nutzung:
@@ -110,6 +111,12 @@ def convert_value_unit(value: float, unit: str) -> Tuple[float, str]:
     if u in {"J/kg/K"}:
         return value, "J/kg/K"
 
+    # spezifische Enthalpie (latente Wärme)
+    if u == "J/kg":
+        return value, "J/kg"
+    if u == "kJ/kg":
+        return value * 1e3, "J/kg"
+
     # Geschwindigkeit: cm/day -> m/s
     if u == "cm/day":
         return value * 0.01 / 86400.0, "m/s"
@@ -136,7 +143,7 @@ def convert_to_si(obj: Any) -> Any:
             val = obj.get("value")
             unit = obj.get("unit")
             
-            if not val or not unit:
+            if val is None or not unit:
                 return obj
 
             try:
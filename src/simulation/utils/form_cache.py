@@ -0,0 +1,80 @@
+'''Shared, versioned cache of the compiled FEniCS forms (dijitso cache directory).'''
+
+import hashlib
+import json
+import os
+import platform
+import time
+from importlib import metadata
+from os import path
+
+from src.simulation.utils.paths import FORM_CACHE_DIR
+
+FORMS_FILE = path.join(path.dirname(path.abspath(__file__)), '..', 'forms.py')
+MANIFEST = "manifest.json"
+
+
+def _dolfin_version():
+    for name in ("fenics-dolfin", "dolfin"):
+        try:
+            return metadata.version(name)
+        except metadata.PackageNotFoundError:
+            pass
+    return "unknown"
+
+
+def version():
+    """Cache version: hash of the form definitions, the DOLFIN and the Python version."""
+    h = hashlib.sha256()
+    with open(FORMS_FILE, "rb") as f:
+        h.update(f.read())
+    h.update(_dolfin_version().encode())
+    h.update(platform.python_version().encode())
+    return h.hexdigest()[:12]
+
+
+def cache_dir():
+    return path.join(FORM_CACHE_DIR, version())
+
+
+def manifest(directory=None):
+    """Manifest of a warmed-up cache directory, None if it was not warmed up."""
+    file_name = path.join(directory or cache_dir(), MANIFEST)
+    if not path.isfile(file_name):
+        return None
+    with open(file_name, "r") as f:
+        return json.load(f)
+
+
+def configure():
+    """
+    Points dijitso to the versioned cache directory before FEniCS is imported.
+
+    A warmed-up directory is used even if it is read-only (all forms are
+    cache hits); otherwise it is used if it can be created, so the first run
+    fills it. A DIJITSO_CACHE_DIR set by the user takes precedence.
+
+    Returns:
+        str: cache directory in use, None for the dijitso default.
+    """
+    if os.environ.get("DIJITSO_CACHE_DIR"):
+        return os.environ["DIJITSO_CACHE_DIR"]
+
+    directory = cache_dir()
+    if manifest(directory) is None:
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            return None
+        if not os.access(directory, os.W_OK):
+            return None
+    os.environ["DIJITSO_CACHE_DIR"] = directory
+    return directory
+
+
+def write_manifest(directory, variants, runtime):
+    manifest_data = {"version": version(), "dolfin": _dolfin_version(),
+                     "python": platform.python_version(), "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                     "runtime": runtime, "variants": variants}
+    with open(path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest_data, f, indent=2)
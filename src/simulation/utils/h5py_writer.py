@@ -1,70 +1,251 @@
+import queue
+import sys
+import threading
+
 import h5py
 import numpy as np
 
+TIMESERIES = [
+    ("error_result", "f4"),
+    ("E_probe_result", "f4"),
+    ("E_flux_result", "f4"),
+    ("Delta_E_result", "f4"),
+    ("E_in_out", "f4"),
+    ("Q_probe", "f4"),
+    ("E_storage", "f4"),
+    ("days", "f8"),
+]
+
+# append_step keyword -> timeseries dataset
+STEP_FIELDS = {
+    "day": "days",
+    "error": "error_result",
+    "E_probe": "E_probe_result",
+    "E_flux": "E_flux_result",
+    "Delta_E": "Delta_E_result",
+    "E_inout": "E_in_out",
+    "Q_probe": "Q_probe",
+    "E_storage": "E_storage",
+}
+
+
+# Energiegrößen, deren Summen (je Periode und gesamt) mitgeführt werden
+ENERGY_SERIES = ["E_probe_result", "E_flux_result", "Delta_E_result", "E_in_out"]
+
+AGGREGATE_PERIODS = ("daily", "monthly", "yearly")
+
+# erster Tag jedes Monats im Jahr (365 Tage)
+MONTH_STARTS = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+
+def period_index(days, period):
+    """
+    Index der Aggregationsperiode je Zeitschritt (days = Tag am Ende des Schritts):
+    daily -> Tag, monthly -> 12 * Jahr + Monat, yearly -> Jahr (0-basiert).
+    """
+    day = np.maximum(np.ceil(np.asarray(days, dtype=float) - 1e-9).astype(np.int64) - 1, 0)
+    if period == "daily":
+        return day
+    if period == "monthly":
+        return 12 * (day // 365) + np.searchsorted(MONTH_STARTS, day % 365, side="right") - 1
+    if period == "yearly":
+        return day // 365
+    raise ValueError(f"Unknown aggregation period: {period}")
+
+
+class PeriodAggregator:
+    """
+    Laufende Reduktion der Zeitschritte auf Perioden (Tag, Monat, Jahr):
+    je Bohrung mean/min/max/sum von Temp_EWS und W_el, Summen der
+    Energiegrößen. Eine Periode wird geschrieben, sobald die nächste beginnt
+    (bzw. bei close()).
+    """
+
+    STATISTICS = ("mean", "min", "max", "sum")
+
+    def __init__(self, h5, period, ews_shape, series_shape, compression="lzf"):
+        if period not in AGGREGATE_PERIODS:
+            raise ValueError(f"Unknown aggregation period: {period}")
+        self.period = period
+        self.group = h5.create_group(f"aggregates/{period}")
+        self.ds = {
+            "period": self.group.create_dataset("period", shape=(0,), maxshape=(None,), dtype="i8", chunks=True),
+            "days": self.group.create_dataset("days", shape=(0,), maxshape=(None,), dtype="f8", chunks=True),
+            "steps": self.group.create_dataset("steps", shape=(0,), maxshape=(None,), dtype="i4", chunks=True),
+        }
+        for quantity in ("Temp_EWS", "W_el"):
+            for statistic in self.STATISTICS:
+                self.ds[f"{quantity}_{statistic}"] = self.group.create_dataset(
+                    f"{quantity}_{statistic}", shape=(0,) + ews_shape, maxshape=(None,) + ews_shape,
+                    dtype="f4", compression=compression, chunks=True)
+        for name in ENERGY_SERIES:
+            self.ds[f"{name}_sum"] = self.group.create_dataset(
+                f"{name}_sum", shape=(0,) + series_shape, maxshape=(None,) + series_shape,
+                dtype="f8", compression=compression, chunks=True)
+        self.ews_shape = ews_shape
+        self.series_shape = series_shape
+        self.current = None
+
+    def _start(self, index):
+        self.current = index
+        self.count = 0
+        self.acc = {}
+        for quantity in ("Temp_EWS", "W_el"):
+            self.acc[f"{quantity}_sum"] = np.zeros(self.ews_shape)
+            self.acc[f"{quantity}_min"] = np.full(self.ews_shape, np.inf)
+            self.acc[f"{quantity}_max"] = np.full(self.ews_shape, -np.inf)
+        for name in ENERGY_SERIES:
+            self.acc[f"{name}_sum"] = np.zeros(self.series_shape)
+
+    def add(self, days, per_ews, series):
+        """
+        Args:
+            days (np.ndarray): (n,) Tag am Ende jedes Schritts.
+            per_ews (dict): {"Temp_EWS": (n, ..., n_EWS), "W_el": ...}
+            series (dict): {Zeitreihenname: (n, ...)}
+        """
+        index = period_index(days, self.period)
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(index)) + 1, [len(index)]])
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            if self.current is not None and index[first] != self.current:
+                self._write()
+            if self.current is None:
+                self._start(index[first])
+            self.count += last - first
+            self.days = days[last - 1]
+            for quantity, values in per_ews.items():
+                block = np.asarray(values[first:last], dtype=float)
+                self.acc[f"{quantity}_sum"] += block.sum(axis=0)
+                self.acc[f"{quantity}_min"] = np.minimum(self.acc[f"{quantity}_min"], block.min(axis=0))
+                self.acc[f"{quantity}_max"] = np.maximum(self.acc[f"{quantity}_max"], block.max(axis=0))
+            for name in ENERGY_SERIES:
+                self.acc[f"{name}_sum"] += np.sum(series[name][first:last], axis=0, dtype=float)
+
+    def _write(self):
+        row = dict(self.acc, period=self.current, days=self.days, steps=self.count)
+        for quantity in ("Temp_EWS", "W_el"):
+            row[f"{quantity}_mean"] = self.acc[f"{quantity}_sum"] / self.count
+        for name, ds in self.ds.items():
+            n = ds.shape[0]
+            ds.resize((n + 1,) + ds.shape[1:])
+            ds[n] = row[name]
+        self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self._write()
+
+
+def unfold_symmetry(coords, cells, values, symmetry=(False, False)):
+    """
+    Spiegelt ein Vertex-Feld des reduzierten Gebiets an x = 0 und/oder y = 0
+    zurück auf das volle Gebiet (Vertices auf den Symmetrielinien doppelt).
+    """
+    for axis, mirrored in enumerate(symmetry):
+        if mirrored:
+            mirror = coords.copy()
+            mirror[:, axis] *= -1
+            cells = np.vstack([cells, cells + coords.shape[0]])
+            coords = np.vstack([coords, mirror])
+            values = np.concatenate([values, values])
+    return coords, cells, values
+
+
 class H5Writer:
-    def __init__(self, path, n_EWS, compression="lzf", flush_every=365):
+    def __init__(self, path, n_EWS, compression="lzf", flush_every=365, batch_size=64,
+                 n_scenarios=None, aggregates=(), raw=True):
         self.h5 = h5py.File(path, "w")
         self.h5.attrs["format"] = "SubTerra_Simulation_Results"
-        self.h5.attrs["version"] = "1.0"
+        self.h5.attrs["version"] = "1.1"
         self.n_EWS = n_EWS
         self.i = 0
         self.flush_every = flush_every
+        self.batch_size = max(batch_size, 1)
+
+        # Ensemble: zusätzliche Szenario-Dimension nach der Zeitachse
+        scenario = () if n_scenarios is None else (n_scenarios,)
+        if n_scenarios is not None:
+            self.h5.attrs["n_scenarios"] = n_scenarios
 
-        # 1D Zeitreihen
+        # 1D Zeitreihen (days immer 1D)
         self.ds = {}
-        for name, dtype in [
-            ("error_result", "f4"),
-            ("E_probe_result", "f4"),
-            ("E_flux_result", "f4"),
-            ("Delta_E_result", "f4"),
-            ("E_in_out", "f4"),
-            ("Q_probe", "f4"),
-            ("E_storage", "f4"),
-            ("days", "i4"),
-        ]:
+        for name, dtype in TIMESERIES:
+            shape = () if name == "days" else scenario
             self.ds[name] = self.h5.create_dataset(
                 f"timeseries/{name}",
-                shape=(0,), maxshape=(None,),
+                shape=(0,) + shape, maxshape=(None,) + shape,
                 dtype=dtype, compression=compression, chunks=True
             )
 
         # 2D: pro-EWS (Spalten = Bohrungen)
+        shape = scenario + (n_EWS,)
         self.W_el = self.h5.create_dataset(
             "per_ews/W_el_values",
-            shape=(0, n_EWS), maxshape=(None, n_EWS),
-            dtype="f4", compression=compression, chunks=(1, n_EWS)
+            shape=(0,) + shape, maxshape=(None,) + shape,
+            dtype="f4", compression=compression, chunks=(self.batch_size,) + shape
         )
         self.Temp_EWS = self.h5.create_dataset(
             "per_ews/Temp_EWS_values",
-            shape=(0, n_EWS), maxshape=(None, n_EWS),
-            dtype="f4", compression=compression, chunks=(1, n_EWS)
+            shape=(0,) + shape, maxshape=(None,) + shape,
+            dtype="f4", compression=compression, chunks=(self.batch_size,) + shape
         )
 
+        # Zwischenpuffer: Zeitschritte werden blockweise geschrieben
+        self._n_buffered = 0
+        self._buffer = {name: np.zeros((self.batch_size,) + self.ds[name].shape[1:], dtype=dtype)
+                        for name, dtype in TIMESERIES}
+        self._buffer_W_el = np.zeros((self.batch_size,) + shape, dtype=np.float32)
+        self._buffer_Temp_EWS = np.zeros((self.batch_size,) + shape, dtype=np.float32)
+
         # Optional: Vertex-Snapshots (beliebige Shapes) als Gruppe
         self.snapshots = self.h5.create_group("snapshots")
 
-    def add_vertex_snapshot_full(self, name, mesh, T, compression="lzf"):
+        # Optional: laufende Perioden-Aggregate, Rohdaten ggf. nicht speichern
+        self.raw = raw
+        self.h5.attrs["raw"] = raw
+        self.aggregators = [PeriodAggregator(self.h5, period, shape, scenario, compression)
+                            for period in aggregates]
+        self.totals = {name: np.zeros(scenario) for name in ENERGY_SERIES}
+
+        # Optional: Monitoring-Punkte (Gruppen mit eigenen Datensätzen)
+        self.scenario_shape = scenario
+        self.compression = compression
+        self.monitoring = []
+        self._monitoring_buffer = []
+
+    def add_vertex_snapshot_full(self, name, mesh, T, compression="lzf", symmetry=(False, False)):
             """
             Speichert das Feld in Vertex-Darstellung:
             - coords: (num_vertices, gdim)
             - cells:  (num_cells, vertices_per_cell)
             - values: (num_vertices,)  (bei Skalarfeld)
             Eignet sich perfekt für CG1 (lineare Lagrange).
+            Bei reduziertem Gebiet (symmetry) wird das volle Feld gespiegelt rekonstruiert.
             """
-            g = self.snapshots.create_group(name)
-            g.attrs["kind"] = "vertex"
-            g.attrs["time_label"] = name  # z.B. "T_vertex_20.0a"
-
             # Geometrie
             coords = mesh.coordinates()                 # (Nverts, gdim)
             cells  = mesh.cells()                       # (Ncells, nvert_per_cell)
 
-            g.create_dataset("coords", data=coords, compression=compression, chunks=True)
-            g.create_dataset("cells",  data=cells,  compression=compression, chunks=True)
-
             # Feldwerte an Vertices
             vals = T.compute_vertex_values(mesh)        # shape (Nverts,)
-            g.create_dataset("values", data=vals.astype("f4"), compression=compression, chunks=True)
+
+            self.add_vertex_snapshot_arrays(name, coords, cells, vals,
+                                            compression=compression, symmetry=symmetry)
+
+    def add_vertex_snapshot_arrays(self, name, coords, cells, values, compression="lzf",
+                                   symmetry=(False, False)):
+            """
+            Wie add_vertex_snapshot_full, aber mit NumPy-Arrays statt FEniCS-Objekten.
+            """
+            coords, cells, values = unfold_symmetry(coords, cells, values, symmetry)
+
+            g = self.snapshots.create_group(name)
+            g.attrs["kind"] = "vertex"
+            g.attrs["time_label"] = name  # z.B. "T_vertex_20.0a"
+
+            g.create_dataset("coords", data=coords, compression=compression, chunks=True)
+            g.create_dataset("cells",  data=cells,  compression=compression, chunks=True)
+            g.create_dataset("values", data=np.asarray(values).astype("f4"), compression=compression, chunks=True)
 
             # ein paar Metadaten
             g.attrs["gdim"] = coords.shape[1]
@@ -106,35 +287,127 @@ class H5Writer:
     def append_step(self, *, day, error, E_probe, E_flux, Delta_E, E_inout,
                     Q_probe=np.nan, E_storage=np.nan,
                     W_el_row=None, Temp_EWS_row=None):
+        k = self._n_buffered
+        self._n_buffered += 1
+
+        # puffern 1D
+        values = dict(day=day, error=error, E_probe=E_probe, E_flux=E_flux, Delta_E=Delta_E,
+                      E_inout=E_inout, Q_probe=Q_probe, E_storage=E_storage)
+        for key, name in STEP_FIELDS.items():
+            self._buffer[name][k] = values[key]
+
+        # puffern 2D
+        self._buffer_W_el[k] = 0.0 if W_el_row is None else W_el_row
+        self._buffer_Temp_EWS[k] = 0.0 if Temp_EWS_row is None else Temp_EWS_row
+
+        if self._n_buffered == self.batch_size:
+            self._write_buffer()
+
+    def append_steps(self, *, W_el=None, Temp_EWS=None, **columns):
+        """
+        Hängt einen Block von Zeitschritten an (Schlüssel wie append_step, je ein
+        Array pro Größe; W_el/Temp_EWS mit Shape (n_steps, [n_scenarios,] n_EWS)).
+        """
+        self._write_buffer()
+        n = len(columns["day"])
         i = self.i
-        self.i += 1
-
-        # 1D resize
-        for ds in self.ds.values():
-            ds.resize((i+1,))
-        # 2D resize
-        self.W_el.resize((i+1, self.n_EWS))
-        self.Temp_EWS.resize((i+1, self.n_EWS))
-
-        # schreiben 1D
-        self.ds["days"][i]          = int(day)
-        self.ds["error_result"][i]  = float(error)
-        self.ds["E_probe_result"][i]= float(E_probe)
-        self.ds["E_flux_result"][i] = float(E_flux)
-        self.ds["Delta_E_result"][i]= float(Delta_E)
-        self.ds["E_in_out"][i]      = float(E_inout)
-        self.ds["Q_probe"][i]       = float(Q_probe)
-        self.ds["E_storage"][i]     = float(E_storage)
-
-        # schreiben 2D
-        if W_el_row is not None:
-            self.W_el[i, :] = np.asarray(W_el_row, dtype=np.float32)
-        if Temp_EWS_row is not None:
-            self.Temp_EWS[i, :] = np.asarray(Temp_EWS_row, dtype=np.float32)
-
-        if (i % self.flush_every) == 0:
+
+        series = {name: np.broadcast_to(np.asarray(columns.get(key, np.nan), dtype=self.ds[name].dtype),
+                                        (n,) + self.ds[name].shape[1:])
+                  for key, name in STEP_FIELDS.items()}
+        for name in ENERGY_SERIES:
+            self.totals[name] += np.nansum(series[name], axis=0)
+
+        if self.aggregators:
+            per_ews = {quantity: np.zeros((n,) + ds.shape[1:]) if block is None else block
+                       for quantity, ds, block in [("W_el", self.W_el, W_el),
+                                                   ("Temp_EWS", self.Temp_EWS, Temp_EWS)]}
+            for aggregator in self.aggregators:
+                aggregator.add(series["days"], per_ews, series)
+
+        if self.raw:
+            for name, values in series.items():
+                ds = self.ds[name]
+                ds.resize((i + n,) + ds.shape[1:])
+                ds[i:] = values
+
+            for ds, block in [(self.W_el, W_el), (self.Temp_EWS, Temp_EWS)]:
+                ds.resize((i + n,) + ds.shape[1:])
+                if block is not None:
+                    ds[i:] = np.asarray(block, dtype=np.float32)
+
+        self.i += n
+        # flush, sobald ein Vielfaches von flush_every überschritten wird
+        if (i // self.flush_every) != ((i + n) // self.flush_every) or i == 0:
             self.h5.flush()
 
+    def _write_buffer(self):
+        n = self._n_buffered
+        if n == 0:
+            return
+        self._n_buffered = 0
+        columns = {key: self._buffer[name][:n] for key, name in STEP_FIELDS.items()}
+        self.append_steps(W_el=self._buffer_W_el[:n], Temp_EWS=self._buffer_Temp_EWS[:n],
+                          **columns)
+
+    def add_monitoring(self, groups):
+        """
+        Legt die Monitoring-Datensätze an:
+        - monitoring/days:          (t,)
+        - monitoring/<name>/coords: (n_points, 2)
+        - monitoring/<name>/values: (t, [n_scenarios,] n_points), Attribut shape (Punkte/Linie: (n,), Raster: (ny, nx))
+        """
+        g = self.h5.require_group("monitoring")
+        self.monitoring_days = g.create_dataset("days", shape=(0,), maxshape=(None,), dtype="f8", chunks=True)
+        for name, points, shape in groups:
+            mg = g.create_group(name)
+            mg.attrs["shape"] = shape
+            mg.create_dataset("coords", data=np.asarray(points, dtype="f8"))
+            values_shape = self.scenario_shape + (len(points),)
+            self.monitoring.append(mg.create_dataset(
+                "values", shape=(0,) + values_shape, maxshape=(None,) + values_shape,
+                dtype="f4", compression=self.compression, chunks=(self.batch_size,) + values_shape))
+
+    def append_monitoring(self, day, values):
+        # values: ([n_scenarios,] n_points) aller Gruppen, gepuffert wie die Zeitreihen
+        self._monitoring_buffer.append((day, np.asarray(values, dtype=np.float32)))
+        if len(self._monitoring_buffer) == self.batch_size:
+            self._write_monitoring()
+
+    def append_monitoring_steps(self, days, values):
+        """Block von Monitoring-Werten: days (n,), values (n, [n_scenarios,] n_points)."""
+        self._write_monitoring()
+        n = len(days)
+        i = self.monitoring_days.shape[0]
+        self.monitoring_days.resize((i + n,))
+        self.monitoring_days[i:] = days
+
+        first = 0
+        values = np.asarray(values, dtype=np.float32)
+        for ds in self.monitoring:
+            n_points = ds.shape[-1]
+            ds.resize((i + n,) + ds.shape[1:])
+            ds[i:] = values[..., first:first + n_points]
+            first += n_points
+
+    def _write_monitoring(self):
+        if not self._monitoring_buffer:
+            return
+        days, values = zip(*self._monitoring_buffer)
+        self._monitoring_buffer = []
+        self.append_monitoring_steps(np.array(days), np.stack(values))
+
+    def add_periodic_trend(self, years, Temp_EWS, compression="lzf"):
+        """
+        Speichert den jährlichen Trend der periodischen Extrapolation:
+        - years:          (n_years,)        Betriebsjahre zu Jahresbeginn
+        - Temp_EWS_start: (n_years, n_EWS)  Temperatur je Bohrung zu Jahresbeginn
+        """
+        g = self.h5.require_group("periodic")
+        g.create_dataset("years", data=np.asarray(years, dtype="i4"))
+        g.create_dataset("Temp_EWS_start", data=np.asarray(Temp_EWS, dtype="f4"),
+                         compression=compression, chunks=True)
+
     def add_vertex_snapshot(self, name: str, arr: np.ndarray):
         self.snapshots.create_dataset(name, data=np.asarray(arr), compression="lzf", chunks=True)
 
@@ -142,5 +415,121 @@ class H5Writer:
          self.h5.attrs[key] = value
 
     def close(self):
+        self._write_buffer()
+        self._write_monitoring()
+        for aggregator in self.aggregators:
+            aggregator.close()
+        for name, total in self.totals.items():
+            self.h5.attrs[f"total_{name}"] = total
         self.h5.flush()
-        self.h5.close()
\ No newline at end of file
+        self.h5.close()
+
+
+class AsyncH5Writer:
+    """
+    H5Writer in einem Hintergrund-Thread.
+
+    Die Rechenschleife übergibt nur NumPy-Kopien über eine begrenzte Queue
+    (Backpressure: put blockiert, wenn der Writer nicht nachkommt). Puffern,
+    Komprimieren und Schreiben erfolgen im Writer-Thread. Ein Fehler im Thread
+    wird beim nächsten Aufruf bzw. spätestens bei close() erneut ausgelöst.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path, n_EWS, compression="lzf", flush_every=365, batch_size=64,
+                 n_scenarios=None, aggregates=(), raw=True, queue_size=64):
+        self._writer = H5Writer(path, n_EWS, compression=compression,
+                                flush_every=flush_every, batch_size=batch_size,
+                                n_scenarios=n_scenarios, aggregates=aggregates, raw=raw)
+        self.n_EWS = n_EWS
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._closed = False
+        self._vertex_geometry = {}
+        self._thread = threading.Thread(target=self._run, name="H5Writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            if self._error is not None:
+                continue  # nach einem Fehler nur noch leeren, damit put nicht blockiert
+            method, args, kwargs = item
+            try:
+                method(*args, **kwargs)
+            except BaseException as e:
+                self._error = e
+
+    def _submit(self, method, *args, **kwargs):
+        if self._error is not None:
+            raise RuntimeError("HDF5 writer thread failed") from self._error
+        if self._closed:
+            raise RuntimeError("HDF5 writer is closed")
+        self._queue.put((method, args, kwargs))
+
+    def append_step(self, *, W_el_row=None, Temp_EWS_row=None, **values):
+        self._submit(self._writer.append_step,
+                     W_el_row=None if W_el_row is None else np.array(W_el_row, dtype=np.float32),
+                     Temp_EWS_row=None if Temp_EWS_row is None else np.array(Temp_EWS_row, dtype=np.float32),
+                     **{key: np.array(value) for key, value in values.items()})
+
+    def append_steps(self, *, W_el=None, Temp_EWS=None, **columns):
+        self._submit(self._writer.append_steps,
+                     W_el=None if W_el is None else np.array(W_el, dtype=np.float32),
+                     Temp_EWS=None if Temp_EWS is None else np.array(Temp_EWS, dtype=np.float32),
+                     **{key: np.array(value) for key, value in columns.items()})
+
+    def add_vertex_snapshot_full(self, name, mesh, T, compression="lzf", symmetry=(False, False)):
+        # Geometrie und Vertex->DOF-Zuordnung nur einmal pro Mesh kopieren,
+        # pro Snapshot wird nur der DOF-Vektor kopiert
+        key = id(mesh)
+        if key not in self._vertex_geometry:
+            vertex_dofs = T.function_space().dofmap().entity_dofs(mesh, 0)
+            self._vertex_geometry[key] = (mesh.coordinates().copy(), mesh.cells().copy(),
+                                          np.asarray(vertex_dofs))
+        coords, cells, vertex_dofs = self._vertex_geometry[key]
+        self._submit(self._snapshot_from_dofs, name, coords, cells, vertex_dofs,
+                     T.vector().get_local(), compression, symmetry)
+
+    def _snapshot_from_dofs(self, name, coords, cells, vertex_dofs, dof_values, compression, symmetry):
+        self._writer.add_vertex_snapshot_arrays(name, coords, cells, dof_values[vertex_dofs],
+                                                compression=compression, symmetry=symmetry)
+
+    def add_vertex_snapshot_arrays(self, name, coords, cells, values, compression="lzf",
+                                   symmetry=(False, False)):
+        self._submit(self._writer.add_vertex_snapshot_arrays, name, np.array(coords),
+                     np.array(cells), np.array(values), compression=compression, symmetry=symmetry)
+
+    def __getattr__(self, name):
+        # übrige Methoden (add_periodic_trend, set_metadata, ...) laufen ebenfalls im Thread
+        method = getattr(self._writer, name)
+        if not callable(method):
+            return method
+
+        def submit(*args, **kwargs):
+            args = [np.array(a) if isinstance(a, np.ndarray) else a for a in args]
+            kwargs = {k: np.array(v) if isinstance(v, np.ndarray) else v for k, v in kwargs.items()}
+            self._submit(method, *args, **kwargs)
+        return submit
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+        try:
+            if self._error is None:
+                self._writer.close()
+            else:
+                self._writer.h5.close()
+        finally:
+            if self._error is not None:
+                if sys.exc_info()[1] is None:
+                    raise RuntimeError("HDF5 writer thread failed") from self._error
+                # close() im finally eines abbrechenden Laufs: die laufende Ausnahme
+                # (z.B. SimulationAborted) nicht ersetzen, den Schreibfehler nur melden
+                print(f"HDF5 writer thread failed: {self._error!r}", file=sys.stderr)
\ No newline at end of file
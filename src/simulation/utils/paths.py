@@ -1,5 +1,6 @@
 '''Set all paths.'''
 
+import os
 from os import path
 
 this_file_dir = path.dirname(path.abspath(__file__))
@@ -13,6 +14,8 @@ PARAMETER_FILE_SI = path.join(PARAMS_DIR, 'parameter_si.json')
 TEMP_DIR = path.join(PARAMS_DIR, 'temp')
 DATA_DIR = PARAMS_DIR
 MESHES_DIR = path.join(BASE_DIR, 'meshes')
+# compiled FEniCS forms, shared by all runs (e.g. a volume mounted into every worker)
+FORM_CACHE_DIR = os.environ.get('SUBTERRA_FORM_CACHE', path.join(BASE_DIR, 'cache', 'forms'))
 
 # Meshes directory (new in the refactor)
 MESHES_DIR = path.join(BASE_DIR, 'meshes')
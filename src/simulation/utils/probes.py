@@ -0,0 +1,97 @@
+import numpy as np
+from scipy.sparse import csr_matrix, identity, kron
+from scipy.spatial import cKDTree
+
+
+def locate_points(coords, cells, points, tol=1e-10, candidates_per_point=8):
+    """
+    Finds the triangle containing each point and its barycentric coordinates.
+
+    Args:
+        coords (np.ndarray): vertex coordinates, shape (n_vertices, 2).
+        cells (np.ndarray): triangle vertex indices, shape (n_cells, 3).
+        points (np.ndarray): query points, shape (n_points, 2).
+        tol (float): tolerance for points on cell edges.
+        candidates_per_point (int): cells with the nearest centroids that are
+                                    checked before all cells.
+
+    Returns:
+        tuple: (cell index per point, barycentric coordinates (n_points, 3)).
+    """
+    coords = np.asarray(coords, dtype=float)[:, :2]
+    cells = np.asarray(cells)
+    points = np.atleast_2d(np.asarray(points, dtype=float))
+
+    # affine map of every cell: x = x_0 + J λ', λ' = (λ_1, λ_2)
+    x_0 = coords[cells[:, 0]]
+    J = np.stack([coords[cells[:, 1]] - x_0, coords[cells[:, 2]] - x_0], axis=2)
+    J_inv = np.linalg.inv(J)
+
+    def barycentric_of(candidates, p):
+        lam = np.einsum("...ij,...j->...i", J_inv[candidates], p - x_0[candidates])
+        return np.concatenate([1.0 - lam.sum(axis=-1, keepdims=True), lam], axis=-1)
+
+    # candidate cells: nearest centroids first, all cells for the remaining points
+    centroids = coords[cells].mean(axis=1)
+    k = min(candidates_per_point, len(cells))
+    nearest = cKDTree(centroids).query(points, k=k)[1].reshape(len(points), k)
+
+    lam = barycentric_of(nearest, points[:, None, :])
+    best = np.argmax(lam.min(axis=2), axis=1)
+    cell_index = nearest[np.arange(len(points)), best]
+    barycentric = lam[np.arange(len(points)), best]
+
+    for i in np.flatnonzero(barycentric.min(axis=1) < -tol):
+        p = points[i]
+        lam = barycentric_of(slice(None), p)
+        c = int(np.argmax(lam.min(axis=1)))
+        if lam[c].min() < -tol:
+            raise ValueError(f"point ({p[0]:.3f}, {p[1]:.3f}) is outside the mesh")
+        cell_index[i] = c
+        barycentric[i] = lam[c]
+    return cell_index, barycentric
+
+
+def probe_matrix(coords, cells, points, columns=None):
+    """
+    Sparse evaluation operator of a P1 field: values(points) = P @ u.
+
+    Args:
+        columns (np.ndarray): optional vertex -> dof map (FEniCS: vertex_to_dof_map),
+                              otherwise u is indexed by vertex.
+
+    Returns:
+        scipy.sparse.csr_matrix: shape (n_points, n_vertices).
+    """
+    cells = np.asarray(cells)
+    cell_index, barycentric = locate_points(coords, cells, points)
+
+    cols = cells[cell_index]
+    if columns is not None:
+        cols = np.asarray(columns)[cols]
+    rows = np.repeat(np.arange(len(cell_index)), 3)
+    return csr_matrix((barycentric.ravel(), (rows, cols.ravel())),
+                      shape=(len(cell_index), len(coords)))
+
+
+def ews_probe_matrix(coords, cells, locations, r_EWS, symmetry=(False, False), columns=None):
+    """
+    BHE temperatures as one sparse operator: mean of the four points on the
+    borehole radius, points outside a symmetry-reduced domain are mirrored
+    back into it (same as the point evaluation of the FEniCS engine).
+
+    Returns:
+        scipy.sparse.csr_matrix: shape (n_locations, n_vertices).
+    """
+    x_symmetric, y_symmetric = symmetry
+    points = []
+    for loc in locations:
+        x = loc.x()
+        y = loc.y()
+        for p_x, p_y in [(x - r_EWS, y), (x + r_EWS, y), (x, y - r_EWS), (x, y + r_EWS)]:
+            points.append((abs(p_x) if x_symmetric else p_x,
+                           abs(p_y) if y_symmetric else p_y))
+
+    P = probe_matrix(coords, cells, points, columns=columns)
+    averaging = kron(identity(len(locations)), np.full((1, 4), 0.25))
+    return csr_matrix(averaging @ P)
@@ -0,0 +1,176 @@
+'''Content-addressed store of simulation runs: results/runs/<key>/ with a readable alias.'''
+
+import glob
+import hashlib
+import json
+import os
+import time
+from os import path
+
+from src.simulation.utils.paths import BASE_DIR
+
+CODE_DIR = path.abspath(path.join(path.dirname(path.abspath(__file__)), '..'))
+
+# output options without influence on the content of the result file
+IGNORED_OUTPUT_KEYS = ("asyncWriter", "queueSize", "batchSize")
+
+# blocks that do not enter a single run (layout search, catalog, dry run)
+IGNORED_BLOCKS = ("optimization", "catalog", "estimate")
+
+# engine-specific blocks, used only by their engine
+ENGINE_BLOCKS = {"harmonic": "harmonic"}
+
+
+def _file_hash(file_name, h=None):
+    h = h or hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h
+
+
+def code_version():
+    """Hash of the simulation sources (works without git, e.g. in the Docker image)."""
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(CODE_DIR):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            if name.endswith(".py"):
+                file_name = path.join(root, name)
+                h.update(path.relpath(file_name, CODE_DIR).encode())
+                _file_hash(file_name, h)
+    return h.hexdigest()[:12]
+
+
+def input_files(params_si):
+    """
+    Files read by the run, by input name: the load file, the load files of
+    the ensemble scenarios and the velocity file of the flow series.
+    """
+    files = {}
+    load = params_si.get("load", {})
+    if load.get("source", "sinusoidal") != "sinusoidal" and load.get("path"):
+        files["load"] = load.path
+    ensemble = params_si.get("ensemble", {})
+    if ensemble.get("enabled", False):
+        for k, scenario in enumerate(ensemble.get("scenarios", [])):
+            scenario_load = {**load, **scenario.get("load", {})}
+            if scenario_load.get("source", "sinusoidal") != "sinusoidal" and scenario_load.get("path"):
+                files[f"ensemble.{scenario.get('name', f'scenario_{k}')}"] = scenario_load["path"]
+    flow = params_si.get("flowSeries", {})
+    if flow.get("enabled", False) and flow.get("source", "seasonal") in ("csv", "hdf5") and flow.get("path"):
+        files["flowSeries"] = flow.path
+    return files
+
+
+def normalized_parameters(params_si, base_dir=BASE_DIR):
+    """
+    SI parameters without result-neutral output options, blocks outside the
+    run and disabled mode blocks ("enabled": false); referenced input files
+    (see input_files) are represented by the hash of their content.
+    """
+    parameters = params_si.to_dict()
+    engine = parameters.get("engine", "fem")
+    parameters = {key: value for key, value in parameters.items()
+                  if key not in IGNORED_BLOCKS and ENGINE_BLOCKS.get(key, engine) == engine and
+                  not (isinstance(value, dict) and value.get("enabled", True) is False)}
+    if "output" in parameters:
+        parameters["output"] = {key: value for key, value in parameters["output"].items()
+                                if key not in IGNORED_OUTPUT_KEYS}
+
+    files = input_files(params_si)
+    if files:
+        parameters["inputFileHashes"] = {name: _file_hash(path.join(base_dir, file_name)).hexdigest()
+                                         for name, file_name in files.items()}
+    return parameters
+
+
+def run_key(params_si, base_dir=BASE_DIR):
+    """Key of a run: hash of the normalized SI parameters and the code version."""
+    content = json.dumps({"parameters": normalized_parameters(params_si, base_dir),
+                          "code": code_version()},
+                         sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+class RunStore:
+    """
+    Runs are stored in <results>/runs/<key>/ together with run.json
+    (alias, parameters, state). The alias <results>/<alias> is a symbolic
+    link to the latest run with this name.
+    """
+
+    def __init__(self, results_dir):
+        self.results_dir = results_dir
+        self.root = path.join(results_dir, "runs")
+
+    def run_dir(self, key):
+        return path.join(self.root, key)
+
+    def _read(self, key):
+        meta_file = path.join(self.run_dir(key), "run.json")
+        if not path.exists(meta_file):
+            return None
+        with open(meta_file, "r") as f:
+            return json.load(f)
+
+    def _write(self, key, meta):
+        with open(path.join(self.run_dir(key), "run.json"), "w") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    def lookup(self, key):
+        """HDF5 result of a completed run with this key, otherwise None."""
+        meta = self._read(key)
+        if not meta or not meta.get("complete", False):
+            return None
+        files = sorted(glob.glob(path.join(self.run_dir(key), "*.h5")))
+        return files[0] if files else None
+
+    def start(self, key, alias, params_si):
+        """Creates (or resets) the run directory and returns it."""
+        run_dir = self.run_dir(key)
+        os.makedirs(run_dir, exist_ok=True)
+        self._write(key, {
+            "key": key,
+            "alias": alias,
+            "code": code_version(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "complete": False,
+            "parameters": params_si.to_dict()
+        })
+        return run_dir
+
+    def finish(self, key, runtime=None):
+        """Marks the run as complete, links the alias and returns run.json."""
+        meta = self._read(key)
+        meta["complete"] = True
+        meta["runtime"] = runtime
+        meta["finished"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._write(key, meta)
+        self.link_alias(key, meta["alias"])
+        return meta
+
+    def fail(self, key, record):
+        """Marks the run as failed (it is not reused, the alias is not linked)."""
+        meta = self._read(key)
+        meta["complete"] = False
+        meta["failure"] = record
+        self._write(key, meta)
+
+    def completed(self):
+        """(key, run.json) of all completed runs."""
+        if not path.isdir(self.root):
+            return
+        for key in sorted(os.listdir(self.root)):
+            meta = self._read(key)
+            if meta and meta.get("complete", False):
+                yield key, meta
+
+    def link_alias(self, key, alias):
+        link = path.join(self.results_dir, alias)
+        if path.lexists(link) and not path.islink(link):
+            print(f"Alias {link} exists as a directory, not linked to run {key}")
+            return
+        if path.islink(link):
+            os.remove(link)
+        os.symlink(path.relpath(self.run_dir(key), self.results_dir), link)
@@ -1,3 +1,5 @@
+import numpy as np
+
 # from dataclasses import dataclass, field
 
 # TODO: Remove unused code
@@ -83,6 +85,38 @@ def weighted_parameter(model, ground_parameter, fluid_parameter, porosity):
     return lamb_eff, rho_c_eff
 
 
+def effective_parameters(params_si):
+    """
+    Effektive Bodenparameter aus der SI-Parameterdatei.
+
+    Returns:
+        tuple: (λ_eff in W/(m·K), (ρc)_eff in J/(m³·K),
+                Konvektionskoeffizient b = n (ρc)_w / (ρc)_g)
+    """
+    if params_si.ground.porosity.value != 0.0:
+        thermalConductivity, heatCapacityDensity = weighted_parameter(
+            model=params_si.ground.modelType.value,
+            ground_parameter=[
+                params_si.ground.thermalConductivity.value,
+                params_si.ground.heatCapacityDensity.value
+            ],
+            fluid_parameter=[
+                params_si.groundwater.thermalConductivity.value,
+                params_si.groundwater.density.value * params_si.groundwater.specificHeat.value
+            ],
+            porosity=params_si.ground.porosity.value
+        )
+    else:
+        thermalConductivity = params_si.ground.thermalConductivity.value
+        heatCapacityDensity = params_si.ground.heatCapacityDensity.value
+
+    # b = n_porosity * (ρc)_groundwater / (ρc)_ground
+    convectionCoefficient = params_si.ground.porosity.value * params_si.groundwater.density.value * \
+        params_si.groundwater.specificHeat.value / params_si.ground.heatCapacityDensity.value
+
+    return thermalConductivity, heatCapacityDensity, convectionCoefficient
+
+
 def P_el_values(Q: float, T: float, T_H: float, delta_t: float, gamma: float):
     """
     Berechnet den COP-Wert basierend auf der übergebenen Wärmeleistung, Temperatur und Zieltemperatur.
@@ -115,3 +149,19 @@ def P_el_values(Q: float, T: float, T_H: float, delta_t: float, gamma: float):
     except RuntimeWarning as e:
         print(f"COP-Error: {e}")
         return 0  # Rückgabe von 0 bei Fehlern ?????
+
+
+def P_el_array(Q, T, T_H: float, delta_t: float, gamma: float):
+    """
+    Vektorisierte Variante von P_el_values für ganze Zeitreihen/Felder.
+
+    Args:
+        Q (np.ndarray): Wärmeleistung in W/m (broadcastfähig zu T).
+        T (np.ndarray): Temperaturen an den Bohrungen.
+
+    Returns:
+        np.ndarray: W_el in Wh/m, 0 für nicht valide Eingaben.
+    """
+    Q, T = np.broadcast_arrays(np.asarray(Q, dtype=float), np.asarray(T, dtype=float))
+    valid = (Q < 0) & (T < T_H)
+    return np.where(valid, Q * delta_t * (1 - T / T_H) / gamma / 3600, 0.0)
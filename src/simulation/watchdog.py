@@ -0,0 +1,98 @@
+import json
+import time
+from os import path
+
+import numpy as np
+
+
+class SimulationAborted(Exception):
+    """A run was stopped because a health check failed (see Watchdog)."""
+
+    def __init__(self, reason, message, step=None, details=None):
+        super().__init__(message)
+        self.reason = reason
+        self.step = step
+        self.details = details or {}
+
+    def record(self):
+        return {"reason": self.reason, "message": str(self), "step": self.step,
+                "details": self.details, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+class Watchdog:
+    """
+    Health checks in the time loop, configured in the "watchdog" block:
+
+        maxRelativeError   Σ|energy-balance error| / Σ(|E_probe| + |E_flux| + |ΔE|)
+                           after `warmupSteps` steps (absolute per step, so
+                           drift of alternating sign does not cancel)
+        temperatureMin/Max bounds of the BHE temperatures (K after SI conversion)
+        checkNaN           non-finite values in the state or the BHE temperatures
+
+    A breach raises SimulationAborted; the engines close the writer in
+    their finally blocks, so the steps up to the breach are kept.
+
+    With `per_block` every check covers a block of steps (parareal slices,
+    year blocks): `warmupSteps` then counts blocks and defaults to 0.
+    """
+
+    def __init__(self, params_si, per_block=False):
+        watchdog = params_si.get("watchdog", {})
+        self.enabled = watchdog.get("enabled", False)
+        self.max_relative_error = watchdog.get("maxRelativeError", None)
+        self.temperature_min = watchdog.get("temperatureMin", {}).get("value", None)
+        self.temperature_max = watchdog.get("temperatureMax", {}).get("value", None)
+        self.check_nan = watchdog.get("checkNaN", True)
+        self.warmup_steps = int(watchdog.get("warmupSteps", 0 if per_block else 10))
+        self.n_steps = 0
+        self.error_sum = 0.0
+        self.reference_sum = 0.0
+
+    def check(self, time_step, T=None, Temp_EWS=None, error=None, reference=None):
+        """
+        Args:
+            T (np.ndarray): state vector(s).
+            Temp_EWS (np.ndarray): BHE temperatures of the step(s).
+            error, reference (float | np.ndarray): energy-balance error and the sum of
+                the absolute energy terms of the step, per scenario if arrays. For a
+                block of steps both are sums of absolute values over the block.
+        """
+        if not self.enabled:
+            return
+        self.n_steps += 1
+
+        if self.check_nan:
+            for name, values in (("T", T), ("Temp_EWS", Temp_EWS)):
+                if values is not None and not np.all(np.isfinite(values)):
+                    raise SimulationAborted(
+                        "nan", f"non-finite values in {name} at step {time_step}", time_step)
+
+        if Temp_EWS is not None and Temp_EWS.size:
+            T_min, T_max = float(np.nanmin(Temp_EWS)), float(np.nanmax(Temp_EWS))
+            if self.temperature_min is not None and T_min < self.temperature_min:
+                raise SimulationAborted(
+                    "temperature", f"BHE temperature {T_min:.2f} K below {self.temperature_min:.2f} K "
+                    f"at step {time_step}", time_step, {"Temp_EWS_min": T_min})
+            if self.temperature_max is not None and T_max > self.temperature_max:
+                raise SimulationAborted(
+                    "temperature", f"BHE temperature {T_max:.2f} K above {self.temperature_max:.2f} K "
+                    f"at step {time_step}", time_step, {"Temp_EWS_max": T_max})
+
+        if self.max_relative_error is not None and error is not None and reference is not None:
+            self.error_sum = self.error_sum + np.abs(np.asarray(error, dtype=float))
+            self.reference_sum = self.reference_sum + np.asarray(reference, dtype=float)
+            if self.n_steps > self.warmup_steps:
+                relative = self.error_sum / np.maximum(self.reference_sum, 1e-300)
+                if np.any(relative > self.max_relative_error):
+                    raise SimulationAborted(
+                        "energy_balance", f"relative energy-balance error {float(np.max(relative)):.3g} "
+                        f"above {self.max_relative_error:g} at step {time_step}", time_step,
+                        {"relative_error": float(np.max(relative))})
+
+
+def write_failure(folder, aborted):
+    """Writes the failure record failure.json next to the partial result."""
+    file_name = path.join(folder, "failure.json")
+    with open(file_name, "w") as f:
+        json.dump(aborted.record(), f, indent=2, ensure_ascii=False)
+    return file_name
@@ -0,0 +1,135 @@
+import json
+from os import makedirs, path
+from typing import Optional, Sequence
+
+import matplotlib.pyplot as plt
+import numpy as np
+from h5py import File
+
+# per-BHE datasets, all other names are looked up in timeseries/
+PER_EWS = {"Temp_EWS": "per_ews/Temp_EWS_values", "W_el": "per_ews/W_el_values"}
+
+LABELS = {"Temp_EWS": "Temperature (°C)", "W_el": "W_el (Wh/m)"}
+
+
+def minmax_envelope(dataset, n_bins, columns=None, chunk_rows=1 << 16):
+    """
+    Min/max envelope of a time series dataset on `n_bins` bins along the time
+    axis, read in chunks of about `chunk_rows` rows (whole bins per chunk).
+
+    Args:
+        dataset: h5py dataset (n_steps, ...); trailing axes are flattened to columns.
+        columns (Sequence[int]): selected columns, None: envelope over all columns.
+
+    Returns:
+        tuple: (bin edges (n_bins + 1,) as row indices, min, max with shape
+                (n_bins, n_columns) or (n_bins, 1) without column selection)
+    """
+    n_steps = dataset.shape[0]
+    n_bins = max(1, min(n_bins, n_steps))
+    edges = np.linspace(0, n_steps, n_bins + 1).astype(np.int64)
+    bins_per_chunk = max(1, int(chunk_rows * n_bins // max(n_steps, 1)))
+
+    lower, upper = [], []
+    for first_bin in range(0, n_bins, bins_per_chunk):
+        last_bin = min(first_bin + bins_per_chunk, n_bins)
+        first, last = edges[first_bin], edges[last_bin]
+        block = np.asarray(dataset[first:last], dtype=float).reshape(last - first, -1)
+        if columns is not None:
+            block = block[:, columns]
+        starts = edges[first_bin:last_bin] - first
+        lo = np.minimum.reduceat(block, starts, axis=0)
+        hi = np.maximum.reduceat(block, starts, axis=0)
+        if columns is None:
+            lo, hi = lo.min(axis=1, keepdims=True), hi.max(axis=1, keepdims=True)
+        lower.append(lo)
+        upper.append(hi)
+    return edges, np.vstack(lower), np.vstack(upper)
+
+
+def plot_series(
+    h5_paths: Sequence[str],
+    series: Sequence[str] = ("Temp_EWS",),
+    ews: Optional[Sequence[int]] = None,
+    width: int = 1200,
+    out_path: str = "results/plots_svg/series.svg",
+    dpi: int = 200,
+    alpha: float = 0.35,
+):
+    """
+    Time series of one or more result files, decimated to `width` bins with a
+    min/max envelope (peaks and dips of every bin are preserved).
+
+    - one subplot per series, shared time axis in years
+    - all files and the selected BHEs in the same axes; without `ews` one band
+      over all BHEs per file
+    - Temp_EWS in °C
+
+    Returns: path of the saved figure.
+    """
+    if width <= 0:
+        raise ValueError("width muss > 0 sein.")
+
+    fig, axes = plt.subplots(len(series), 1, figsize=(10, 3 * len(series)), sharex=True,
+                             squeeze=False)
+    colors = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+    color_index = 0
+
+    for h5_path in h5_paths:
+        run = path.basename(path.dirname(path.abspath(h5_path)))
+        n_colors = 1
+        with File(h5_path, "r") as h5:
+            days = h5["timeseries/days"][...]
+            if days.shape[0] == 0:
+                raise ValueError(f"{h5_path} enthält keine Zeitreihen (output.raw = false)")
+            scenarios = json.loads(h5.attrs["scenarios"]) if "scenarios" in h5.attrs else None
+
+            for ax, name in zip(axes[:, 0], series):
+                dataset = h5[PER_EWS.get(name, f"timeseries/{name}")]
+                per_ews = name in PER_EWS
+                n_ews = dataset.shape[-1] if per_ews else 1
+
+                columns = None
+                labels = [f"{run}" + (" (all BHEs)" if per_ews else "")]
+                if per_ews and ews is not None:
+                    columns = [k * n_ews + i for k in range(len(scenarios or [None])) for i in ews]
+                    labels = [f"{run} BHE {i}" + (f" [{scenario}]" if scenarios else "")
+                              for scenario in scenarios or [None] for i in ews]
+                elif scenarios is not None:
+                    # one envelope per scenario
+                    columns = list(range(len(scenarios) * n_ews))
+                    labels = [f"{run} [{scenario}]" + (" (all BHEs)" if per_ews else "")
+                              for scenario in scenarios]
+
+                edges, lower, upper = minmax_envelope(dataset, width, columns)
+                if per_ews and ews is None and scenarios is not None:
+                    lower = lower.reshape(len(lower), len(scenarios), n_ews).min(axis=2)
+                    upper = upper.reshape(len(upper), len(scenarios), n_ews).max(axis=2)
+                offset = 273.15 if name == "Temp_EWS" else 0.0
+
+                # time axis: end of the first and last step of every bin
+                t = np.column_stack([days[edges[:-1]], days[edges[1:] - 1]]).ravel() / 365.0
+
+                for j, label in enumerate(labels):
+                    color = colors[(color_index + j) % len(colors)]
+                    lo = np.repeat(lower[:, j] - offset, 2)
+                    hi = np.repeat(upper[:, j] - offset, 2)
+                    ax.fill_between(t, lo, hi, color=color, alpha=alpha, linewidth=0, label=label)
+                    ax.plot(t, lo, color=color, linewidth=0.4)
+                    ax.plot(t, hi, color=color, linewidth=0.4)
+                n_colors = max(n_colors, len(labels))
+        color_index += n_colors
+
+    for ax, name in zip(axes[:, 0], series):
+        ax.set_ylabel(LABELS.get(name, name))
+        ax.grid(True, linewidth=0.3)
+        ax.legend(fontsize=7, loc="best")
+    axes[-1, 0].set_xlabel("Time (years)")
+    fig.tight_layout()
+
+    makedirs(path.dirname(out_path) or ".", exist_ok=True)
+    ext = path.splitext(out_path)[1].lstrip(".") or "svg"
+    fig.savefig(out_path, format=ext, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    print(f"--> Gespeichert: {out_path}")
+    return out_path